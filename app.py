@@ -1,8 +1,20 @@
 # Complete SDS Assistant with Cloud Storage and Fixed Buttons
 import os
-from flask import Flask, render_template_string, request, jsonify, send_file, session
+import atexit
+import bisect
+import contextlib
+import contextvars
+import functools
+import itertools
+import random
+import secrets
+import threading
+import time
+from flask import Flask, Response, render_template_string, request, jsonify, send_file, session, stream_with_context
+from flask_socketio import SocketIO, join_room, leave_room, rooms
 import sqlite3
 import hashlib
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
@@ -12,22 +24,121 @@ from werkzeug.utils import secure_filename
 import requests
 import re
 import json
+import base64
+import zlib
+import gzip
 import boto3
+import numpy as np
+try:
+    import brotli
+except ImportError:
+    brotli = None
 from botocore.exceptions import ClientError
+from eventlet import patcher, tpool
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sds-assistant-secret-key-2024')
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 
+# Real-time dashboard and upload progress. With more than one worker, set
+# SOCKETIO_MESSAGE_QUEUE (e.g. a Redis URL) so events reach clients on every worker
+socketio = SocketIO(app, message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
+
 # AWS S3 Configuration
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME', 'sds-documents-bucket')
 
+# Blocking work offload: sqlite3, PyPDF2 and the regex passes never yield to the
+# eventlet hub, so they run in native threads with a per-category concurrency cap
+OFFLOAD_ENABLED = os.environ.get('SDS_OFFLOAD', '1') != '0'
+OFFLOAD_LIMITS = {
+    'db': int(os.environ.get('SDS_DB_CONCURRENCY', 4)),
+    'cpu': int(os.environ.get('SDS_CPU_CONCURRENCY', 2)),
+}
+
+# SQLite is shared by every gunicorn worker: WAL lets readers run alongside the
+# single writer, and the busy timeout makes writers queue instead of failing
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('SDS_DB_BUSY_TIMEOUT_MS', 10000))
+
+# Schema migrations (PRAGMA user_version) backfill existing rows this many documents per
+# transaction, pausing between batches so other writers get the lock; ANALYZE afterwards
+# samples this many index rows, keeping it to seconds on multi-GB databases
+MIGRATION_BATCH_SIZE = int(os.environ.get('SDS_MIGRATION_BATCH', 200))
+MIGRATION_BATCH_PAUSE = int(os.environ.get('SDS_MIGRATION_PAUSE_MS', 20)) / 1000
+MIGRATION_ANALYSIS_LIMIT = 1000
+
+# Answered questions are queued and written to qa_history by a background thread,
+# in one transaction per batch; a full queue drops rows rather than growing (0 writes inline)
+QA_LOG_QUEUE_SIZE = int(os.environ.get('SDS_QA_LOG_QUEUE', 10000))
+QA_LOG_FLUSH_SECONDS = int(os.environ.get('SDS_QA_LOG_FLUSH_MS', 250)) / 1000
+QA_LOG_BATCH_SIZE = 500
+
+# The same writer rolls qa_history up into daily per-question counts every SDS_QA_ROLLUP_SECONDS,
+# then prunes rolled-up rows older than SDS_QA_RETENTION_DAYS (0 keeps them), first appending
+# them to gzipped JSON lines in SDS_QA_ARCHIVE_DIR if that is set
+QA_ROLLUP_SECONDS = int(os.environ.get('SDS_QA_ROLLUP_SECONDS', 300))
+QA_RETENTION_DAYS = int(os.environ.get('SDS_QA_RETENTION_DAYS', 90))
+QA_ARCHIVE_DIR = os.environ.get('SDS_QA_ARCHIVE_DIR')
+QA_ROLLUP_BATCH = 5000
+
+# Dashboard aggregates are recomputed at most this often per worker; in between,
+# uploads and questions are applied to the cached snapshot as deltas
+DASHBOARD_CACHE_SECONDS = int(os.environ.get('SDS_DASHBOARD_CACHE_SECONDS', 30))
+
+# Metrics are kept per process; with several workers, point SDS_METRICS_DIR at a
+# shared directory so /metrics on any worker reports the sum over all of them
+METRICS_DIR = os.environ.get('SDS_METRICS_DIR')
+METRICS_PERSIST_SECONDS = float(os.environ.get('SDS_METRICS_PERSIST_SECONDS', 10))
+
+# Opt-in SQL tracing: per-statement totals at /debug/sql and a slow-query log
+SQL_TRACE_ENABLED = os.environ.get('SDS_SQL_TRACE', '0') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SDS_SLOW_QUERY_MS', 100))
+SLOW_QUERY_EXPLAIN = os.environ.get('SDS_SLOW_QUERY_EXPLAIN', '0') == '1'
+DEBUG_TOKEN = os.environ.get('SDS_DEBUG_TOKEN')
+
+# JSON responses at least this large are gzip/brotli compressed for clients that accept it (0 disables)
+COMPRESS_MIN_BYTES = int(os.environ.get('SDS_COMPRESS_MIN_BYTES', 1024))
+# Levels for per-response compression; precompiled assets use the maximum
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Per-request stage timings: a Server-Timing header, and JSON trace logs for a sample of requests
+SERVER_TIMING_ENABLED = os.environ.get('SDS_SERVER_TIMING', '1') != '0'
+TRACE_SAMPLE_RATE = float(os.environ.get('SDS_TRACE_SAMPLE_RATE', 0))
+
+# Retrieval engine used to find candidate documents for a question (see RETRIEVAL_ENGINES)
+RETRIEVAL_ENGINE = os.environ.get('SDS_RETRIEVAL', 'like')
+SEARCH_RESULT_LIMIT = 10
+
+# Local passage embeddings (hashed word, bigram and character trigram features)
+# for the vector engine; maintained on upload when enabled or when it is the engine
+VECTOR_DIM = int(os.environ.get('SDS_VECTOR_DIM', 64))
+VECTOR_DIR = os.environ.get('SDS_VECTOR_DIR', 'data/vectors')
+VECTOR_INDEX_ENABLED = os.environ.get('SDS_VECTOR_INDEX', '0') == '1' or RETRIEVAL_ENGINE == 'vector'
+PASSAGE_WORDS = 80
+PASSAGE_OVERLAP = 20
+
+# Documents whose sentence layout is kept for answer extraction (see SentenceIndex)
+SENTENCE_INDEX_CACHE_SIZE = int(os.environ.get('SDS_SENTENCE_CACHE', 64))
+
+# JSON file with extra keywords for the question, section and hazard phrase tables (see KEYWORD_TABLES)
+KEYWORDS_FILE = os.environ.get('SDS_KEYWORDS_FILE')
+
+# Offline bundles: documents per sync response, and the terms their search index holds
+# (whole CAS numbers, otherwise words of three or more characters; the page tokenizes the same way)
+OFFLINE_BUNDLE_BATCH = int(os.environ.get('SDS_OFFLINE_BATCH', 200))
+OFFLINE_TERM = re.compile(r"\d{2,7}-\d{2}-\d|[a-z0-9]{3,}")
+
 # Create necessary directories
-for folder in ['static/uploads', 'static/stickers', 'static/exports', 'data']:
+for folder in ['static/uploads', 'static/exports', 'data']:
     Path(folder).mkdir(parents=True, exist_ok=True)
 
 # US Cities Data (simplified for space)
@@ -82,6 +193,1103 @@ US_CITIES_DATA = {
     "Wyoming": ["Cheyenne", "Casper", "Laramie"]
 }
 
+NO_DOCUMENTS_ANSWER = "I couldn't find any relevant SDS documents to answer your question. Please upload relevant SDS files first."
+
+# Answers quote at most this many products
+ANSWER_PARTS_SHOWN = 3
+
+# Upload stage (metric label) -> stage name sent to the uploading client in upload_progress events
+UPLOAD_PROGRESS_STAGES = {"hash": "hashing", "store": "storing", "extract": "extracting", "parse": "parsing", "insert": "saving"}
+
+# Follow-up questions reuse the documents the same session last retrieved; at most this many
+# sessions are kept, each dropped after this long without a question. However often a session
+# follows up, documents retrieved longer ago than the max age are searched for again
+SESSION_CONTEXT_SIZE = int(os.environ.get('SDS_SESSION_CONTEXT_SIZE', 1000))
+SESSION_CONTEXT_IDLE_SECONDS = int(os.environ.get('SDS_SESSION_CONTEXT_IDLE_SECONDS', 900))
+SESSION_CONTEXT_MAX_AGE_SECONDS = int(os.environ.get('SDS_SESSION_CONTEXT_MAX_AGE_SECONDS', 300))
+
+# /api/ask-batch: checklist questions and matching documents per request, and documents read per query
+CHECKLIST_MAX_QUESTIONS = 20
+CHECKLIST_MAX_DOCUMENTS = 1000
+CHECKLIST_PAGE_SIZE = 25
+
+class BlockingWorkPool:
+    """Run blocking calls in eventlet's native thread pool, bounded per category"""
+
+    def __init__(self, limits: Dict[str, int], enabled: bool = True):
+        self.limits = dict(limits)
+        self.enabled = enabled
+        self.semaphores = {category: threading.BoundedSemaphore(limit) for category, limit in limits.items()}
+        self.waiting = {category: 0 for category in limits}
+        self.in_flight = {category: 0 for category in limits}
+        # Real (not green) thread-local: the category of the offloaded work running on this thread
+        self._local = patcher.original('threading').local()
+
+    def offloading(self) -> bool:
+        """True when running under a monkey-patched eventlet hub"""
+        return self.enabled and patcher.is_monkey_patched('thread')
+
+    def run(self, category: str, fn, *args, **kwargs):
+        """Call fn in a native thread, waiting for a free slot in its category"""
+        held = getattr(self._local, 'category', None)
+        if held == category:
+            # Nested call from work that already holds a slot in this category
+            return fn(*args, **kwargs)
+        if held is not None:
+            # The slots are green semaphores: waiting on one from a native thread would block the
+            # hub, and releasing one there never wakes the green threads queued on it
+            raise RuntimeError(f"{category} work called from {held} work; run it as a step of its own")
+        
+        semaphore = self.semaphores[category]
+        self.waiting[category] += 1
+        wait_start = time.perf_counter()
+        semaphore.acquire()
+        record_span(f"{category}-wait", wait_start, time.perf_counter())
+        self.waiting[category] -= 1
+        self.in_flight[category] += 1
+        try:
+            if self.offloading():
+                # Carry the request's trace (and other context) into the native thread
+                context = contextvars.copy_context()
+                return tpool.execute(context.run, self._call, category, fn, args, kwargs)
+            return self._call(category, fn, args, kwargs)
+        finally:
+            self.in_flight[category] -= 1
+            semaphore.release()
+    
+    def _call(self, category, fn, args, kwargs):
+        self._local.category = category
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.category = None
+
+class RequestTrace:
+    """Stage timings collected while serving one request"""
+
+    # Individual spans kept for trace logs; totals are always complete
+    MAX_SPANS = 200
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.totals = {}
+        self.spans = []
+    
+    def add(self, name: str, start: float, end: float):
+        total = self.totals.get(name)
+        if total is None:
+            total = self.totals[name] = [0.0, 0]
+        total[0] += end - start
+        total[1] += 1
+        if len(self.spans) < self.MAX_SPANS:
+            self.spans.append((name, start - self.start, end - start))
+    
+    def server_timing(self) -> str:
+        """Server-Timing header value: one entry per span name, plus the total"""
+        entries = [f'{name};dur={seconds * 1000:.2f};desc="{count}x"' for name, (seconds, count) in self.totals.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(entries)
+    
+    def to_log(self) -> Dict:
+        return {
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "totals_ms": {name: round(seconds * 1000, 2) for name, (seconds, _) in self.totals.items()},
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                for name, offset, duration in self.spans
+            ]
+        }
+
+current_trace = contextvars.ContextVar('sds_request_trace', default=None)
+
+def record_span(name: str, start: float, end: float):
+    """Add a span to the current request's trace, if there is one"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, start, end)
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time a block as a span of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.perf_counter())
+
+def traced(name: str):
+    """Decorator timing every call of a function as a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+work_pool = BlockingWorkPool(OFFLOAD_LIMITS, enabled=OFFLOAD_ENABLED)
+
+def offloaded(category: str):
+    """Decorator routing a method through the blocking work pool"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            return work_pool.run(category, method, *args, **kwargs)
+        return wrapper
+    return decorator
+
+class MetricsRegistry:
+    """Prometheus-style counters and histograms, cheap enough to record on every request"""
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        self.snapshot_dir = snapshot_dir
+        self.descriptions = {}
+        self.buckets = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauge_callbacks = []
+        self.last_persist = 0.0
+        # Recorded from both green threads and native pool threads
+        self._lock = patcher.original('threading').Lock()
+        if snapshot_dir:
+            Path(snapshot_dir).mkdir(parents=True, exist_ok=True)
+    
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[List[float]] = None):
+        """Declare a metric's type, help text and (for histograms) bucket bounds"""
+        self.descriptions[name] = (kind, help_text)
+        if buckets:
+            self.buckets[name] = list(buckets)
+    
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        bounds = self.buckets[name]
+        index = bisect.bisect_left(bounds, value)
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                series = self.histograms[key] = [0] * (len(bounds) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+    
+    def add_gauge_callback(self, callback):
+        """Register a callable returning [(name, labels dict, value)] at scrape time"""
+        self.gauge_callbacks.append(callback)
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()]
+            }
+    
+    def maybe_persist(self):
+        """Write this process's snapshot for other workers to merge, at most every few seconds"""
+        if not self.snapshot_dir or time.time() - self.last_persist < METRICS_PERSIST_SECONDS:
+            return
+        self.last_persist = time.time()
+        try:
+            path = Path(self.snapshot_dir) / f"{os.getpid()}.json"
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.snapshot()))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to persist metrics: {e}")
+    
+    def merged(self) -> tuple:
+        """Counters and histograms of this process plus persisted snapshots of the others"""
+        snapshots = [self.snapshot()]
+        if self.snapshot_dir:
+            for path in Path(self.snapshot_dir).glob('*.json'):
+                if path.stem == str(os.getpid()):
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+        
+        counters = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, series in snapshot["histograms"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], series)]
+                else:
+                    histograms[key] = list(series)
+        return counters, histograms
+    
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        self.maybe_persist()
+        counters, histograms = self.merged()
+        
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+        
+        gauges = {}
+        for callback in self.gauge_callbacks:
+            for name, labels, value in callback():
+                gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        
+        lines = []
+        for name, (kind, help_text) in self.descriptions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+            elif kind == "gauge":
+                for labels, value in gauges.get(name, []):
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            else:
+                bounds = self.buckets[name]
+                for (series_name, labels), series in sorted(histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(bounds + [float('inf')], series):
+                        cumulative += count
+                        le = "+Inf" if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{format_labels(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {series[-2]}")
+                    lines.append(f"{name}_count{format_labels(labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+SQL_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+
+metrics = MetricsRegistry(METRICS_DIR)
+metrics.describe('sds_http_request_duration_seconds', 'histogram', 'Time to produce a response, by route', LATENCY_BUCKETS)
+metrics.describe('sds_upload_stage_duration_seconds', 'histogram', 'Time spent in each upload stage', LATENCY_BUCKETS)
+metrics.describe('sds_sql_query_duration_seconds', 'histogram', 'SQL statement execution time (to first row), by statement type', SQL_BUCKETS)
+metrics.describe('sds_sql_fetch_seconds_total', 'counter', 'Time spent fetching result rows, by statement type')
+metrics.describe('sds_cache_requests_total', 'counter', 'Cache lookups by cache and result (hit or miss)')
+metrics.describe('sds_compression_bytes_total', 'counter', 'JSON response bytes before (stage=in) and after (stage=out) compression, by encoding')
+metrics.describe('sds_qa_log_rows_total', 'counter', 'Q&A history rows by outcome: written, dropped (queue full) or failed (write error)')
+metrics.describe('sds_qa_rollup_rows_total', 'counter', 'Q&A history rows rolled up into daily stats (action=rolled_up) or pruned after it (action=pruned)')
+metrics.describe('sds_qa_log_batch_size', 'histogram', 'Q&A history rows written per transaction', [1, 5, 10, 50, 100, 500])
+metrics.describe('sds_pdf_pages_total', 'counter', 'PDF pages parsed')
+metrics.describe('sds_pdf_extract_seconds_total', 'counter', 'Time spent extracting PDF text; pages per second is the ratio of the two rates')
+metrics.describe('sds_work_pool_waiting', 'gauge', 'Calls queued for a blocking work pool slot')
+metrics.describe('sds_work_pool_in_flight', 'gauge', 'Calls running in the blocking work pool')
+metrics.describe('sds_qa_log_queue_depth', 'gauge', 'Q&A history rows waiting for the background writer')
+metrics.describe('sds_work_pool_limit', 'gauge', 'Blocking work pool concurrency limit')
+
+def work_pool_gauges():
+    gauges = []
+    for category, limit in work_pool.limits.items():
+        labels = {"category": category, "pid": str(os.getpid())}
+        gauges.append(('sds_work_pool_waiting', labels, work_pool.waiting[category]))
+        gauges.append(('sds_work_pool_in_flight', labels, work_pool.in_flight[category]))
+        gauges.append(('sds_work_pool_limit', labels, limit))
+    return gauges
+
+metrics.add_gauge_callback(work_pool_gauges)
+
+_sql_operations = {}
+
+def sql_operation(sql: str) -> str:
+    """Statement type (SELECT, INSERT, ...) used as a low-cardinality metric label"""
+    operation = _sql_operations.get(sql)
+    if operation is None:
+        words = sql.split(None, 1)
+        operation = _sql_operations[sql] = words[0].upper() if words else "EMPTY"
+    return operation
+
+def encode_cursor(key: tuple) -> str:
+    """Opaque page cursor from the sort key of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, length: int) -> Optional[list]:
+    """The sort key in a page cursor, or None if it is not one of ours"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    return key if isinstance(key, list) and len(key) == length else None
+
+class SQLTracer:
+    """Per-statement SQL statistics and a slow-query log, enabled with SDS_SQL_TRACE=1"""
+
+    # Distinct statements kept; anything beyond is folded into one bucket
+    MAX_STATEMENTS = 500
+    
+    def __init__(self, enabled: bool, slow_ms: float, explain_slow: bool = False):
+        self.enabled = enabled
+        self.slow_seconds = slow_ms / 1000
+        self.explain_slow = explain_slow
+        self.db_path = None
+        self.stats = {}
+        self._normalized = {}
+        self._lock = patcher.original('threading').Lock()
+    
+    def normalize(self, sql: str) -> str:
+        """Collapse whitespace so the same statement aggregates under one key"""
+        normalized = self._normalized.get(sql)
+        if normalized is None:
+            normalized = " ".join(sql.split())
+            if len(self._normalized) < self.MAX_STATEMENTS:
+                self._normalized[sql] = normalized
+        return normalized
+    
+    def param_shape(self, params) -> list:
+        """Types and sizes of bound parameters, without their values"""
+        def shape(value):
+            if isinstance(value, (str, bytes)):
+                return f"{type(value).__name__}({len(value)})"
+            return type(value).__name__
+        
+        if isinstance(params, dict):
+            return [f"{key}:{shape(value)}" for key, value in params.items()]
+        return [shape(value) for value in params or ()]
+    
+    def entry(self, sql: str) -> Dict:
+        statement = self.normalize(sql)
+        entry = self.stats.get(statement)
+        if entry is None:
+            if len(self.stats) >= self.MAX_STATEMENTS:
+                statement = "<other statements>"
+                entry = self.stats.get(statement)
+            if entry is None:
+                entry = self.stats[statement] = {
+                    "statement": statement, "calls": 0, "total_seconds": 0.0,
+                    "max_seconds": 0.0, "params": [], "sample_params": None
+                }
+        return entry
+    
+    def record(self, sql: str, params, seconds: float, calls: int = 1):
+        """Add one execution (or fetch time, with calls=0) to a statement's totals"""
+        with self._lock:
+            entry = self.entry(sql)
+            entry["calls"] += calls
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            if calls:
+                entry["params"] = self.param_shape(params)
+                # Kept in memory only, for EXPLAIN QUERY PLAN
+                entry["sample_params"] = params
+    
+    def on_statement(self, expanded_sql: str):
+        """sqlite3 trace callback; counts statements no cursor runs, like the implicit BEGIN"""
+        keyword = sql_operation(expanded_sql)
+        if keyword in ("BEGIN", "ROLLBACK", "SAVEPOINT", "RELEASE"):
+            with self._lock:
+                self.entry(keyword)["calls"] += 1
+    
+    def log_slow(self, sql: str, params, seconds: float, phase: str):
+        record = {
+            "event": "slow_query",
+            "duration_ms": round(seconds * 1000, 2),
+            "phase": phase,
+            "statement": self.normalize(sql),
+            "params": self.param_shape(params)
+        }
+        if self.explain_slow:
+            record["plan"] = self.explain(sql, params)
+        print(json.dumps(record), flush=True)
+    
+    def explain(self, sql: str, params) -> List[str]:
+        """EXPLAIN QUERY PLAN on a separate, untraced connection"""
+        if sql_operation(sql) not in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+            return []
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+                return [row[-1] for row in rows]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return [f"explain failed: {e}"]
+    
+    def top(self, limit: int = 20, explain: bool = False) -> List[Dict]:
+        """Statements ordered by total time spent in them"""
+        with self._lock:
+            entries = sorted(self.stats.values(), key=lambda entry: entry["total_seconds"], reverse=True)[:limit]
+            entries = [dict(entry) for entry in entries]
+        
+        report = []
+        for entry in entries:
+            item = {
+                "statement": entry["statement"],
+                "calls": entry["calls"],
+                "total_ms": round(entry["total_seconds"] * 1000, 2),
+                "mean_ms": round(entry["total_seconds"] * 1000 / entry["calls"], 3) if entry["calls"] else None,
+                "max_ms": round(entry["max_seconds"] * 1000, 2),
+                "params": entry["params"]
+            }
+            if explain:
+                item["plan"] = self.explain(entry["statement"], entry["sample_params"])
+            report.append(item)
+        return report
+    
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+sql_tracer = SQLTracer(SQL_TRACE_ENABLED, SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor recording statement and fetch timings"""
+
+    def execute(self, sql, parameters=()):
+        self.operation = sql_operation(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            end = time.perf_counter()
+            elapsed = end - start
+            metrics.observe('sds_sql_query_duration_seconds', elapsed, operation=self.operation)
+            record_span("db", start, end)
+            if sql_tracer.enabled:
+                self.trace_start(sql, parameters, elapsed)
+    
+    def executemany(self, sql, seq_of_parameters):
+        self.operation = sql_operation(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            end = time.perf_counter()
+            elapsed = end - start
+            metrics.observe('sds_sql_query_duration_seconds', elapsed, operation=self.operation)
+            record_span("db", start, end)
+            if sql_tracer.enabled:
+                self.trace_start(sql, (), elapsed)
+    
+    def trace_start(self, sql, parameters, elapsed: float):
+        self.trace_sql = sql
+        self.trace_params = parameters
+        self.trace_elapsed = elapsed
+        self.trace_logged = False
+        sql_tracer.record(sql, parameters, elapsed)
+        self.trace_check_slow("execute")
+    
+    def trace_check_slow(self, phase: str):
+        # Logged once per statement, when execute plus fetches first cross the threshold
+        if not self.trace_logged and self.trace_elapsed >= sql_tracer.slow_seconds:
+            self.trace_logged = True
+            sql_tracer.log_slow(self.trace_sql, self.trace_params, self.trace_elapsed, phase)
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self.record_fetch(start)
+    
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            self.record_fetch(start)
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self.record_fetch(start)
+    
+    def record_fetch(self, start: float):
+        end = time.perf_counter()
+        elapsed = end - start
+        record_span("db", start, end)
+        metrics.inc('sds_sql_fetch_seconds_total', elapsed, operation=getattr(self, 'operation', 'UNKNOWN'))
+        if sql_tracer.enabled and hasattr(self, 'trace_sql'):
+            self.trace_elapsed += elapsed
+            sql_tracer.record(self.trace_sql, self.trace_params, elapsed, calls=0)
+            self.trace_check_slow("fetch")
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements all go through InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            if sql_tracer.enabled:
+                sql_tracer.record("COMMIT", (), time.perf_counter() - start)
+
+# Stored chemical_hazards section each question type reads, in search result row order
+SECTION_COLUMNS = {"first_aid": "first_aid", "fire_fighting": "fire_fighting", "handling": "handling_storage", "exposure": "exposure_controls"}
+
+def search_columns(question_types) -> str:
+    """Columns of a search result row, as unpacked by answer_from_document, reading only the sections the question types need"""
+    # The other sections and full_text are left NULL: SDSAssistant.with_passages reads them
+    # afterwards for the documents that need them
+    sections = [f"ch.{column}" if question_type in question_types else f"NULL AS {column}"
+                for question_type, column in SECTION_COLUMNS.items()]
+    return f"sd.id, sd.product_name, NULL AS full_text, sd.file_url, {', '.join(sections)}, l.department, l.city, l.state"
+
+SEARCH_JOINS = '''
+    LEFT JOIN chemical_hazards ch ON sd.id = ch.document_id
+    LEFT JOIN locations l ON sd.location_id = l.id
+'''
+
+# Words too common in questions to help find a document
+QUERY_STOPWORDS = frozenset("""
+    a an and are as at be can do does for from how i if in is it its me my need of on or should
+    the there this to use used what when where which who why will with you your
+""".split())
+
+class LikeRetrieval:
+    """Substring match of the whole question against product names and document text"""
+    
+    name = "like"
+    
+    def search(self, cursor, question: str, location_id: int = None, limit: int = SEARCH_RESULT_LIMIT, columns: str = None) -> List:
+        query = f'''
+            SELECT {columns or search_columns(())}
+            FROM sds_documents sd
+            {SEARCH_JOINS}
+            WHERE (sd.full_text LIKE ? OR sd.product_name LIKE ?)
+        '''
+        params = [f"%{question}%", f"%{question}%"]
+        
+        if location_id:
+            query += " AND sd.location_id = ?"
+            params.append(location_id)
+        
+        query += " ORDER BY sd.created_at DESC LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+class FtsRetrieval:
+    """BM25-ranked full-text search over the sds_fts index, any question word matching"""
+    
+    name = "fts"
+    
+    # bm25 weights for the indexed columns: product_name, full_text
+    COLUMN_WEIGHTS = (10.0, 1.0)
+    
+    def match_expression(self, question: str) -> str:
+        terms = []
+        for word in re.findall(r"\w+", question.lower()):
+            if word not in QUERY_STOPWORDS and word not in terms:
+                terms.append(word)
+        return " OR ".join(f'"{term}"' for term in terms)
+    
+    def search(self, cursor, question: str, location_id: int = None, limit: int = SEARCH_RESULT_LIMIT, columns: str = None) -> List:
+        expression = self.match_expression(question)
+        if not expression:
+            return []
+        
+        # Rank inside a subquery: joined directly, SQLite may drive the join from
+        # sds_documents and run the full-text match once per document
+        hits = f"SELECT rowid, bm25(sds_fts, {self.COLUMN_WEIGHTS[0]}, {self.COLUMN_WEIGHTS[1]}) AS score FROM sds_fts WHERE sds_fts MATCH ?"
+        params = [expression]
+        
+        if location_id:
+            hits += " AND rowid IN (SELECT id FROM sds_documents WHERE location_id = ?)"
+            params.append(location_id)
+        
+        hits += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(f'''
+            SELECT {columns or search_columns(())}
+            FROM ({hits}) hits
+            JOIN sds_documents sd ON sd.id = hits.rowid
+            {SEARCH_JOINS}
+            ORDER BY hits.score
+        ''', params)
+        return cursor.fetchall()
+
+# Passages are embedded with a small latent semantic model: hashed word, bigram and
+# character trigram counts, TF-IDF weighted and projected onto the top singular
+# vectors of a sample of the corpus. The model is fitted once enough documents
+# exist; deleting model.<dim>.npz makes the next startup refit and re-embed.
+class VectorIndex:
+    """Passage embeddings in append-only float32 files, memory-mapped for brute-force cosine search"""
+    
+    META_DTYPE = np.dtype([('document_id', '<i4'), ('start', '<i4'), ('end', '<i4')])
+    HASH_BUCKETS = 2 ** 15
+    FIT_PASSAGES = 5000
+    FIT_MIN_DOCUMENTS = 20
+    
+    def __init__(self, directory: str, dim: int):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.model_path = self.directory / f"model.{dim}.npz"
+        self.model_mtime = None
+        self.idf = None
+        self.projection = None
+        self.vectors_path = None
+        self.meta_path = None
+        self.row_bytes = dim * 4
+        self.rows = 0
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.meta = np.zeros(0, dtype=self.META_DTYPE)
+        self._lock = patcher.original('threading').Lock()
+    
+    def features(self, text: str) -> List[str]:
+        """Words (plural s stripped), word bigrams and character trigrams of longer words"""
+        words = []
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word in QUERY_STOPWORDS:
+                continue
+            if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                word = word[:-1]
+            words.append(word)
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        # Trigrams let word variants ("flammable"/"flammability") share features
+        for word in words:
+            if len(word) > 3 and not word.isdigit():
+                padded = f"#{word}#"
+                features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+    
+    def term_counts(self, text: str) -> tuple:
+        """Hash buckets of a text's features and their log-scaled counts"""
+        features = self.features(text)
+        hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in features), dtype=np.uint32, count=len(features))
+        buckets, counts = np.unique(hashes % self.HASH_BUCKETS, return_counts=True)
+        return buckets, (1 + np.log(counts)).astype(np.float32)
+    
+    def fit(self, texts: List[str]):
+        """Fit IDF weights and a truncated SVD projection on sample passages, and save them"""
+        rows = [counts for counts in map(self.term_counts, texts) if len(counts[0])]
+        if not rows:
+            return False
+        cols = np.concatenate([buckets for buckets, _ in rows])
+        df = np.bincount(cols, minlength=self.HASH_BUCKETS)
+        idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+        
+        # Sparse TF-IDF matrix X (passages x buckets) as unit-length rows in CSR-like arrays
+        lengths = np.array([len(buckets) for buckets, _ in rows])
+        row_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        row_ids = np.repeat(np.arange(len(rows)), lengths)
+        vals = np.concatenate([weights for _, weights in rows]) * idf[cols]
+        vals /= np.sqrt(np.add.reduceat(vals ** 2, row_starts))[row_ids]
+        order = np.argsort(cols, kind='stable')
+        col_starts = np.flatnonzero(np.r_[True, np.diff(cols[order]) != 0])
+        present = cols[order][col_starts]
+        
+        def x_dot(m):
+            return np.add.reduceat(vals[:, None] * m[cols], row_starts)
+        
+        def xt_dot(m):
+            out = np.zeros((self.HASH_BUCKETS, m.shape[1]), dtype=np.float32)
+            out[present] = np.add.reduceat(vals[order, None] * m[row_ids[order]], col_starts)
+            return out
+        
+        # Randomized SVD (range finder with two power iterations)
+        k = min(self.dim + 10, len(rows))
+        y = x_dot(np.random.default_rng(0).standard_normal((self.HASH_BUCKETS, k)).astype(np.float32))
+        for _ in range(2):
+            q, _ = np.linalg.qr(y)
+            q, _ = np.linalg.qr(xt_dot(q))
+            y = x_dot(q)
+        q, _ = np.linalg.qr(y)
+        _, _, vt = np.linalg.svd(xt_dot(q).T, full_matrices=False)
+        projection = np.zeros((self.HASH_BUCKETS, self.dim), dtype=np.float32)
+        top = vt[:self.dim].T
+        projection[:, :top.shape[1]] = top
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = self.directory / f"model.{self.dim}.tmp.npz"
+        np.savez(temp_path, idf=idf, projection=projection)
+        os.replace(temp_path, self.model_path)
+        self.load_model()
+        return True
+    
+    def load_model(self) -> bool:
+        """Load the fitted model if it exists or has changed; False when there is none"""
+        try:
+            mtime = self.model_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime != self.model_mtime:
+            with self._lock:
+                with np.load(self.model_path) as model:
+                    self.idf = model['idf']
+                    self.projection = model['projection']
+                model_id = f"{zlib.crc32(self.projection.tobytes()):08x}"
+                self.vectors_path = self.directory / f"passages.{self.dim}.{model_id}.f32"
+                self.meta_path = self.directory / f"passages.{self.dim}.{model_id}.meta"
+                self.rows = 0
+                self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+                self.meta = np.zeros(0, dtype=self.META_DTYPE)
+                self.model_mtime = mtime
+        return True
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Unit-length embeddings of texts under the fitted model"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets, weights = self.term_counts(text)
+            weights = weights * self.idf[buckets]
+            matrix[row] = weights @ self.projection[buckets]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-9)
+    
+    def passages(self, text: str) -> List[tuple]:
+        """(start, end) offsets of overlapping word windows, not crossing SDS section headings"""
+        bounds = [0] + [m.start() for m in re.finditer(r"(?im)^\s*section\s+\d+", text)] + [len(text)]
+        spans = []
+        step = PASSAGE_WORDS - PASSAGE_OVERLAP
+        for section_start, section_end in zip(bounds, bounds[1:]):
+            words = [m.span() for m in re.finditer(r"\S+", text[section_start:section_end])]
+            for i in range(0, max(len(words) - PASSAGE_OVERLAP, 1), step):
+                window = words[i:i + PASSAGE_WORDS]
+                if window:
+                    spans.append((section_start + window[0][0], section_start + window[-1][1]))
+        return spans
+    
+    @contextlib.contextmanager
+    def locked(self):
+        """Exclusive cross-process lock for fitting and appending"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "passages.lock", 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def add(self, document_id: int, text: str, lock: bool = True) -> int:
+        """Embed a document's passages and append them; returns the number of passages"""
+        spans = self.passages(text)
+        if not spans or not self.load_model():
+            return 0
+        vectors = self.embed([text[start:end] for start, end in spans])
+        meta = np.array([(document_id, start, end) for start, end in spans], dtype=self.META_DTYPE)
+        with self.locked() if lock else contextlib.nullcontext():
+            # Drop any half-written tail so the two files stay row-aligned
+            rows = self.stored_rows()
+            for path, width in ((self.vectors_path, self.row_bytes), (self.meta_path, self.META_DTYPE.itemsize)):
+                if path.exists() and path.stat().st_size != rows * width:
+                    os.truncate(path, rows * width)
+            with open(self.meta_path, 'ab') as f:
+                f.write(meta.tobytes())
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+        return len(spans)
+    
+    def stored_rows(self) -> int:
+        if not self.vectors_path.exists() or not self.meta_path.exists():
+            return 0
+        return min(self.vectors_path.stat().st_size // self.row_bytes,
+                   self.meta_path.stat().st_size // self.META_DTYPE.itemsize)
+    
+    def refresh(self) -> bool:
+        """Re-map the files if another request or worker has appended rows"""
+        if not self.load_model():
+            return False
+        rows = self.stored_rows()
+        if rows != self.rows:
+            with self._lock:
+                if rows != self.rows:
+                    self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+                    self.meta = np.memmap(self.meta_path, dtype=self.META_DTYPE, mode='r', shape=(rows,))
+                    self.rows = rows
+        return True
+    
+    def last_document_id(self) -> int:
+        if not self.refresh() or not self.rows:
+            return 0
+        return int(self.meta['document_id'].max())
+    
+    def search(self, question: str, limit: int, document_ids=None) -> List[tuple]:
+        """(document_id, score, start, end) of the best passage of the top documents"""
+        if not self.refresh():
+            return []
+        vectors, meta = self.vectors, self.meta
+        if not len(vectors):
+            return []
+        query = self.embed([question])[0]
+        if document_ids is None:
+            rows = None
+            scores = vectors @ query
+        else:
+            # Only read the rows of the allowed documents
+            rows = np.flatnonzero(np.isin(meta['document_id'], document_ids))
+            if not len(rows):
+                return []
+            scores = vectors[rows] @ query
+        
+        # Several passages may belong to one document, so take extra before deduplicating
+        k = min(len(scores), limit * 8)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        seen = set()
+        for position in top:
+            row = rows[position] if rows is not None else position
+            document_id = int(meta['document_id'][row])
+            if document_id not in seen:
+                seen.add(document_id)
+                hits.append((document_id, float(scores[position]), int(meta['start'][row]), int(meta['end'][row])))
+                if len(hits) == limit:
+                    break
+        return hits
+
+class VectorRetrieval:
+    """Cosine similarity between the question and every passage in the vector index"""
+    
+    name = "vector"
+    
+    def __init__(self, index: VectorIndex):
+        self.index = index
+    
+    def search(self, cursor, question: str, location_id: int = None, limit: int = SEARCH_RESULT_LIMIT, columns: str = None) -> List:
+        document_ids = None
+        if location_id:
+            cursor.execute("SELECT id FROM sds_documents WHERE location_id = ?", (location_id,))
+            document_ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int32)
+        
+        hits = self.index.search(question, limit, document_ids)
+        if not hits:
+            return []
+        
+        ids = [hit[0] for hit in hits]
+        cursor.execute(f'''
+            SELECT {columns or search_columns(())}
+            FROM sds_documents sd
+            {SEARCH_JOINS}
+            WHERE sd.id IN ({",".join("?" * len(ids))})
+        ''', ids)
+        rows = {row[0]: row for row in cursor.fetchall()}
+        return [rows[document_id] for document_id in ids if document_id in rows]
+
+vector_index = VectorIndex(VECTOR_DIR, VECTOR_DIM)
+
+RETRIEVAL_ENGINES = {engine.name: engine for engine in (LikeRetrieval(), FtsRetrieval(), VectorRetrieval(vector_index))}
+
+class SentenceIndex:
+    """A document's '.'-separated sentences, scored against question terms with NumPy"""
+    
+    MIN_SENTENCE_LENGTH = 20
+    
+    def __init__(self, text: str):
+        self.sentences = text.split('.')
+        # lower() never adds or removes '.', so sentence numbers agree between both texts
+        self.lowered = text.lower()
+        self.ends = np.array([match.start() for match in re.finditer(r'\.', self.lowered)], dtype=np.int64)
+        self.eligible = np.array([len(sentence.strip()) > self.MIN_SENTENCE_LENGTH for sentence in self.sentences])
+        self.term_sentences = {}
+    
+    @staticmethod
+    def terms(question: str) -> List[str]:
+        """Distinct question words worth matching, in question order"""
+        terms = []
+        for word in re.findall(r"[a-z0-9]+", question.lower()):
+            if len(word) > 3 and word not in QUERY_STOPWORDS and word not in terms:
+                terms.append(word)
+        return terms
+    
+    def sentences_containing(self, term: str) -> np.ndarray:
+        """Numbers of the sentences containing term as a substring, found once per document"""
+        found = self.term_sentences.get(term)
+        if found is None:
+            positions = [match.start() for match in re.finditer(re.escape(term), self.lowered)]
+            found = np.unique(np.searchsorted(self.ends, positions, side='right'))
+            self.term_sentences[term] = found
+        return found
+    
+    def scores(self, terms: List[str]) -> np.ndarray:
+        """Idf-weighted count of the terms each sentence contains"""
+        count = len(self.sentences)
+        present = np.zeros((len(terms), count), dtype=bool)
+        for term_id, term in enumerate(terms):
+            present[term_id, self.sentences_containing(term)] = True
+        idf = np.log((count + 1) / (present.sum(axis=1) + 1)) + 1
+        return idf @ present
+    
+    def windows(self, terms: List[str], k: int = 1) -> List[tuple]:
+        """Up to k non-overlapping (score, text) windows around the best sentences"""
+        if not terms:
+            return []
+        scores = np.where(self.eligible, self.scores(terms), 0)
+        # Stable sort: among equal scores the earliest sentence wins, as in the original loop
+        order = np.argsort(-scores, kind='stable')
+        windows = []
+        chosen = []
+        for i in order[:max(k * 4, 16)]:
+            if scores[i] <= 0 or len(windows) == k:
+                break
+            if any(abs(i - j) < 3 for j in chosen):
+                continue
+            chosen.append(i)
+            text = '. '.join(self.sentences[max(0, i - 1):i + 2]).strip()
+            windows.append((float(scores[i]), text))
+        return windows
+
+@functools.lru_cache(maxsize=SENTENCE_INDEX_CACHE_SIZE)
+def sentence_index(text: str) -> SentenceIndex:
+    """Sentence layout of a document, kept for repeated questions about it"""
+    return SentenceIndex(text)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton finding every keyword of a label -> keywords table in one pass"""
+    
+    def __init__(self, table: Dict[str, List[str]]):
+        # Earlier labels win in first_label, as the order of the table says
+        self.priority = {label: rank for rank, label in enumerate(table)}
+        # Within a label, earlier keywords are the more specific ones
+        self.keyword_rank = {}
+        goto = [{}]
+        outputs = [[]]
+        for label, keywords in table.items():
+            for rank, keyword in enumerate(keywords):
+                keyword = keyword.lower()
+                self.keyword_rank.setdefault((label, keyword), rank)
+                state = 0
+                for char in keyword:
+                    if char not in goto[state]:
+                        goto[state][char] = len(goto)
+                        goto.append({})
+                        outputs.append([])
+                    state = goto[state][char]
+                outputs[state].append((keyword, label))
+        
+        # Breadth first, so a state's failure state is complete before the state itself;
+        # each state then gets a full transition table and no failure links are followed at scan time
+        self.transitions = [dict(goto[0])] + [None] * (len(goto) - 1)
+        self.outputs = outputs
+        queue = [(state, 0) for state in goto[0].values()]
+        for state, fail in queue:
+            self.outputs[state] = outputs[state] + self.outputs[fail]
+            transitions = dict(self.transitions[fail])
+            transitions.update(goto[state])
+            self.transitions[state] = transitions
+            for char, child in goto[state].items():
+                queue.append((child, self.transitions[fail].get(char, 0) if state else 0))
+    
+    def scan(self, text: str):
+        """Yield (start, keyword, label) for every match in text.lower(), by end position"""
+        transitions = self.transitions
+        outputs = self.outputs
+        state = 0
+        for end, char in enumerate(text.lower(), start=1):
+            state = transitions[state].get(char, 0)
+            for keyword, label in outputs[state]:
+                yield end - len(keyword), keyword, label
+    
+    def first_label(self, text: str) -> Optional[str]:
+        """The highest priority label with a keyword in text"""
+        best = None
+        for _, _, label in self.scan(text):
+            if best is None or self.priority[label] < self.priority[best]:
+                best = label
+        return best
+
+KEYWORD_TABLES = {
+    # Question type -> keywords; the first type in this order with a match wins
+    "question": {
+        "first_aid": ["first aid", "emergency", "exposure", "eye contact", "skin contact", "inhalation", "ingestion"],
+        "fire_fighting": ["fire", "firefighting", "extinguish", "combustible", "flammable"],
+        "handling": ["handling", "storage", "precautions", "handling precautions"],
+        "exposure": ["exposure", "protection", "ppe", "personal protective", "ventilation"],
+        "hazards": ["hazard", "danger", "toxic", "corrosive", "irritant"],
+        "physical": ["physical", "appearance", "odor", "melting point", "boiling point"]
+    },
+    # chemical_hazards column -> keywords of its SDS section heading, most specific first
+    "section": {
+        "hazard_identification": ["hazards identification", "hazard identification"],
+        "first_aid": ["first aid"],
+        "fire_fighting": ["fire fighting", "firefighting"],
+        "handling_storage": ["handling and storage"],
+        "exposure_controls": ["exposure controls", "personal protection"]
+    },
+    # GHS signal word -> phrases stating it in section 2
+    "hazard_phrase": {
+        "Danger": ["signal word: danger", "signal word : danger", "signal word danger"],
+        "Warning": ["signal word: warning", "signal word : warning", "signal word warning"]
+    },
+    # GHS pictogram code -> names it goes by on a "Pictograms:" line
+    "pictogram": {
+        "GHS01": ["exploding bomb", "explosive"],
+        "GHS02": ["flame"],
+        "GHS03": ["flame over circle", "oxidizer", "oxidiser"],
+        "GHS04": ["gas cylinder"],
+        "GHS05": ["corrosion", "corrosive"],
+        "GHS06": ["skull and crossbones"],
+        "GHS07": ["exclamation mark"],
+        "GHS08": ["health hazard"],
+        "GHS09": ["environment"]
+    }
+}
+
+GHS_HAZARD_CODE = re.compile(r"\b(?:EU)?H[2-4]\d{2}[A-Za-z]{0,2}\b", re.IGNORECASE)
+GHS_PRECAUTIONARY_CODE = re.compile(r"\bP[1-5]\d{2}(?:\s*\+\s*P[1-5]\d{2})*\b", re.IGNORECASE)
+GHS_PICTOGRAM_CODE = re.compile(r"\bGHS0[1-9]\b", re.IGNORECASE)
+
+# Position in a search result row (see search_columns) of the stored section each question type reads
+SECTION_ROW_INDEX = {"first_aid": 4, "fire_fighting": 5, "handling": 6, "exposure": 7}
+
+# A question continues the previous one only if it says so: it opens with a continuation
+# ("and ...", "what about ..."), refers back to the products ("is it ...", "those"), or is a bare
+# fragment (one word, or one question keyword such as "first aid?")
+FOLLOW_UP_MARKER = re.compile(
+    r"^\W*(?:and|also|so|then|what about|how about|what else)\b|\b(?:it|its|this|that|these|those|them|they|their)\b",
+    re.IGNORECASE)
+
+# Words that don't name a product: with only these (and stopwords) left, a follow-up is about the same products
+FOLLOW_UP_WORDS = frozenset("""
+    about also again another else more other same tell than that them then these they this those
+    chemical chemicals product products material materials
+    measures fighting information details requirements handle handled store stored wear need needed
+""".split())
+
+# Standard 16-section SDS numbering, used when a heading has none of the section keywords
+SECTION_NUMBERS = {"hazard_identification": 2, "first_aid": 4, "fire_fighting": 5, "handling_storage": 7, "exposure_controls": 8}
+
+if KEYWORDS_FILE:
+    try:
+        for table_name, extra in json.loads(Path(KEYWORDS_FILE).read_text()).items():
+            for label, keywords in extra.items():
+                KEYWORD_TABLES[table_name].setdefault(label, []).extend(keywords)
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        print(f"Error loading keywords file {KEYWORDS_FILE}: {e}")
+
+KEYWORD_AUTOMATA = {name: KeywordAutomaton(table) for name, table in KEYWORD_TABLES.items()}
+FOLLOW_UP_FRAGMENTS = frozenset(keyword for keywords in KEYWORD_TABLES["question"].values() for keyword in keywords)
+FOLLOW_UP_WORDS |= {word for keyword in FOLLOW_UP_FRAGMENTS for word in keyword.split()}
+
+def question_key(question: str) -> str:
+    """Grouping key for near-identical questions: their words, less stopwords and plural s, in sorted order"""
+    words = set()
+    for word in re.findall(r"[a-z0-9]+", question.lower()):
+        if len(word) < 2 or word in QUERY_STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.add(word)
+    return " ".join(sorted(words)) or question.strip().lower()
+
 class CloudFileStorage:
     def __init__(self):
         self.s3_client = None
@@ -139,12 +1347,13 @@ class CloudFileStorage:
             if content_type:
                 extra_args['ContentType'] = content_type
             
-            self.s3_client.upload_fileobj(
-                file_obj,
-                self.bucket_name,
-                filename,
-                ExtraArgs=extra_args
-            )
+            with span("s3"):
+                self.s3_client.upload_fileobj(
+                    file_obj,
+                    self.bucket_name,
+                    filename,
+                    ExtraArgs=extra_args
+                )
             
             # Return S3 URL
             return f"https://{self.bucket_name}.s3.{AWS_REGION}.amazonaws.com/{filename}"
@@ -181,18 +1390,315 @@ class CloudFileStorage:
         # Fallback to local URL
         return f"/static/uploads/{filename}"
 
+class QuestionLog:
+    """Bounded queue of Q&A history rows, written behind the request by a native thread in batches"""
+    
+    def __init__(self, write, capacity: int, flush_seconds: float, batch_size: int,
+                 maintenance=None, maintenance_seconds: float = 0):
+        self.write = write
+        self.capacity = capacity
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        # Rollup and pruning run on this thread too, so one thread per process writes qa_history
+        self.maintenance = maintenance if maintenance_seconds > 0 else None
+        self.maintenance_seconds = maintenance_seconds
+        self.next_maintenance = 0.0
+        # Native queue and thread: the writer blocks on SQLite's lock without holding up the eventlet hub
+        self.queue = patcher.original('queue').Queue(max(capacity, 1))
+        self.thread = None
+        self.pid = None
+        self._lock = patcher.original('threading').Lock()
+    
+    def submit(self, row: tuple) -> bool:
+        """Queue a row without waiting; False (and counted as dropped) if the queue is full"""
+        self.start()
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except patcher.original('queue').Full:
+            metrics.inc('sds_qa_log_rows_total', result="dropped")
+            return False
+    
+    def start(self):
+        """Start the writer in this process (a forked worker doesn't inherit its parent's thread)"""
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid != os.getpid():
+                self.thread = patcher.original('threading').Thread(target=self.run, name="qa-log-writer", daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+    
+    def run(self):
+        """Write rows as they arrive, gathering each batch for up to flush_seconds"""
+        while True:
+            try:
+                rows = [self.queue.get(timeout=self.until_maintenance())]
+            except patcher.original('queue').Empty:
+                self.maintain()
+                continue
+            deadline = time.monotonic() + self.flush_seconds
+            while rows[-1] is not None and len(rows) < self.batch_size:
+                try:
+                    rows.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except patcher.original('queue').Empty:
+                    break
+            
+            stopping = rows[-1] is None
+            if stopping:
+                rows.pop()
+            if rows:
+                self.flush(rows)
+            if stopping:
+                return
+            if self.until_maintenance() == 0:
+                self.maintain()
+    
+    def until_maintenance(self) -> Optional[float]:
+        """Seconds until maintenance is due, or None if there is none"""
+        if self.maintenance is None:
+            return None
+        return max(self.next_maintenance - time.monotonic(), 0)
+    
+    def maintain(self):
+        self.next_maintenance = time.monotonic() + self.maintenance_seconds
+        try:
+            self.maintenance()
+        except Exception as e:
+            print(f"Error in Q&A history maintenance: {e}")
+    
+    def flush(self, rows: List[tuple]):
+        try:
+            self.write(rows)
+            metrics.inc('sds_qa_log_rows_total', len(rows), result="written")
+            metrics.observe('sds_qa_log_batch_size', len(rows))
+        except sqlite3.Error as e:
+            print(f"Error writing Q&A history: {e}")
+            metrics.inc('sds_qa_log_rows_total', len(rows), result="failed")
+    
+    def depth(self) -> int:
+        return self.queue.qsize()
+    
+    def close(self, timeout: float = 10.0):
+        """Write out everything queued, then stop the writer"""
+        if self.pid != os.getpid() or not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except patcher.original('queue').Full:
+            print("Q&A history queue still full at shutdown; unwritten rows are lost")
+            return
+        self.thread.join(timeout)
+
+class SessionContext:
+    """The documents each session last retrieved, least recently used first"""
+    
+    def __init__(self, max_sessions: int, idle_seconds: float, max_age_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_age_seconds = max_age_seconds
+        # user session -> (last used, retrieved at, location filter, documents)
+        self.entries = OrderedDict()
+        self._lock = patcher.original('threading').Lock()
+    
+    def get(self, user_session: str, location_id) -> Optional[List]:
+        """The session's documents, if it retrieved some recently enough for the same location filter"""
+        with self._lock:
+            self.evict_idle()
+            entry = self.entries.get(user_session)
+            now = time.monotonic()
+            if entry is None or entry[2] != location_id or now - entry[1] > self.max_age_seconds:
+                return None
+            self.entries.move_to_end(user_session)
+            self.entries[user_session] = (now,) + entry[1:]
+            return entry[3]
+    
+    def put(self, user_session: str, location_id, documents: List):
+        with self._lock:
+            now = time.monotonic()
+            self.entries[user_session] = (now, now, location_id, documents)
+            self.entries.move_to_end(user_session)
+            while len(self.entries) > self.max_sessions:
+                self.entries.popitem(last=False)
+    
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self.entries and next(iter(self.entries.values()))[0] < cutoff:
+            self.entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+
 class SDSAssistant:
     def __init__(self, db_path: str = "data/sds_database.db"):
         self.db_path = db_path
+        sql_tracer.db_path = db_path
         self.cloud_storage = CloudFileStorage()
-        self.setup_database()
-        self.populate_us_cities()
+        self.listeners = []
+        self.stats_cache = None
+        self.stats_cache_expires = 0.0
+        self.retrieval = RETRIEVAL_ENGINES[RETRIEVAL_ENGINE]
+        self.session_context = SessionContext(SESSION_CONTEXT_SIZE, SESSION_CONTEXT_IDLE_SECONDS, SESSION_CONTEXT_MAX_AGE_SECONDS)
+        self.question_log = QuestionLog(self.insert_questions, QA_LOG_QUEUE_SIZE, QA_LOG_FLUSH_SECONDS, QA_LOG_BATCH_SIZE,
+                                        self.maintain_questions, QA_ROLLUP_SECONDS)
+        atexit.register(self.question_log.close)
+        # Every worker process runs this; the lock makes the first one do the work
+        with self.init_lock():
+            self.setup_database()
+            if VECTOR_INDEX_ENABLED:
+                self.backfill_vectors()
+            self.populate_us_cities()
+        # Started now rather than on the first question, so rollups also run on idle workers
+        if QA_LOG_QUEUE_SIZE:
+            self.question_log.start()
     
-    def setup_database(self):
-        """Initialize the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @contextlib.contextmanager
+    def init_lock(self):
+        """Exclusive file lock serializing one-time initialization across processes"""
+        lock_file = open(f"{self.db_path}.init.lock", 'w')
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+    
+    def add_listener(self, listener):
+        """Register a callable receiving (event, payload) for every data change"""
+        self.listeners.append(listener)
+    
+    def notify(self, event: str, payload: Dict):
+        """Apply a change to the cached dashboard stats and pass it on to listeners"""
+        if self.stats_cache is not None:
+            for key, delta in payload.get("stats_delta", {}).items():
+                self.stats_cache[key] = self.stats_cache.get(key, 0) + delta
         
+        for listener in self.listeners:
+            try:
+                listener(event, payload)
+            except Exception as e:
+                print(f"Event listener failed for {event}: {e}")
+    
+    def connect(self) -> sqlite3.Connection:
+        """Open a database connection configured for multi-process access"""
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, factory=InstrumentedConnection)
+        if sql_tracer.enabled:
+            conn.set_trace_callback(sql_tracer.on_statement)
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+    
+    def setup_database(self):
+        """Migrate the database to the latest schema version, finish pending backfills and refresh planner statistics"""
+        conn = self.connect()
+        try:
+            # WAL mode is persistent in the database file
+            conn.execute('PRAGMA journal_mode = WAL')
+            # Backfills still to run, resumed from last_id after a restart
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_backfills (
+                    name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL DEFAULT 0,
+                    end_id INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+            
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            migrations = [migration for migration in self.migrations() if migration[0] > version]
+            for target, description, migrate in migrations:
+                start = time.perf_counter()
+                cursor = conn.cursor()
+                # Schema changes and the version bump commit together, or not at all
+                cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    migrate(cursor)
+                    cursor.execute(f'PRAGMA user_version = {target}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"Schema migration {target} ({description}) applied in {time.perf_counter() - start:.2f}s")
+            
+            backfilled = self.run_backfills(conn)
+            if migrations or backfilled:
+                # Sampled, so statistics on a multi-GB database take seconds rather than a full scan
+                start = time.perf_counter()
+                conn.execute(f'PRAGMA analysis_limit = {MIGRATION_ANALYSIS_LIMIT}')
+                conn.execute('ANALYZE')
+                conn.commit()
+                print(f"Database statistics refreshed in {time.perf_counter() - start:.2f}s")
+        finally:
+            conn.close()
+    
+    def migrations(self) -> List[tuple]:
+        """(user_version, description, migrate(cursor)) for each schema version, in order"""
+        return [
+            (1, "base tables", self.migrate_base_tables),
+            (2, "full-text index", self.migrate_fts),
+            (3, "GHS classification index", self.migrate_ghs_index),
+            (4, "hazard filter and keyset listing indexes", self.migrate_listing_indexes),
+            (5, "Q&A daily stats", self.migrate_qa_rollup),
+            (6, "Q&A history created_at index", self.migrate_qa_history_index),
+            (7, "duplicate sticker cleanup", self.migrate_sticker_duplicates),
+        ]
+    
+    def ensure_index(self, cursor, name: str, table: str, columns: str):
+        """Create an index, first dropping one of the same name built with other columns"""
+        cursor.execute('SELECT name FROM pragma_index_info(?) ORDER BY seqno', (name,))
+        existing = [row[0] for row in cursor.fetchall()]
+        if existing and existing != [column.strip() for column in columns.split(',')]:
+            cursor.execute(f'DROP INDEX {name}')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})')
+    
+    def schedule_backfill(self, cursor, name: str, table: str):
+        """Queue a batched backfill over the rows of table that exist now; later rows are handled as they are written"""
+        cursor.execute(f'SELECT MAX(id) FROM {table}')
+        end_id = cursor.fetchone()[0]
+        if end_id is not None:
+            cursor.execute('INSERT OR REPLACE INTO schema_backfills (name, last_id, end_id) VALUES (?, 0, ?)', (name, end_id))
+    
+    def run_backfills(self, conn) -> int:
+        """Run pending backfills a batch per transaction, so other writers get the lock in between"""
+        # name -> (read a batch without the write lock, write it under the lock)
+        steps = {
+            "sds_fts": (None, self.backfill_fts),
+            "ghs_codes": (self.classify_ghs_batch, self.backfill_ghs_index)
+        }
+        total = 0
+        for name, last_id, end_id in conn.execute('SELECT name, last_id, end_id FROM schema_backfills').fetchall():
+            start = time.perf_counter()
+            read, write = steps[name]
+            while last_id < end_id:
+                batch_end, count = conn.execute('''
+                    SELECT MAX(id), COUNT(*) FROM (
+                        SELECT id FROM sds_documents WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+                    )
+                ''', (last_id, end_id, MIGRATION_BATCH_SIZE)).fetchone()
+                batch_end = batch_end or end_id
+                batch = read(conn, last_id, batch_end) if read else (last_id, batch_end)
+                
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    write(cursor, batch)
+                    cursor.execute('UPDATE schema_backfills SET last_id = ? WHERE name = ?', (batch_end, name))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                last_id = batch_end
+                total += count
+                time.sleep(MIGRATION_BATCH_PAUSE)
+            conn.execute('DELETE FROM schema_backfills WHERE name = ?', (name,))
+            conn.commit()
+            print(f"Backfill {name} finished in {time.perf_counter() - start:.2f}s")
+        return total
+    
+    def migrate_base_tables(self, cursor):
+        """Tables of the original schema; databases from before versioning already have them"""
         # Locations table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS locations (
@@ -266,18 +1772,176 @@ class SDSAssistant:
             )
         ''')
         
-        # Create indexes
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_name ON sds_documents(product_name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_location ON sds_documents(location_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cas_number ON sds_documents(cas_number)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_hash ON sds_documents(file_hash)')
+        # Generated stickers live in the database so any worker can serve them
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stickers (
+                filename TEXT PRIMARY KEY,
+                sticker_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
         
-        conn.commit()
-        conn.close()
+        self.ensure_index(cursor, 'idx_product_name', 'sds_documents', 'product_name')
+        self.ensure_index(cursor, 'idx_location', 'sds_documents', 'location_id')
+        self.ensure_index(cursor, 'idx_cas_number', 'sds_documents', 'cas_number')
+        self.ensure_index(cursor, 'idx_file_hash', 'sds_documents', 'file_hash')
+    
+    def migrate_fts(self, cursor):
+        """Full-text index for the fts retrieval engine"""
+        # It stores no text of its own and is kept in step with sds_documents by triggers
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sds_fts'")
+        fts_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS sds_fts USING fts5(
+                product_name, full_text,
+                content='sds_documents', content_rowid='id', tokenize='porter unicode61'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sds_fts_insert AFTER INSERT ON sds_documents BEGIN
+                INSERT INTO sds_fts (rowid, product_name, full_text) VALUES (new.id, new.product_name, new.full_text);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sds_fts_delete AFTER DELETE ON sds_documents BEGIN
+                INSERT INTO sds_fts (sds_fts, rowid, product_name, full_text) VALUES ('delete', old.id, old.product_name, old.full_text);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sds_fts_update AFTER UPDATE OF product_name, full_text ON sds_documents BEGIN
+                INSERT INTO sds_fts (sds_fts, rowid, product_name, full_text) VALUES ('delete', old.id, old.product_name, old.full_text);
+                INSERT INTO sds_fts (rowid, product_name, full_text) VALUES (new.id, new.product_name, new.full_text);
+            END
+        ''')
+        # The triggers index documents added from now on; existing ones are backfilled in batches
+        if not fts_exists:
+            self.schedule_backfill(cursor, "sds_fts", "sds_documents")
+    
+    def backfill_fts(self, cursor, id_range: tuple):
+        """Add an (after_id, end_id] range of existing documents to the full-text index"""
+        cursor.execute('''
+            INSERT INTO sds_fts (rowid, product_name, full_text)
+            SELECT id, product_name, full_text FROM sds_documents WHERE id > ? AND id <= ?
+        ''', id_range)
+    
+    def migrate_ghs_index(self, cursor):
+        """GHS classification index"""
+        # Each H/P code, pictogram and signal word once, linked to every document that carries it
+        # (with the document's location, so "every Danger product at this location" is one index range)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'document_ghs_codes'")
+        ghs_index_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ghs_codes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                description TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS document_ghs_codes (
+                code_id INTEGER NOT NULL,
+                document_id INTEGER NOT NULL,
+                location_id INTEGER,
+                PRIMARY KEY (code_id, document_id),
+                FOREIGN KEY (code_id) REFERENCES ghs_codes (id),
+                FOREIGN KEY (document_id) REFERENCES sds_documents (id)
+            ) WITHOUT ROWID
+        ''')
+        self.ensure_index(cursor, 'idx_document_ghs_document', 'document_ghs_codes', 'document_id')
+        self.ensure_index(cursor, 'idx_document_ghs_location', 'document_ghs_codes', 'code_id, location_id, document_id')
+        self.ensure_index(cursor, 'idx_hazards_document', 'chemical_hazards', 'document_id')
+        if not ghs_index_exists:
+            self.schedule_backfill(cursor, "ghs_codes", "sds_documents")
+    
+    def migrate_listing_indexes(self, cursor):
+        """Covering indexes for the hazard filters and keyset-paged listings"""
+        # Hazard audits: each filter column leads an index in keyset order (id), carrying the
+        # other filter columns so they are checked without reading the table row
+        self.ensure_index(cursor, 'idx_hazards_health', 'chemical_hazards', 'nfpa_health, id, nfpa_fire, nfpa_reactivity, ghs_signal_word')
+        self.ensure_index(cursor, 'idx_hazards_fire', 'chemical_hazards', 'nfpa_fire, id, nfpa_health, nfpa_reactivity, ghs_signal_word')
+        self.ensure_index(cursor, 'idx_hazards_reactivity', 'chemical_hazards', 'nfpa_reactivity, id, nfpa_health, nfpa_fire, ghs_signal_word')
+        self.ensure_index(cursor, 'idx_hazards_signal_word', 'chemical_hazards', 'ghs_signal_word, id, nfpa_health, nfpa_fire, nfpa_reactivity')
+        # Keyset pages: locations by (state, city, department, id), documents by (created_at, id);
+        # both cover their listing, so a page never reads documents' full text. Databases from
+        # before keyset paging have idx_locations_state_city without id, which ensure_index rebuilds
+        self.ensure_index(cursor, 'idx_locations_state_city', 'locations', 'state, city, department, id, country')
+        self.ensure_index(cursor, 'idx_documents_recent', 'sds_documents', 'created_at, id, location_id, product_name, original_filename, file_url')
+    
+    def migrate_qa_rollup(self, cursor):
+        """Q&A analytics tables"""
+        # Questions per day, question key (see question_key) and location (0 for none),
+        # rolled up from qa_history rows up to last_question_id
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS qa_daily_stats (
+                day TEXT NOT NULL,
+                question_key TEXT NOT NULL,
+                location_id INTEGER NOT NULL DEFAULT 0,
+                question TEXT NOT NULL,
+                question_count INTEGER NOT NULL DEFAULT 0,
+                confidence_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, question_key, location_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS qa_rollup_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                last_question_id INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO qa_rollup_state (id, last_question_id) VALUES (1, 0)')
+    
+    def migrate_qa_history_index(self, cursor):
+        """Time-range index on the Q&A history, for reports over raw questions"""
+        self.ensure_index(cursor, 'idx_qa_history_created', 'qa_history', 'created_at')
+    
+    def migrate_sticker_duplicates(self, cursor):
+        """Keep one row per distinct sticker; older versions stored a copy under a new name on every generation"""
+        cursor.execute('''
+            DELETE FROM stickers WHERE rowid NOT IN (
+                SELECT MAX(rowid) FROM stickers GROUP BY sticker_type, content
+            )
+        ''')
+    
+    def classify_ghs_batch(self, conn, after_id: int, end_id: int) -> List[tuple]:
+        """(document id, location id, GHS classification) for a range of stored documents"""
+        classified = []
+        rows = conn.execute('SELECT id, location_id, full_text FROM sds_documents WHERE id > ? AND id <= ?', (after_id, end_id))
+        for document_id, location_id, full_text in rows.fetchall():
+            sections = self.extract_sections(full_text)
+            classified.append((document_id, location_id, self.extract_ghs(sections.get("hazard_identification") or full_text.lower())))
+        return classified
+    
+    def backfill_ghs_index(self, cursor, classified: List[tuple]):
+        """Index the GHS classification of documents stored before the index existed"""
+        for document_id, location_id, ghs in classified:
+            self.index_ghs_codes(cursor, document_id, location_id, ghs)
+            cursor.execute('''
+                UPDATE chemical_hazards
+                SET ghs_signal_word = ?, ghs_pictograms = ?, ghs_hazard_statements = ?
+                WHERE document_id = ?
+            ''', (ghs["signal_word"], ", ".join(ghs["pictograms"]),
+                  "; ".join(ghs["hazard_statements"].get(code) or code for code in ghs["hazard_codes"]), document_id))
+    
+    def index_ghs_codes(self, cursor, document_id: int, location_id: Optional[int], ghs: Dict):
+        """Link a document to the ghs_codes rows of its GHS classification"""
+        codes = [(code, "hazard", ghs["hazard_statements"].get(code)) for code in ghs["hazard_codes"]]
+        codes += [(code, "precautionary", None) for code in ghs["precautionary_codes"]]
+        codes += [(code, "pictogram", None) for code in ghs["pictograms"]]
+        if ghs["signal_word"]:
+            codes.append((ghs["signal_word"], "signal_word", None))
+        for code, kind, description in codes:
+            cursor.execute('INSERT OR IGNORE INTO ghs_codes (code, kind, description) VALUES (?, ?, ?)',
+                           (code, kind, description))
+            cursor.execute('''
+                INSERT OR IGNORE INTO document_ghs_codes (code_id, document_id, location_id)
+                SELECT id, ?, ? FROM ghs_codes WHERE code = ?
+            ''', (document_id, location_id, code))
     
     def populate_us_cities(self):
         """Populate database with US cities"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT COUNT(*) FROM locations')
@@ -304,18 +1968,25 @@ class SDSAssistant:
         conn.close()
         print("US cities populated successfully!")
     
+    @offloaded('cpu')
+    @traced('pdf')
     def extract_text_from_pdf(self, file_stream) -> str:
         """Extract text from PDF"""
         try:
+            start = time.perf_counter()
             pdf_reader = PyPDF2.PdfReader(file_stream)
             text = ""
             for page in pdf_reader.pages:
                 text += page.extract_text() + "\n"
+            metrics.inc('sds_pdf_pages_total', len(pdf_reader.pages))
+            metrics.inc('sds_pdf_extract_seconds_total', time.perf_counter() - start)
             return text
         except Exception as e:
             print(f"Error extracting PDF text: {str(e)}")
             return ""
     
+    @offloaded('cpu')
+    @traced('parse')
     def extract_chemical_info(self, text: str) -> Dict:
         """Extract chemical information from SDS text"""
         info = {
@@ -328,6 +1999,8 @@ class SDSAssistant:
                 "reactivity": 0,
                 "special": "",
                 "ghs_signal_word": "",
+                "ghs_pictograms": "",
+                "ghs_hazard_statements": "",
                 "first_aid": "",
                 "fire_fighting": "",
                 "handling_storage": "",
@@ -384,43 +2057,111 @@ class SDSAssistant:
                 info["hazards"][key] = int(match.group(1))
         
         # Extract safety information sections
-        info["hazards"]["first_aid"] = self.extract_section(text, ["first aid", "section 4"])
-        info["hazards"]["fire_fighting"] = self.extract_section(text, ["fire fighting", "firefighting", "section 5"])
-        info["hazards"]["handling_storage"] = self.extract_section(text, ["handling and storage", "section 7"])
-        info["hazards"]["exposure_controls"] = self.extract_section(text, ["exposure controls", "personal protection", "section 8"])
+        sections = self.extract_sections(text)
+        for key in ("first_aid", "fire_fighting", "handling_storage", "exposure_controls"):
+            info["hazards"][key] = sections.get(key, "")[:1000]
+        
+        # GHS classification, from section 2 when there is one
+        info["ghs"] = self.extract_ghs(sections.get("hazard_identification") or text.lower())
+        info["hazards"]["ghs_signal_word"] = info["ghs"]["signal_word"]
+        info["hazards"]["ghs_pictograms"] = ", ".join(info["ghs"]["pictograms"])
+        info["hazards"]["ghs_hazard_statements"] = "; ".join(
+            info["ghs"]["hazard_statements"].get(code) or code for code in info["ghs"]["hazard_codes"])
         
         return info
     
-    def extract_section(self, text: str, section_keywords: List[str]) -> str:
-        """Extract specific sections from SDS text"""
+    def extract_ghs(self, text: str) -> Dict:
+        """Extract the signal word, H and P codes and pictograms from GHS hazard identification text"""
+        hazard_codes = []
+        hazard_statements = {}
+        for match in GHS_HAZARD_CODE.finditer(text):
+            code = match.group(0).upper()
+            if code not in hazard_codes:
+                hazard_codes.append(code)
+                # "H225: Highly flammable liquid and vapour." on its own line
+                line_end = text.find("\n", match.end())
+                statement = text[match.end():line_end if line_end >= 0 else len(text)].strip(" :-\t\r")
+                if statement and not GHS_HAZARD_CODE.search(statement):
+                    hazard_statements[code] = f"{code}: {statement[:200]}"
+        
+        precautionary_codes = []
+        for match in GHS_PRECAUTIONARY_CODE.finditer(text):
+            code = re.sub(r"\s+", "", match.group(0)).upper()
+            if code not in precautionary_codes:
+                precautionary_codes.append(code)
+        
+        pictograms = [match.group(0).upper() for match in GHS_PICTOGRAM_CODE.finditer(text)]
+        for line in re.findall(r"pictograms?\s*:?([^\n]*)", text, re.IGNORECASE):
+            # The longest name wins where names overlap ("flame over circle" is not also "flame")
+            covered = 0
+            matches = sorted(KEYWORD_AUTOMATA["pictogram"].scan(line), key=lambda m: (m[0], -len(m[1])))
+            for start, keyword, code in matches:
+                if start >= covered:
+                    pictograms.append(code)
+                    covered = start + len(keyword)
+        
+        return {
+            "signal_word": KEYWORD_AUTOMATA["hazard_phrase"].first_label(text) or "",
+            "hazard_codes": hazard_codes,
+            "hazard_statements": hazard_statements,
+            "precautionary_codes": precautionary_codes,
+            "pictograms": sorted(set(pictograms))
+        }
+    
+    def extract_sections(self, text: str) -> Dict[str, str]:
+        """Extract the lowercased text of each section in KEYWORD_TABLES["section"] from SDS text"""
         text_lower = text.lower()
+        automaton = KEYWORD_AUTOMATA["section"]
+        headings = [(match.start(), match.end(), int(match.group(1)))
+                    for match in re.finditer(r"section\s+(\d+)", text_lower)]
         
-        for keyword in section_keywords:
-            pattern = rf"{keyword}[:\s]*(.*?)(?=section\s+\d+|$)"
-            match = re.search(pattern, text_lower, re.DOTALL | re.IGNORECASE)
-            if match:
-                section_text = match.group(1).strip()
-                return section_text[:1000] if len(section_text) > 1000 else section_text
+        # Headings name their section: (rank, position) of the best heading per section, and where its text begins
+        found = {}
+        for start, end, number in headings:
+            line_end = text_lower.find("\n", end)
+            line_end = len(text_lower) if line_end < 0 else line_end
+            for offset, keyword, label in automaton.scan(text_lower[end:line_end]):
+                key = (automaton.keyword_rank[(label, keyword)], start)
+                if label not in found or key < found[label][0]:
+                    found[label] = (key, end + offset + len(keyword))
+            for label, section_number in SECTION_NUMBERS.items():
+                key = (len(KEYWORD_TABLES["section"].get(label, [])), start)
+                if number == section_number and (label not in found or key < found[label][0]):
+                    found[label] = (key, end)
+        
+        # Otherwise the first mention of a keyword anywhere, e.g. under "4. First aid measures" headings
+        for label, keywords in KEYWORD_TABLES["section"].items():
+            if label in found:
+                continue
+            for keyword in keywords:
+                position = text_lower.find(keyword.lower())
+                if position >= 0:
+                    found[label] = (None, position + len(keyword))
+                    break
         
-        return ""
+        # A section runs to the next "section N", wherever that appears
+        heading_starts = [start for start, _, _ in headings]
+        sections = {}
+        for label, (_, body_start) in found.items():
+            following = bisect.bisect_left(heading_starts, body_start)
+            body_end = heading_starts[following] if following < len(heading_starts) else len(text_lower)
+            section_text = text_lower[body_start:body_end].lstrip(": \t\r\n\f\v").strip()
+            sections[label] = section_text
+        return sections
     
-    def upload_file(self, file, location_id: int, uploaded_by: str = "web_user") -> Dict:
+    def upload_file(self, file, location_id: int, uploaded_by: str = "web_user", progress=None) -> Dict:
         """Process uploaded file with cloud storage"""
         try:
             # Read file content
-            file_content = file.read()
-            file.seek(0)
-            file_hash = hashlib.sha256(file_content).hexdigest()
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check for duplicates
-            cursor.execute('SELECT id, product_name FROM sds_documents WHERE file_hash = ?', (file_hash,))
-            existing = cursor.fetchone()
-            if existing:
-                conn.close()
-                return {"success": False, "message": f"File already exists (Product: {existing[1]})"}
+            with self.upload_stage("hash", progress):
+                file_content = file.read()
+                file.seek(0)
+                file_hash = work_pool.run('cpu', lambda: hashlib.sha256(file_content).hexdigest())
+                
+                # Check for duplicates
+                existing = self.find_document_by_hash(file_hash)
+                if existing:
+                    return {"success": False, "message": f"File already exists (Product: {existing[1]})"}
             
             # Generate unique filename
             filename = secure_filename(file.filename)
@@ -428,26 +2169,101 @@ class SDSAssistant:
             unique_filename = f"{timestamp}_{filename}"
             
             # Upload to cloud storage
-            file.seek(0)
-            file_url = self.cloud_storage.upload_file(file, unique_filename, file.content_type)
+            with self.upload_stage("store", progress):
+                file.seek(0)
+                file_url = self.cloud_storage.upload_file(file, unique_filename, file.content_type)
             
             if not file_url:
-                conn.close()
                 return {"success": False, "message": "Failed to upload file to storage"}
             
             # Extract text
-            file.seek(0)
-            if filename.lower().endswith('.pdf'):
-                text_content = self.extract_text_from_pdf(file)
-            else:
-                text_content = file_content.decode('utf-8', errors='ignore')
+            with self.upload_stage("extract", progress):
+                file.seek(0)
+                if filename.lower().endswith('.pdf'):
+                    text_content = self.extract_text_from_pdf(file)
+                else:
+                    text_content = file_content.decode('utf-8', errors='ignore')
             
             if not text_content.strip():
-                conn.close()
                 return {"success": False, "message": "Could not extract text from file"}
             
             # Extract chemical information
-            chem_info = self.extract_chemical_info(text_content)
+            with self.upload_stage("parse", progress):
+                chem_info = self.extract_chemical_info(text_content)
+            
+            with self.upload_stage("insert", progress):
+                document_id = self.store_document({
+                    "filename": unique_filename,
+                    "original_filename": filename,
+                    "file_hash": file_hash,
+                    "file_url": file_url,
+                    "full_text": text_content,
+                    "location_id": location_id,
+                    "file_size": len(file_content),
+                    "uploaded_by": uploaded_by
+                }, chem_info)
+            
+            if VECTOR_INDEX_ENABLED:
+                with self.upload_stage("embed", progress):
+                    self.embed_document(document_id, text_content)
+            
+            document = self.get_document_summary(document_id)
+            hazards = chem_info["hazards"]
+            self.notify("document_added", {
+                "document": document,
+                "location_id": location_id,
+                "stats_delta": {
+                    "total_documents": 1,
+                    "active_locations": 1 if document["location_document_count"] == 1 else 0,
+                    "hazardous_materials": 1 if hazards["health"] > 2 or hazards["fire"] > 2 else 0
+                }
+            })
+            if progress:
+                progress("done")
+            
+            return {
+                "success": True,
+                "message": "File uploaded successfully",
+                "product_name": chem_info["product_name"] or "Unknown Product",
+                "document_id": document_id,
+                "file_url": file_url
+            }
+            
+        except sqlite3.IntegrityError:
+            return {"success": False, "message": "File already exists"}
+        except Exception as e:
+            return {"success": False, "message": f"Error uploading file: {str(e)}"}
+    
+    @contextlib.contextmanager
+    def upload_stage(self, stage: str, progress=None):
+        """Time one upload stage, announcing its start to the progress callback"""
+        if progress:
+            progress(UPLOAD_PROGRESS_STAGES.get(stage, stage))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            metrics.observe('sds_upload_stage_duration_seconds', end - start, stage=stage)
+            record_span(f"upload.{stage}", start, end)
+    
+    @offloaded('db')
+    def find_document_by_hash(self, file_hash: str) -> Optional[tuple]:
+        """Look up an existing document by content hash"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, product_name FROM sds_documents WHERE file_hash = ?', (file_hash,))
+            return cursor.fetchone()
+        finally:
+            conn.close()
+    
+    @offloaded('db')
+    def store_document(self, document: Dict, chem_info: Dict) -> int:
+        """Insert a document and its hazard information in one transaction"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
             
             # Insert document
             cursor.execute('''
@@ -457,11 +2273,11 @@ class SDSAssistant:
                     location_id, source_type, file_size, uploaded_by
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                unique_filename, filename, file_hash, file_url,
+                document["filename"], document["original_filename"], document["file_hash"], document["file_url"],
                 chem_info["product_name"] or "Unknown Product", 
                 chem_info["manufacturer"] or "Unknown Manufacturer",
-                chem_info["cas_number"], text_content,
-                location_id, "upload", len(file_content), uploaded_by
+                chem_info["cas_number"], document["full_text"],
+                document["location_id"], "upload", document["file_size"], document["uploaded_by"]
             ))
             
             document_id = cursor.lastrowid
@@ -470,78 +2286,81 @@ class SDSAssistant:
             cursor.execute('''
                 INSERT INTO chemical_hazards (
                     document_id, product_name, cas_number, nfpa_health,
-                    nfpa_fire, nfpa_reactivity, ghs_signal_word,
+                    nfpa_fire, nfpa_reactivity, ghs_signal_word, ghs_pictograms, ghs_hazard_statements,
                     first_aid, fire_fighting, handling_storage, exposure_controls
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 document_id, chem_info["product_name"], chem_info["cas_number"],
                 chem_info["hazards"]["health"], chem_info["hazards"]["fire"],
                 chem_info["hazards"]["reactivity"], chem_info["hazards"]["ghs_signal_word"],
+                chem_info["hazards"]["ghs_pictograms"], chem_info["hazards"]["ghs_hazard_statements"],
                 chem_info["hazards"]["first_aid"], chem_info["hazards"]["fire_fighting"],
                 chem_info["hazards"]["handling_storage"], chem_info["hazards"]["exposure_controls"]
             ))
             
+            self.index_ghs_codes(cursor, document_id, document["location_id"], chem_info["ghs"])
+            
             conn.commit()
+            return document_id
+        finally:
             conn.close()
-            
-            return {
-                "success": True,
-                "message": "File uploaded successfully",
-                "product_name": chem_info["product_name"] or "Unknown Product",
-                "document_id": document_id,
-                "file_url": file_url
-            }
-            
-        except Exception as e:
-            return {"success": False, "message": f"Error uploading file: {str(e)}"}
+    
+    @offloaded('cpu')
+    def embed_document(self, document_id: int, text: str) -> int:
+        """Add a document's passages to the vector index, fitting the model first if needed"""
+        if not vector_index.load_model():
+            return self.backfill_vectors()
+        return vector_index.add(document_id, text)
+    
+    def backfill_vectors(self, batch_size: int = 200) -> int:
+        """Fit the vector model if there is none yet, then embed documents the index lacks"""
+        embedded = 0
+        conn = self.connect()
+        try:
+            with vector_index.locked():
+                if not vector_index.load_model():
+                    sample = conn.execute('''
+                        SELECT full_text FROM sds_documents
+                        WHERE id IN (SELECT id FROM sds_documents ORDER BY RANDOM() LIMIT ?)
+                    ''', (vector_index.FIT_PASSAGES // 10,)).fetchall()
+                    if len(sample) < vector_index.FIT_MIN_DOCUMENTS:
+                        return 0
+                    passages = [text[start:end] for (text,) in sample for start, end in vector_index.passages(text or "")]
+                    random.Random(0).shuffle(passages)
+                    if not vector_index.fit(passages[:vector_index.FIT_PASSAGES]):
+                        return 0
+                
+                last_id = vector_index.last_document_id()
+                while True:
+                    rows = conn.execute(
+                        'SELECT id, full_text FROM sds_documents WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    for document_id, full_text in rows:
+                        vector_index.add(document_id, full_text or "", lock=False)
+                    last_id = rows[-1][0]
+                    embedded += len(rows)
+        finally:
+            conn.close()
+        if embedded:
+            print(f"Embedded {embedded} documents into the vector index")
+        return embedded
     
     def answer_question(self, question: str, location_id: int = None, user_session: str = None) -> Dict:
         """Answer questions about SDS documents"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Search for relevant documents
-            search_query = '''
-                SELECT sd.id, sd.product_name, sd.full_text, sd.file_url,
-                       ch.first_aid, ch.fire_fighting, ch.handling_storage, ch.exposure_controls,
-                       l.department, l.city, l.state
-                FROM sds_documents sd
-                LEFT JOIN chemical_hazards ch ON sd.id = ch.document_id
-                LEFT JOIN locations l ON sd.location_id = l.id
-                WHERE sd.full_text LIKE ? OR sd.product_name LIKE ?
-            '''
-            
-            params = [f"%{question}%", f"%{question}%"]
-            
-            if location_id:
-                search_query += " AND sd.location_id = ?"
-                params.append(location_id)
-            
-            search_query += " ORDER BY sd.created_at DESC LIMIT 10"
-            
-            cursor.execute(search_query, params)
-            documents = cursor.fetchall()
+            documents = self.find_documents(question, location_id, user_session)
             
             if not documents:
-                return {
-                    "success": False,
-                    "answer": "I couldn't find any relevant SDS documents to answer your question. Please upload relevant SDS files first.",
-                    "sources": []
-                }
+                return {"success": False, "answer": NO_DOCUMENTS_ANSWER, "sources": []}
             
             # Generate answer
             answer = self.generate_answer(question, documents)
             
             # Log the Q&A
             if user_session:
-                cursor.execute('''
-                    INSERT INTO qa_history (question, answer, document_id, location_id, user_session, confidence_score)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (question, answer["text"], documents[0][0] if documents else None, location_id, user_session, answer["confidence"]))
-                conn.commit()
-            
-            conn.close()
+                self.record_question(question, answer, documents, location_id, user_session)
             
             return {
                 "success": True,
@@ -553,59 +2372,425 @@ class SDSAssistant:
         except Exception as e:
             return {"success": False, "answer": f"Error processing question: {str(e)}", "sources": []}
     
+    def stream_answer(self, question: str, location_id: int = None, user_session: str = None):
+        """Answer a question as a series of events, yielding each product's part as soon as it is ready"""
+        try:
+            documents = self.find_documents(question, location_id, user_session)
+            
+            if not documents:
+                yield {"type": "done", "success": False, "answer": NO_DOCUMENTS_ANSWER, "sources": []}
+                return
+            
+            yield {"type": "candidates", "count": len(documents)}
+            
+            parts = []
+            for text, source in self.iter_answer_parts(question, documents):
+                parts.append((text, source))
+                if len(parts) <= ANSWER_PARTS_SHOWN:
+                    yield {"type": "part", "text": text, "source": source}
+            
+            answer = self.summarize_answer(parts)
+            
+            if user_session:
+                self.record_question(question, answer, documents, location_id, user_session)
+            
+            yield {
+                "type": "done",
+                "success": True,
+                "answer": answer["text"],
+                "confidence": answer["confidence"],
+                "sources": answer["sources"]
+            }
+            
+        except Exception as e:
+            yield {"type": "done", "success": False, "answer": f"Error processing question: {str(e)}", "sources": []}
+    
+    @traced('log')
+    def record_question(self, question: str, answer: Dict, documents: List, location_id: Optional[int], user_session: str):
+        """Log an answered question and announce it to listeners"""
+        self.log_question(question, answer, documents[0][0] if documents else None, location_id, user_session)
+        self.notify("question_logged", {
+            "question": question,
+            "location_id": location_id,
+            "stats_delta": {"recent_questions": 1}
+        })
+    
+    def find_documents(self, question: str, location_id: int = None, user_session: str = None) -> List:
+        """Candidate documents: the session's last ones for a follow-up question, otherwise a new search"""
+        context = self.session_context.get(user_session, location_id) if user_session else None
+        documents = self.follow_up_documents(question, context) if context else None
+        if documents:
+            metrics.inc('sds_cache_requests_total', cache="session_context", result="hit")
+            return documents
+        
+        if user_session:
+            metrics.inc('sds_cache_requests_total', cache="session_context", result="miss")
+        documents = self.search_documents(question, location_id)
+        if user_session and documents:
+            self.session_context.put(user_session, location_id, documents)
+        return documents
+    
+    def follow_up_documents(self, question: str, context: List) -> Optional[List]:
+        """The context documents a follow-up question refers to, or None if it stands on its own or names something new"""
+        # "which chemicals are flammable?" asks about everything, not about the last answer's products
+        words = [word for word in re.findall(r"[a-z0-9]+", question.lower()) if word not in QUERY_STOPWORDS]
+        if len(words) > 1 and " ".join(words) not in FOLLOW_UP_FRAGMENTS and not FOLLOW_UP_MARKER.search(question):
+            return None
+        terms = [term for term in SentenceIndex.terms(question) if term not in FOLLOW_UP_WORDS]
+        if not terms:
+            # "and PPE?", "what about storage": the same products as before
+            return context
+        # Whole words, so "ethanol" does not pick out the methanol products
+        names = [set(re.findall(r"[a-z0-9]+", (doc[1] or "").lower())) for doc in context]
+        # Every remaining word must be part of a product already in the context
+        if all(any(term in name for name in names) for term in terms):
+            return [doc for doc, name in zip(context, names) if any(term in name for term in terms)]
+        return None
+    
+    def with_passages(self, documents: List, question_types: List[str]) -> List:
+        """Search result rows completed for the question types: their stored sections, and full_text where one is empty"""
+        sections = [SECTION_ROW_INDEX.get(question_type) for question_type in question_types]
+        # A section may be NULL because it was not selected: follow-ups reuse rows found for another question type
+        missing = [doc[0] for doc in documents
+                   if doc[2] is None and any(section is None or not doc[section] for section in sections)]
+        if not missing:
+            return documents
+        passages = self.get_passages(missing, question_types)
+        read = [SECTION_ROW_INDEX[question_type] for question_type in SECTION_COLUMNS if question_type in question_types]
+        completed = []
+        for doc in documents:
+            values = passages.get(doc[0]) if doc[0] in missing else None
+            if values is not None:
+                doc = list(doc)
+                for index, value in zip(read, values):
+                    doc[index] = value
+                doc[2] = values[-1]
+                doc = tuple(doc)
+            completed.append(doc)
+        return completed
+    
+    @offloaded('db')
+    @traced('search.text')
+    def get_passages(self, document_ids: List[int], question_types: List[str]) -> Dict[int, tuple]:
+        """(stored sections the question types read, in SECTION_COLUMNS order, then full text) of documents by id"""
+        sections = [f"ch.{column}" for question_type, column in SECTION_COLUMNS.items() if question_type in question_types]
+        if not sections or any(question_type not in SECTION_COLUMNS for question_type in question_types):
+            full_text = "sd.full_text"
+        else:
+            # Full text only for the documents missing one of the sections
+            empty = " OR ".join(f"COALESCE({section}, '') = ''" for section in sections)
+            full_text = f"CASE WHEN {empty} THEN sd.full_text END"
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {", ".join(["sd.id"] + sections + [full_text])}
+                FROM sds_documents sd
+                LEFT JOIN chemical_hazards ch ON ch.document_id = sd.id
+                WHERE sd.id IN ({", ".join("?" for _ in document_ids)})
+            ''', document_ids)
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+    
+    @offloaded('db')
+    @traced('search')
+    def search_documents(self, question: str, location_id: int = None) -> List:
+        """Find candidate documents for a question, with the stored section its type reads"""
+        columns = search_columns([self.classify_question(question)])
+        conn = self.connect()
+        try:
+            return self.retrieval.search(conn.cursor(), question, location_id, columns=columns)
+        finally:
+            conn.close()
+    
+    def log_question(self, question: str, answer: Dict, document_id: Optional[int], location_id: Optional[int], user_session: str):
+        """Record an answered question in the Q&A history, behind the request unless the log queue is off"""
+        row = (question, answer["text"], document_id, location_id, user_session, answer["confidence"])
+        if self.question_log.capacity:
+            self.question_log.submit(row)
+        else:
+            work_pool.run('db', self.insert_questions, [row])
+    
+    def insert_questions(self, rows: List[tuple]):
+        """Insert Q&A history rows in one transaction"""
+        conn = self.connect()
+        try:
+            conn.executemany('''
+                INSERT INTO qa_history (question, answer, document_id, location_id, user_session, confidence_score)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def maintain_questions(self):
+        """Roll new Q&A history into the daily stats, then prune what is past retention"""
+        rolled_up = self.rollup_questions()
+        pruned = self.prune_questions(QA_RETENTION_DAYS, QA_ARCHIVE_DIR) if QA_RETENTION_DAYS else 0
+        metrics.inc('sds_qa_rollup_rows_total', rolled_up, action="rolled_up")
+        metrics.inc('sds_qa_rollup_rows_total', pruned, action="pruned")
+    
+    def rollup_questions(self, batch_size: int = QA_ROLLUP_BATCH) -> int:
+        """Add Q&A history rows past the watermark to qa_daily_stats, one short transaction per batch"""
+        conn = self.connect()
+        total = 0
+        try:
+            while True:
+                # Taking the write lock first makes workers rolling up at once take turns
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    last_id = conn.execute('SELECT last_question_id FROM qa_rollup_state WHERE id = 1').fetchone()[0]
+                    rows = conn.execute('''
+                        SELECT id, question, location_id, confidence_score, date(created_at)
+                        FROM qa_history WHERE id > ? ORDER BY id LIMIT ?
+                    ''', (last_id, batch_size)).fetchall()
+                    
+                    groups = {}
+                    for _, question, location_id, confidence, day in rows:
+                        group = groups.setdefault((day, question_key(question), location_id or 0), [question, 0, 0.0])
+                        group[1] += 1
+                        group[2] += confidence or 0.0
+                    conn.executemany('''
+                        INSERT INTO qa_daily_stats (day, question_key, location_id, question, question_count, confidence_sum)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (day, question_key, location_id) DO UPDATE SET
+                            question_count = question_count + excluded.question_count,
+                            confidence_sum = confidence_sum + excluded.confidence_sum
+                    ''', [key + tuple(group) for key, group in groups.items()])
+                    if rows:
+                        conn.execute('UPDATE qa_rollup_state SET last_question_id = ? WHERE id = 1', (rows[-1][0],))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                
+                total += len(rows)
+                if len(rows) < batch_size:
+                    return total
+        finally:
+            conn.close()
+    
+    def prune_questions(self, retention_days: int, archive_dir: Optional[str] = None, batch_size: int = QA_ROLLUP_BATCH) -> int:
+        """Delete rolled-up Q&A history older than retention_days, archiving it first if archive_dir is set"""
+        conn = self.connect()
+        total = 0
+        try:
+            while True:
+                # Read and archived without the write lock, which only the delete takes. Ids follow
+                # insertion time, so expired rows are a prefix of the rowid order and each batch is
+                # found without an index on created_at
+                rows = conn.execute('''
+                    SELECT id, question, answer, document_id, location_id, user_session, confidence_score,
+                           created_at, created_at < datetime('now', ?)
+                    FROM qa_history
+                    WHERE id <= (SELECT last_question_id FROM qa_rollup_state WHERE id = 1)
+                    ORDER BY id LIMIT ?
+                ''', (f"-{retention_days} days", batch_size)).fetchall()
+                expired = list(itertools.takewhile(lambda row: row[8], rows))
+                if not expired:
+                    return total
+                if archive_dir:
+                    self.archive_questions(archive_dir, [row[:8] for row in expired])
+                
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Another worker may have pruned the same batch meanwhile; only rows still here count
+                    total += conn.execute('DELETE FROM qa_history WHERE id BETWEEN ? AND ?',
+                                          (expired[0][0], expired[-1][0])).rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                
+                if len(expired) < batch_size:
+                    return total
+        finally:
+            conn.close()
+    
+    def archive_questions(self, archive_dir: str, rows: List[tuple]):
+        """Append Q&A history rows (in id order) not yet in the archive to this month's gzipped JSON lines file"""
+        columns = ("id", "question", "answer", "document_id", "location_id", "user_session", "confidence_score", "created_at")
+        directory = Path(archive_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        # The highest id archived so far. A batch whose delete failed is archived again on the next
+        # run, and workers pruning at once take turns, so without it rows would be written twice
+        watermark = directory / "qa_history.archived"
+        with open(directory / "qa_history.lock", 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                archived_id = int(watermark.read_text()) if watermark.exists() else 0
+                rows = [row for row in rows if row[0] > archived_id]
+                if not rows:
+                    return
+                # Each append is a complete gzip member; readers see one continuous stream
+                path = directory / f"qa_history-{datetime.utcnow():%Y-%m}.jsonl.gz"
+                with gzip.open(path, 'at', encoding='utf-8') as archive:
+                    for row in rows:
+                        archive.write(json.dumps(dict(zip(columns, row))) + "\n")
+                # Replaced in one step, so it never reads as a partly written number
+                pending = directory / "qa_history.archived.tmp"
+                pending.write_text(str(rows[-1][0]))
+                os.replace(pending, watermark)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    @traced('answer')
     def generate_answer(self, question: str, documents: List) -> Dict:
         """Generate answer from documents using keyword matching"""
-        question_lower = question.lower()
-        answer_parts = []
-        sources = []
-        confidence = 0.0
-        
-        # Define question types and keywords
-        question_types = {
-            "first_aid": ["first aid", "emergency", "exposure", "eye contact", "skin contact", "inhalation", "ingestion"],
-            "fire_fighting": ["fire", "firefighting", "extinguish", "combustible", "flammable"],
-            "handling": ["handling", "storage", "precautions", "handling precautions"],
-            "exposure": ["exposure", "protection", "ppe", "personal protective", "ventilation"],
-            "hazards": ["hazard", "danger", "toxic", "corrosive", "irritant"],
-            "physical": ["physical", "appearance", "odor", "melting point", "boiling point"]
+        # Not offloaded as a whole: passages are read (db) and each document answered (cpu) as steps of their own
+        return self.summarize_answer(list(self.iter_answer_parts(question, documents)))
+    
+    def classify_question(self, question: str) -> str:
+        """Map a question to the SDS section type it asks about"""
+        return KEYWORD_AUTOMATA["question"].first_label(question) or "general"
+    
+    def iter_answer_parts(self, question: str, documents: List):
+        """Yield (answer text, source) for each document that has something relevant"""
+        question_type = self.classify_question(question)
+        found = 0
+        
+        # Full text is read a few documents at a time, only as far as answering gets
+        for start in range(0, len(documents), ANSWER_PARTS_SHOWN + 1):
+            for doc in self.with_passages(documents[start:start + ANSWER_PARTS_SHOWN + 1], [question_type]):
+                part = self.answer_from_document(question, question_type, doc)
+                if part:
+                    yield part
+                    found += 1
+                    # Only the first parts are shown, and one more already caps confidence at 1.0
+                    if found > ANSWER_PARTS_SHOWN:
+                        return
+    
+    @offloaded('cpu')
+    @traced('answer.document')
+    def answer_from_document(self, question: str, question_type: str, doc) -> Optional[tuple]:
+        """Build one product's answer part from a search result row"""
+        doc_id, product_name, full_text, file_url, first_aid, fire_fighting, handling_storage, exposure_controls, dept, city, state = doc
+        
+        relevant_text = self.relevant_section(question, question_type, doc)
+        if not relevant_text:
+            return None
+        
+        return f"**{product_name}**: {relevant_text}", {
+            "product_name": product_name,
+            "location": f"{dept}, {city}, {state}" if dept else "Unknown location",
+            "document_id": doc_id,
+            "file_url": file_url
         }
+    
+    def relevant_section(self, question: str, question_type: str, doc) -> str:
+        """The stored section of a search result row for the question type, else a passage of its full text"""
+        doc_id, product_name, full_text, file_url, first_aid, fire_fighting, handling_storage, exposure_controls, dept, city, state = doc
         
-        # Determine question type
-        question_type = "general"
-        for qtype, keywords in question_types.items():
-            if any(keyword in question_lower for keyword in keywords):
-                question_type = qtype
-                break
+        # Select relevant section based on question type
+        if question_type == "first_aid" and first_aid:
+            return first_aid
+        elif question_type == "fire_fighting" and fire_fighting:
+            return fire_fighting
+        elif question_type == "handling" and handling_storage:
+            return handling_storage
+        elif question_type == "exposure" and exposure_controls:
+            return exposure_controls
+        # Search in full text
+        return self.extract_relevant_text(question, full_text)
+    
+    def stream_checklist(self, questions: List[str], products: List[str], location_ids: List[int]):
+        """Answer every question for each matching document, yielding one event per document as it is answered"""
+        try:
+            # Classified once for the whole batch, not once per document
+            typed_questions = [(question, self.classify_question(question)) for question in questions]
+            question_types = [question_type for _, question_type in typed_questions]
+            total = min(self.count_checklist_documents(products, location_ids), CHECKLIST_MAX_DOCUMENTS)
+            yield {"type": "candidates", "count": total}
+            
+            sent = 0
+            after_id = 0
+            while sent < total:
+                page = self.get_checklist_documents(products, location_ids, question_types, after_id,
+                                                    min(CHECKLIST_PAGE_SIZE, total - sent))
+                if not page:
+                    break
+                for doc in self.with_passages(page, question_types):
+                    yield self.answer_checklist(typed_questions, doc)
+                sent += len(page)
+                after_id = page[-1][0]
+            
+            yield {"type": "done", "success": True, "documents": sent, "questions": len(questions)}
         
-        for doc in documents:
-            doc_id, product_name, full_text, file_url, first_aid, fire_fighting, handling_storage, exposure_controls, dept, city, state = doc
-            
-            # Select relevant section based on question type
-            relevant_text = ""
-            if question_type == "first_aid" and first_aid:
-                relevant_text = first_aid
-            elif question_type == "fire_fighting" and fire_fighting:
-                relevant_text = fire_fighting
-            elif question_type == "handling" and handling_storage:
-                relevant_text = handling_storage
-            elif question_type == "exposure" and exposure_controls:
-                relevant_text = exposure_controls
-            else:
-                # Search in full text
-                relevant_text = self.extract_relevant_text(question, full_text)
-            
-            if relevant_text:
-                answer_parts.append(f"**{product_name}**: {relevant_text}")
-                sources.append({
-                    "product_name": product_name,
-                    "location": f"{dept}, {city}, {state}" if dept else "Unknown location",
-                    "document_id": doc_id,
-                    "file_url": file_url
-                })
-                confidence += 0.3
+        except Exception as e:
+            yield {"type": "done", "success": False, "message": f"Error processing checklist: {str(e)}"}
+    
+    @offloaded('cpu')
+    @traced('answer.checklist')
+    def answer_checklist(self, typed_questions: List[tuple], doc) -> Dict:
+        """Answer each (question, question type) from one document; its sentence index is built once for all of them"""
+        doc_id, product_name, full_text, file_url, first_aid, fire_fighting, handling_storage, exposure_controls, dept, city, state = doc
+        return {
+            "type": "result",
+            "document_id": doc_id,
+            "product_name": product_name,
+            "location": f"{dept}, {city}, {state}" if dept else "Unknown location",
+            "file_url": file_url,
+            "answers": [
+                {"question": question, "answer": self.relevant_section(question, question_type, doc) or None}
+                for question, question_type in typed_questions
+            ]
+        }
+    
+    def checklist_filter(self, products: List[str], location_ids: List[int]) -> tuple:
+        """WHERE clause and parameters selecting documents by product name and location"""
+        conditions = []
+        params = []
+        if products:
+            # Names match as plain substrings: % and _ in a product name ("2_ethyl") are not wildcards
+            conditions.append("(" + " OR ".join("sd.product_name LIKE ? ESCAPE '\\'" for _ in products) + ")")
+            params.extend("%" + re.sub(r"([\\%_])", r"\\\1", product) + "%" for product in products)
+        if location_ids:
+            conditions.append(f"sd.location_id IN ({', '.join('?' for _ in location_ids)})")
+            params.extend(location_ids)
+        return " AND ".join(conditions), params
+    
+    @offloaded('db')
+    def count_checklist_documents(self, products: List[str], location_ids: List[int]) -> int:
+        """Number of documents a checklist covers"""
+        where, params = self.checklist_filter(products, location_ids)
+        conn = self.connect()
+        try:
+            return conn.execute(f'SELECT COUNT(*) FROM sds_documents sd WHERE {where}', params).fetchone()[0]
+        finally:
+            conn.close()
+    
+    @offloaded('db')
+    @traced('search')
+    def get_checklist_documents(self, products: List[str], location_ids: List[int], question_types: List[str],
+                                after_id: int, limit: int) -> List:
+        """The next page of a checklist's documents, as search result rows in id order"""
+        where, params = self.checklist_filter(products, location_ids)
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {search_columns(question_types)}
+                FROM sds_documents sd
+                {SEARCH_JOINS}
+                WHERE {where} AND sd.id > ?
+                ORDER BY sd.id
+                LIMIT ?
+            ''', params + [after_id, limit])
+            return cursor.fetchall()
+        finally:
+            conn.close()
+    
+    def summarize_answer(self, parts: List[tuple]) -> Dict:
+        """Combine answer parts into the final text, confidence and sources"""
+        answer_parts = [text for text, _ in parts]
+        sources = [source for _, source in parts]
+        confidence = 0.3 * len(parts)
         
         if answer_parts:
-            final_answer = "\n\n".join(answer_parts[:3])
+            final_answer = "\n\n".join(answer_parts[:ANSWER_PARTS_SHOWN])
             confidence = min(confidence, 1.0)
         else:
             final_answer = "I found relevant documents but couldn't extract specific information to answer your question. Please check the documents directly or rephrase your question."
@@ -614,39 +2799,30 @@ class SDSAssistant:
         return {
             "text": final_answer,
             "confidence": confidence,
-            "sources": sources[:3]
+            "sources": sources[:ANSWER_PARTS_SHOWN]
         }
     
     def extract_relevant_text(self, question: str, full_text: str, max_length: int = 500) -> str:
         """Extract relevant text snippet from full document"""
-        question_words = [word.lower() for word in question.split() if len(word) > 3]
-        sentences = full_text.split('.')
-        
-        best_sentence = ""
-        best_score = 0
-        
-        for sentence in sentences:
-            sentence_lower = sentence.lower()
-            score = sum(1 for word in question_words if word in sentence_lower)
-            
-            if score > best_score and len(sentence.strip()) > 20:
-                best_score = score
-                best_sentence = sentence.strip()
-        
-        if best_sentence:
-            sentence_index = sentences.index(best_sentence)
-            start_index = max(0, sentence_index - 1)
-            end_index = min(len(sentences), sentence_index + 2)
-            
-            context = '. '.join(sentences[start_index:end_index]).strip()
+        windows = self.relevant_windows(question, full_text, 1)
+        if windows:
+            context = windows[0][1]
             return context[:max_length] + "..." if len(context) > max_length else context
         
         return ""
     
+    def relevant_windows(self, question: str, full_text: str, k: int = 3) -> List[tuple]:
+        """Top-k (score, text) sentence windows of a document for a question"""
+        if not full_text:
+            return []
+        return sentence_index(full_text).windows(SentenceIndex.terms(question), k)
+    
+    @offloaded('db')
+    @traced('sticker')
     def generate_nfpa_sticker(self, product_name: str) -> Dict:
         """Generate NFPA diamond sticker"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -695,12 +2871,8 @@ class SDSAssistant:
     <text x="150" y="295" class="product" fill="black">{actual_name[:40]}</text>
 </svg>'''
             
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            sticker_filename = f"nfpa_{secure_filename(actual_name)}_{timestamp}.svg"
-            sticker_path = Path('static/stickers') / sticker_filename
-            
-            with open(sticker_path, 'w') as f:
-                f.write(svg_content)
+            sticker_filename = self.sticker_filename("nfpa", actual_name, svg_content)
+            self.save_sticker(sticker_filename, "NFPA", svg_content)
             
             return {
                 "success": True,
@@ -712,10 +2884,12 @@ class SDSAssistant:
         except Exception as e:
             return {"success": False, "message": f"Error generating NFPA sticker: {str(e)}"}
     
+    @offloaded('db')
+    @traced('sticker')
     def generate_ghs_sticker(self, product_name: str) -> Dict:
         """Generate GHS sticker"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -760,12 +2934,8 @@ class SDSAssistant:
     <text x="20" y="260" class="hazard" fill="black">Read SDS before use. Wear protective equipment.</text>
 </svg>'''
             
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            sticker_filename = f"ghs_{secure_filename(actual_name)}_{timestamp}.svg"
-            sticker_path = Path('static/stickers') / sticker_filename
-            
-            with open(sticker_path, 'w') as f:
-                f.write(svg_content)
+            sticker_filename = self.sticker_filename("ghs", actual_name, svg_content)
+            self.save_sticker(sticker_filename, "GHS", svg_content)
             
             return {
                 "success": True,
@@ -779,52 +2949,348 @@ class SDSAssistant:
         except Exception as e:
             return {"success": False, "message": f"Error generating GHS sticker: {str(e)}"}
     
-    def get_recent_documents(self, limit: int = 10) -> List[Dict]:
-        """Get recently uploaded documents"""
+    def sticker_filename(self, prefix: str, product_name: str, content: str) -> str:
+        """Name a sticker after its content, so generating the same sticker again reuses the stored one"""
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+        return f"{prefix}_{secure_filename(product_name)}_{digest}.svg"
+    
+    def save_sticker(self, filename: str, sticker_type: str, content: str):
+        """Store a generated sticker, unless the same one is already stored"""
+        conn = self.connect()
+        try:
+            conn.execute('''
+                INSERT OR IGNORE INTO stickers (filename, sticker_type, content)
+                VALUES (?, ?, ?)
+            ''', (filename, sticker_type, content))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    @offloaded('db')
+    def get_sticker(self, filename: str) -> Optional[str]:
+        """Fetch a generated sticker's SVG content"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT content FROM stickers WHERE filename = ?', (filename,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+    
+    @offloaded('db')
+    def get_recent_documents(self, limit: int = 10, cursor_token: str = None) -> Dict:
+        """Get recently uploaded documents, a page at a time"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            where = ""
+            params = []
+            if cursor_token:
+                key = decode_cursor(cursor_token, 2)
+                if key is None:
+                    return {"success": False, "message": "Invalid cursor"}
+                where = "WHERE (sd.created_at, sd.id) < (?, ?)"
+                params.extend(key)
+            
+            conn = self.connect()
             cursor = conn.cursor()
             
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT sd.id, sd.product_name, sd.original_filename, sd.file_url,
                        sd.created_at, l.department, l.city, l.state
                 FROM sds_documents sd
                 LEFT JOIN locations l ON sd.location_id = l.id
-                ORDER BY sd.created_at DESC
+                {where}
+                ORDER BY sd.created_at DESC, sd.id DESC
+                LIMIT ?
+            ''', params + [limit + 1])
+            
+            results = cursor.fetchall()
+            conn.close()
+            
+            page = results[:limit]
+            return {
+                "success": True,
+                "documents": [self.format_document_row(row) for row in page],
+                "next_cursor": encode_cursor((page[-1][4], page[-1][0])) if len(results) > limit else None
+            }
+        except Exception as e:
+            print(f"Error getting recent documents: {e}")
+            return {"success": False, "message": str(e)}
+    
+    @offloaded('db')
+    def get_document_summary(self, document_id: int) -> Dict:
+        """Get one document in the recent-documents shape, plus its location's document count"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT sd.id, sd.product_name, sd.original_filename, sd.file_url,
+                       sd.created_at, l.department, l.city, l.state, sd.location_id
+                FROM sds_documents sd
+                LEFT JOIN locations l ON sd.location_id = l.id
+                WHERE sd.id = ?
+            ''', (document_id,))
+            row = cursor.fetchone()
+            summary = self.format_document_row(row)
+            summary["location_id"] = row[8]
+
+            cursor.execute('SELECT COUNT(*) FROM sds_documents WHERE location_id = ?', (row[8],))
+            summary["location_document_count"] = cursor.fetchone()[0]
+            return summary
+        finally:
+            conn.close()
+    
+    def format_document_row(self, row) -> Dict:
+        """Shape a (id, product, filename, url, created_at, dept, city, state) row for the API"""
+        return {
+            "id": row[0],
+            "product_name": row[1],
+            "filename": row[2],
+            "file_url": row[3],
+            "uploaded_at": row[4],
+            "location": f"{row[5]}, {row[6]}, {row[7]}" if row[5] else "Unknown location"
+        }
+    
+    @offloaded('db')
+    def get_offline_bundle(self, location_id: int, since: int = 0, limit: int = OFFLINE_BUNDLE_BATCH) -> Dict:
+        """A location's documents added after version `since`, compact enough for phones to keep offline"""
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            
+            # Document ids only grow, so the highest one sent is the version the client has
+            cursor.execute('''
+                SELECT sd.id, sd.product_name, sd.manufacturer, sd.cas_number, sd.file_url,
+                       ch.nfpa_health, ch.nfpa_fire, ch.nfpa_reactivity, ch.nfpa_special,
+                       ch.ghs_signal_word, ch.ghs_pictograms, ch.ghs_hazard_statements,
+                       ch.first_aid, ch.fire_fighting, ch.handling_storage, ch.exposure_controls
+                FROM sds_documents sd
+                LEFT JOIN chemical_hazards ch ON ch.document_id = sd.id
+                WHERE sd.location_id = ? AND sd.id > ?
+                ORDER BY sd.id
                 LIMIT ?
-            ''', (limit,))
+            ''', (location_id, since, limit + 1))
+            
+            results = cursor.fetchall()
+            conn.close()
+            
+            documents = []
+            index = {}
+            for row in results[:limit]:
+                documents.append({
+                    "id": row[0],
+                    "product_name": row[1],
+                    "manufacturer": row[2],
+                    "cas_number": row[3],
+                    "file_url": row[4],
+                    "nfpa": {"health": row[5] or 0, "fire": row[6] or 0, "reactivity": row[7] or 0, "special": row[8] or ""},
+                    "ghs": {"signal_word": row[9] or "", "pictograms": row[10] or "", "hazard_statements": row[11] or ""},
+                    "sections": {
+                        "first_aid": row[12] or "",
+                        "fire_fighting": row[13] or "",
+                        "handling_storage": row[14] or "",
+                        "exposure_controls": row[15] or ""
+                    }
+                })
+                text = " ".join(value for value in row[1:4] if value).lower()
+                for term in set(OFFLINE_TERM.findall(text)):
+                    index.setdefault(term, []).append(row[0])
+            
+            return {
+                "success": True,
+                "location_id": location_id,
+                "version": documents[-1]["id"] if documents else since,
+                "complete": len(results) <= limit,
+                "documents": documents,
+                "index": index,
+                # Pairs, so the client checks question types in the same order classify_question does
+                "question_keywords": list(KEYWORD_TABLES["question"].items())
+            }
+        except Exception as e:
+            print(f"Error building offline bundle: {str(e)}")
+            return {"success": False, "message": f"Error building offline bundle: {str(e)}"}
+    
+    @offloaded('db')
+    def find_ghs_products(self, codes: List[str], location_id=None, state=None, city=None, department=None,
+                          limit: int = 100) -> List[Dict]:
+        """Products carrying every given GHS code (H/P code, pictogram or signal word), newest first"""
+        try:
+            codes = list({code.strip().upper() if re.fullmatch(r"(EU)?H\d+\w*|P[\d+P]+|GHS\d+", code.strip(), re.IGNORECASE)
+                          else code.strip().capitalize() for code in codes if code.strip()})
+            if not codes:
+                return []
+            conn = self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(f"SELECT id FROM ghs_codes WHERE code IN ({','.join('?' * len(codes))})", codes)
+            code_ids = [row[0] for row in cursor.fetchall()]
+            if len(code_ids) < len(codes):
+                conn.close()
+                return []
+            
+            # Walk the first code's documents newest first, so LIMIT stops the scan early;
+            # the other codes are primary key lookups
+            where_conditions = ["dg.code_id = ?"]
+            params = [code_ids[0]]
+            for code_id in code_ids[1:]:
+                where_conditions.append(
+                    "EXISTS (SELECT 1 FROM document_ghs_codes other WHERE other.code_id = ? AND other.document_id = dg.document_id)")
+                params.append(code_id)
+            if location_id:
+                where_conditions.append("dg.location_id = ?")
+                params.append(location_id)
+            location_conditions = []
+            for column, value in (("state", state), ("city", city), ("department", department)):
+                if value:
+                    location_conditions.append(f"{column} = ?")
+                    params.append(value)
+            if location_conditions:
+                where_conditions.append(f"dg.location_id IN (SELECT id FROM locations WHERE {' AND '.join(location_conditions)})")
+            params.append(limit)
             
+            cursor.execute(f'''
+                SELECT sd.id, sd.product_name, sd.manufacturer, sd.cas_number, ch.ghs_signal_word,
+                       ch.ghs_pictograms, ch.ghs_hazard_statements, l.department, l.city, l.state
+                FROM document_ghs_codes dg
+                JOIN sds_documents sd ON sd.id = dg.document_id
+                LEFT JOIN locations l ON l.id = sd.location_id
+                LEFT JOIN chemical_hazards ch ON ch.document_id = sd.id
+                WHERE {" AND ".join(where_conditions)}
+                ORDER BY dg.document_id DESC
+                LIMIT ?
+            ''', params)
             results = cursor.fetchall()
             conn.close()
             
             return [
                 {
-                    "id": row[0],
+                    "document_id": row[0],
                     "product_name": row[1],
-                    "filename": row[2],
-                    "file_url": row[3],
-                    "uploaded_at": row[4],
-                    "location": f"{row[5]}, {row[6]}, {row[7]}" if row[5] else "Unknown location"
+                    "manufacturer": row[2],
+                    "cas_number": row[3],
+                    "signal_word": row[4],
+                    "pictograms": row[5],
+                    "hazard_statements": row[6],
+                    "location": f"{row[7]}, {row[8]}, {row[9]}" if row[7] else "Unknown location"
                 }
                 for row in results
             ]
         except Exception as e:
-            print(f"Error getting recent documents: {e}")
+            print(f"Error finding GHS products: {str(e)}")
             return []
     
-    def get_locations(self, state_filter=None, search_term=None) -> List[Dict]:
-        """Get locations with optional filtering"""
+    @offloaded('db')
+    def search_hazards(self, filters: Dict, limit: int = 50, cursor_token: str = None) -> Dict:
+        """Products matching NFPA rating ranges, signal word and location filters, newest first, a page at a time"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            where_conditions = []
+            params = []
             
-            query = '''
-                SELECT l.id, l.department, l.city, l.state, l.country, 
-                       COUNT(sd.id) as document_count
-                FROM locations l
-                LEFT JOIN sds_documents sd ON l.id = sd.location_id
+            ranges = {}
+            for rating in ("health", "fire", "reactivity"):
+                low, high = filters.get(f"{rating}_min"), filters.get(f"{rating}_max")
+                if low is not None or high is not None:
+                    ranges[rating] = (max(low if low is not None else 0, 0), min(high if high is not None else 4, 4))
+            # Without a location filter, which starts from the location's few documents instead,
+            # the narrowest range drives the query, one branch per rating value, below
+            location_filtered = any(filters.get(key) for key in ("location_id", "state", "city", "department"))
+            driving = None
+            if ranges and not location_filtered:
+                driving = min(ranges, key=lambda rating: ranges[rating][1] - ranges[rating][0])
+            # Unary + keeps the other filters off their own indexes, so the driving rating's index is used
+            unindexed = "+" if driving else ""
+            for rating, (low, high) in ranges.items():
+                if rating != driving:
+                    where_conditions.append(f"{unindexed}ch.nfpa_{rating} BETWEEN ? AND ?")
+                    params.extend([low, high])
+            
+            if filters.get("signal_word"):
+                where_conditions.append(f"{unindexed}ch.ghs_signal_word = ?")
+                params.append(filters["signal_word"].strip().capitalize())
+            
+            if filters.get("location_id"):
+                where_conditions.append("sd.location_id = ?")
+                params.append(filters["location_id"])
+            location_conditions = []
+            for column in ("state", "city", "department"):
+                if filters.get(column):
+                    location_conditions.append(f"{column} = ?")
+                    params.append(filters[column])
+            if location_conditions:
+                where_conditions.append(f"sd.location_id IN (SELECT id FROM locations WHERE {' AND '.join(location_conditions)})")
+            
+            if cursor_token:
+                key = decode_cursor(cursor_token, 1)
+                if key is None:
+                    return {"success": False, "message": "Invalid cursor"}
+                where_conditions.append("ch.id < ?")
+                params.append(key[0])
+            
+            columns = '''
+                SELECT ch.id, sd.id, sd.product_name, sd.manufacturer, sd.cas_number,
+                       ch.nfpa_health, ch.nfpa_fire, ch.nfpa_reactivity, ch.nfpa_special,
+                       ch.ghs_signal_word, ch.ghs_pictograms, l.department, l.city, l.state, sd.created_at
             '''
+            locations_join = " LEFT JOIN locations l ON l.id = sd.location_id"
+            if driving:
+                # A range over an (nfpa_x, id) index comes out in rating order and needs a full sort;
+                # one equality branch per value each comes out in id order and SQLite merges them
+                low, high = ranges[driving]
+                branches = []
+                branch_params = []
+                for value in range(low, high + 1):
+                    branches.append(columns + f"""
+                        FROM chemical_hazards ch
+                        JOIN sds_documents sd ON sd.id = ch.document_id{locations_join}
+                        WHERE {" AND ".join([f"ch.nfpa_{driving} = ?"] + where_conditions)}
+                    """)
+                    branch_params.extend([value] + params)
+                if not branches:
+                    return {"success": True, "hazards": [], "next_cursor": None}
+                query = f"SELECT * FROM ({' UNION ALL '.join(branches)}) ORDER BY 1 DESC LIMIT ?"
+                params = branch_params
+            else:
+                # With a location filter, read the location's documents first rather than
+                # every matching hazard row in id order
+                tables = ("FROM sds_documents sd CROSS JOIN chemical_hazards ch ON ch.document_id = sd.id"
+                          if location_filtered else "FROM chemical_hazards ch JOIN sds_documents sd ON sd.id = ch.document_id")
+                query = columns + tables + locations_join + \
+                    (" WHERE " + " AND ".join(where_conditions) if where_conditions else "") + " ORDER BY ch.id DESC LIMIT ?"
+            
+            conn = self.connect()
+            cursor = conn.cursor()
+            # One row more than the page shows whether there is a next page
+            cursor.execute(query, params + [limit + 1])
+            results = cursor.fetchall()
+            conn.close()
             
+            page = results[:limit]
+            return {
+                "success": True,
+                "hazards": [
+                    {
+                        "document_id": row[1],
+                        "product_name": row[2],
+                        "manufacturer": row[3],
+                        "cas_number": row[4],
+                        "nfpa": {"health": row[5], "fire": row[6], "reactivity": row[7], "special": row[8]},
+                        "signal_word": row[9],
+                        "pictograms": row[10],
+                        "location": f"{row[11]}, {row[12]}, {row[13]}" if row[11] else "Unknown location",
+                        "created_at": row[14]
+                    }
+                    for row in page
+                ],
+                "next_cursor": encode_cursor((page[-1][0],)) if len(results) > limit else None
+            }
+        except Exception as e:
+            print(f"Error searching hazards: {str(e)}")
+            return {"success": False, "message": str(e)}
+    
+    @offloaded('db')
+    def get_locations(self, state_filter=None, search_term=None, limit: int = 50, cursor_token: str = None) -> Dict:
+        """Get locations with optional filtering, a page at a time"""
+        try:
             where_conditions = []
             params = []
             
@@ -832,38 +3298,60 @@ class SDSAssistant:
                 where_conditions.append("l.state = ?")
                 params.append(state_filter)
             
-            if search_term:
-                where_conditions.append("(l.city LIKE ? OR l.department LIKE ?)")
-                params.extend([f"%{search_term}%", f"%{search_term}%"])
+            if search_term:
+                where_conditions.append("(l.city LIKE ? OR l.department LIKE ?)")
+                params.extend([f"%{search_term}%", f"%{search_term}%"])
+            
+            if cursor_token:
+                key = decode_cursor(cursor_token, 4)
+                if key is None:
+                    return {"success": False, "message": "Invalid cursor"}
+                where_conditions.append("(l.state, l.city, l.department, l.id) > (?, ?, ?, ?)")
+                params.extend(key)
+            
+            conn = self.connect()
+            cursor = conn.cursor()
+            
+            # Documents are counted for the page's locations only
+            query = '''
+                SELECT l.id, l.department, l.city, l.state, l.country,
+                       (SELECT COUNT(*) FROM sds_documents sd WHERE sd.location_id = l.id) as document_count
+                FROM locations l
+            '''
             
             if where_conditions:
                 query += " WHERE " + " AND ".join(where_conditions)
             
             query += '''
-                GROUP BY l.id, l.department, l.city, l.state, l.country
-                ORDER BY l.state, l.city, l.department
-                LIMIT 1000
+                ORDER BY l.state, l.city, l.department, l.id
+                LIMIT ?
             '''
             
-            cursor.execute(query, params)
+            cursor.execute(query, params + [limit + 1])
             results = cursor.fetchall()
             conn.close()
             
-            return [
-                {
-                    "id": row[0],
-                    "department": row[1],
-                    "city": row[2],
-                    "state": row[3],
-                    "country": row[4],
-                    "document_count": row[5],
-                    "display_name": f"{row[1]} - {row[2]}, {row[3]}"
-                }
-                for row in results
-            ]
+            page = results[:limit]
+            return {
+                "success": True,
+                "locations": [
+                    {
+                        "id": row[0],
+                        "department": row[1],
+                        "city": row[2],
+                        "state": row[3],
+                        "country": row[4],
+                        "document_count": row[5],
+                        "display_name": f"{row[1]} - {row[2]}, {row[3]}"
+                    }
+                    for row in page
+                ],
+                "next_cursor": encode_cursor((page[-1][3], page[-1][2], page[-1][1], page[-1][0]))
+                               if len(results) > limit else None
+            }
         except Exception as e:
             print(f"Error getting locations: {str(e)}")
-            return []
+            return {"success": False, "message": str(e)}
     
     def get_states(self) -> List[str]:
         """Get all US states"""
@@ -872,7 +3360,35 @@ class SDSAssistant:
     def get_dashboard_stats(self) -> Dict:
         """Get dashboard statistics"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            now = time.time()
+            if self.stats_cache is None or now >= self.stats_cache_expires:
+                metrics.inc('sds_cache_requests_total', cache="dashboard_stats", result="miss")
+                self.stats_cache = self.query_dashboard_stats()
+                self.stats_cache_expires = now + DASHBOARD_CACHE_SECONDS
+            else:
+                metrics.inc('sds_cache_requests_total', cache="dashboard_stats", result="hit")
+            return dict(self.stats_cache)
+            
+        except Exception as e:
+            print(f"Error getting dashboard stats: {e}")
+            return {"total_documents": 0, "active_locations": 0, "recent_questions": 0, "hazardous_materials": 0, "popular_questions": []}
+    
+    @offloaded('db')
+    def check_database(self) -> float:
+        """Run a trivial query, returning its round-trip time in seconds"""
+        start = time.perf_counter()
+        conn = self.connect()
+        try:
+            conn.execute('SELECT 1').fetchone()
+        finally:
+            conn.close()
+        return time.perf_counter() - start
+    
+    @offloaded('db')
+    def query_dashboard_stats(self) -> Dict:
+        """Compute dashboard aggregates from the database"""
+        conn = self.connect()
+        try:
             cursor = conn.cursor()
             
             cursor.execute('SELECT COUNT(*) FROM sds_documents')
@@ -881,39 +3397,61 @@ class SDSAssistant:
             cursor.execute('SELECT COUNT(DISTINCT location_id) FROM sds_documents WHERE location_id IS NOT NULL')
             active_locations = cursor.fetchone()[0]
             
-            cursor.execute('SELECT COUNT(*) FROM qa_history WHERE created_at >= datetime("now", "-7 days")')
-            recent_questions = cursor.fetchone()[0]
-            
             cursor.execute('SELECT COUNT(*) FROM chemical_hazards WHERE nfpa_health > 2 OR nfpa_fire > 2')
             hazardous_count = cursor.fetchone()[0]
             
+            # Questions of the last 7 calendar days, today included: the daily rollup, plus the rows
+            # asked since it last ran, counted over the same days
             cursor.execute('''
-                SELECT question, COUNT(*) as count
-                FROM qa_history 
-                WHERE created_at >= datetime("now", "-7 days")
-                GROUP BY question
-                ORDER BY count DESC
-                LIMIT 5
+                SELECT question_key, SUM(question_count), MAX(question)
+                FROM qa_daily_stats
+                WHERE day > date('now', '-7 days')
+                GROUP BY question_key
             ''')
-            recent_questions_list = cursor.fetchall()
+            questions = {key: [count, question] for key, count, question in cursor.fetchall()}
             
-            conn.close()
+            cursor.execute('''
+                SELECT question FROM qa_history
+                WHERE id > (SELECT last_question_id FROM qa_rollup_state WHERE id = 1)
+                  AND created_at >= date('now', '-6 days')
+            ''')
+            for (question,) in cursor.fetchall():
+                questions.setdefault(question_key(question), [0, question])[0] += 1
             
+            popular = sorted(questions.values(), key=lambda entry: entry[0], reverse=True)[:5]
             return {
                 "total_documents": total_documents,
                 "active_locations": active_locations,
-                "recent_questions": recent_questions,
+                "recent_questions": sum(count for count, _ in questions.values()),
                 "hazardous_materials": hazardous_count,
-                "popular_questions": [{"question": row[0], "count": row[1]} for row in recent_questions_list]
+                "popular_questions": [{"question": question, "count": count} for count, question in popular]
             }
-            
-        except Exception as e:
-            print(f"Error getting dashboard stats: {e}")
-            return {"total_documents": 0, "active_locations": 0, "recent_questions": 0, "hazardous_materials": 0, "popular_questions": []}
+        finally:
+            conn.close()
 
 # Initialize the assistant
 sds_assistant = SDSAssistant()
 
+def question_log_gauges():
+    return [('sds_qa_log_queue_depth', {"pid": str(os.getpid())}, sds_assistant.question_log.depth())]
+
+metrics.add_gauge_callback(question_log_gauges)
+
+def location_room(location_id) -> str:
+    """Socket.IO room for clients watching one location, or all of them"""
+    return f"location:{location_id or 'all'}"
+
+def push_event(event: str, payload: Dict):
+    """Forward SDSAssistant data changes to connected browsers"""
+    if payload.get("stats_delta"):
+        socketio.emit('stats_delta', payload["stats_delta"])
+    
+    if event == "document_added":
+        document_rooms = [location_room(None), location_room(payload["location_id"])]
+        socketio.emit('document_added', payload["document"], to=document_rooms)
+
+sds_assistant.add_listener(push_event)
+
 # Enhanced HTML Template with Fixed JavaScript
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -922,6 +3460,8 @@ HTML_TEMPLATE = '''
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>SDS Assistant - AI-Powered Safety Data Sheet Management</title>
+    <link rel="manifest" href="/manifest.webmanifest">
+    <meta name="theme-color" content="#667eea">
     <link href="https://cdnjs.cloudflare.com/ajax/libs/tailwindcss/2.2.19/tailwind.min.css" rel="stylesheet">
     <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
     <style>
@@ -1218,9 +3758,11 @@ HTML_TEMPLATE = '''
         </div>
     </div>
 
+    <script src="https://cdn.socket.io/4.7.2/socket.io.min.js"></script>
     <script>
         // Global variables
         let isLoading = false;
+        let socket = null;
         
         // Initialize app when DOM is loaded
         document.addEventListener('DOMContentLoaded', function() {
@@ -1230,6 +3772,10 @@ HTML_TEMPLATE = '''
             loadStates();
             loadLocations();
             loadRecentDocuments();
+            connectSocket();
+            registerServiceWorker();
+            syncOfflineBundles();
+            window.addEventListener('online', syncOfflineBundles);
         });
         
         // Setup all event listeners
@@ -1286,6 +3832,26 @@ HTML_TEMPLATE = '''
             
             // Modal close buttons
             const closeUploadModal = document.getElementById('closeUploadModal');
+            const cancelUpload = document.getElementById('cancelUpload');
+            
+            if (closeUploadModal) {
+                closeUploadModal.addEventListener('click', () => hideModal('uploadModal'));
+            }
+            
+            if (cancelUpload) {
+                cancelUpload.addEventListener('click', () => hideModal('uploadModal'));
+            }
+            
+            // Upload form
+            const uploadForm = document.getElementById('uploadForm');
+            if (uploadForm) {
+                uploadForm.addEventListener('submit', handleFileUpload);
+                console.log('Upload form listener added');
+            }
+            
+            // Sticker generation
+            const generateStickerBtn = document.getElementById('generateStickerBtn');
+            const closeStickerModal = document.getElementById('closeStickerModal');
             const cancelSticker = document.getElementById('cancelSticker');
             const generateNFPA = document.getElementById('generateNFPA');
             const generateGHS = document.getElementById('generateGHS');
@@ -1331,6 +3897,13 @@ HTML_TEMPLATE = '''
                 });
             }
             
+            // Location filter scopes live document updates and picks the bundle kept offline
+            const locationFilter = document.getElementById('locationFilter');
+            if (locationFilter) {
+                locationFilter.addEventListener('change', subscribeToLocation);
+                locationFilter.addEventListener('change', () => syncOfflineBundle(locationFilter.value));
+            }
+            
             // Toast close
             const closeToast = document.getElementById('closeToast');
             if (closeToast) {
@@ -1394,7 +3967,7 @@ HTML_TEMPLATE = '''
         async function loadLocations() {
             console.log('Loading locations...');
             try {
-                const response = await fetch('/api/locations');
+                const response = await fetch('/api/locations?limit=50');
                 if (!response.ok) throw new Error('Failed to fetch locations');
                 
                 const locations = await response.json();
@@ -1403,7 +3976,7 @@ HTML_TEMPLATE = '''
                 const select = document.getElementById('locationFilter');
                 if (select) {
                     select.innerHTML = '<option value="">All Locations</option>';
-                    locations.slice(0, 50).forEach(location => {
+                    locations.forEach(location => {
                         const option = document.createElement('option');
                         option.value = location.id;
                         option.textContent = location.display_name;
@@ -1469,22 +4042,7 @@ HTML_TEMPLATE = '''
                 
                 container.innerHTML = '';
                 documents.forEach(doc => {
-                    const div = document.createElement('div');
-                    div.className = 'bg-gray-50 p-3 rounded-lg hover:bg-gray-100 transition';
-                    div.innerHTML = `
-                        <div class="flex justify-between items-start">
-                            <div class="flex-1">
-                                <h4 class="font-medium text-gray-900">${doc.product_name}</h4>
-                                <p class="text-sm text-gray-600">${doc.filename}</p>
-                                <p class="text-xs text-gray-500">${doc.location}</p>
-                            </div>
-                            <div class="flex flex-col space-y-1">
-                                ${doc.file_url ? `<a href="${doc.file_url}" target="_blank" class="text-blue-600 hover:text-blue-800 text-sm"><i class="fas fa-download mr-1"></i>Download</a>` : ''}
-                                <button onclick="askAboutDocument('${doc.product_name}')" class="text-green-600 hover:text-green-800 text-sm"><i class="fas fa-question-circle mr-1"></i>Ask AI</button>
-                            </div>
-                        </div>
-                    `;
-                    container.appendChild(div);
+                    container.appendChild(renderDocument(doc));
                 });
                 
             } catch (error) {
@@ -1496,6 +4054,111 @@ HTML_TEMPLATE = '''
             }
         }
         
+        // Render one recent document entry
+        function renderDocument(doc) {
+            const div = document.createElement('div');
+            div.className = 'bg-gray-50 p-3 rounded-lg hover:bg-gray-100 transition';
+            div.dataset.documentId = doc.id;
+            div.innerHTML = `
+                <div class="flex justify-between items-start">
+                    <div class="flex-1">
+                        <h4 class="font-medium text-gray-900">${doc.product_name}</h4>
+                        <p class="text-sm text-gray-600">${doc.filename}</p>
+                        <p class="text-xs text-gray-500">${doc.location}</p>
+                    </div>
+                    <div class="flex flex-col space-y-1">
+                        ${doc.file_url ? `<a href="${doc.file_url}" target="_blank" class="text-blue-600 hover:text-blue-800 text-sm"><i class="fas fa-download mr-1"></i>Download</a>` : ''}
+                        <button onclick="askAboutDocument('${doc.product_name}')" class="text-green-600 hover:text-green-800 text-sm"><i class="fas fa-question-circle mr-1"></i>Ask AI</button>
+                    </div>
+                </div>
+            `;
+            return div;
+        }
+        
+        // Real-time updates over Socket.IO
+        function connectSocket() {
+            if (typeof io === 'undefined') {
+                console.warn('Socket.IO client unavailable, falling back to refreshing after actions');
+                return;
+            }
+            
+            socket = io({ transports: ['websocket'] });
+            
+            socket.on('connect', () => {
+                console.log('Socket connected:', socket.id);
+                subscribeToLocation();
+                // Resync after (re)connecting in case updates were missed
+                loadDashboardStats();
+            });
+            
+            socket.on('stats_delta', applyStatsDelta);
+            socket.on('document_added', addRecentDocument);
+            socket.on('document_added', doc => {
+                const locationFilter = document.getElementById('locationFilter');
+                if (locationFilter && String(doc.location_id) === locationFilter.value) {
+                    syncOfflineBundle(locationFilter.value);
+                }
+            });
+            socket.on('upload_progress', showUploadProgress);
+        }
+        
+        function isLive() {
+            return socket !== null && socket.connected;
+        }
+        
+        function subscribeToLocation() {
+            if (!isLive()) return;
+            const locationFilter = document.getElementById('locationFilter');
+            socket.emit('subscribe', { location_id: locationFilter && locationFilter.value ? locationFilter.value : null });
+        }
+        
+        function applyStatsDelta(delta) {
+            const counters = {
+                total_documents: 'totalDocs',
+                active_locations: 'activeLocations',
+                recent_questions: 'recentQuestions',
+                hazardous_materials: 'hazardousMaterials'
+            };
+            
+            Object.entries(delta).forEach(([key, change]) => {
+                const element = document.getElementById(counters[key]);
+                if (element) {
+                    element.textContent = (parseInt(element.textContent, 10) || 0) + change;
+                }
+            });
+        }
+        
+        function addRecentDocument(doc) {
+            const container = document.getElementById('documentsList');
+            if (!container) return;
+            if (container.querySelector(`[data-document-id="${doc.id}"]`)) return;
+            
+            if (!container.querySelector('[data-document-id]')) {
+                container.innerHTML = '';
+            }
+            container.insertBefore(renderDocument(doc), container.firstChild);
+            while (container.children.length > 10) {
+                container.removeChild(container.lastChild);
+            }
+        }
+        
+        const uploadStageLabels = {
+            hashing: 'Checking file...',
+            storing: 'Storing file...',
+            extracting: 'Extracting text...',
+            parsing: 'Reading hazard data...',
+            saving: 'Saving...',
+            embed: 'Indexing...',
+            done: 'Finishing...'
+        };
+        
+        function showUploadProgress(progress) {
+            const uploadBtn = document.getElementById('submitUpload');
+            if (uploadBtn && uploadBtn.disabled) {
+                uploadBtn.innerHTML = `<i class="fas fa-spinner fa-spin mr-2"></i>${uploadStageLabels[progress.stage] || 'Uploading...'}`;
+            }
+        }
+        
         // Ask question to AI
         async function askQuestion() {
             if (isLoading) return;
@@ -1524,51 +4187,260 @@ HTML_TEMPLATE = '''
             questionInput.value = '';
             
             // Show loading message
-            const loadingDiv = addMessageToChat('🤔 Thinking...', 'ai', true);
+            let loadingDiv = addMessageToChat('🤔 Thinking...', 'ai', true);
+            let answerDiv = null;
             
             try {
+                // Without a network, go straight to the saved bundles
+                if (!navigator.onLine) throw new TypeError('Offline');
+                
                 const response = await fetch('/api/ask-question', {
                     method: 'POST',
                     headers: {
-                        'Content-Type': 'application/json'
+                        'Content-Type': 'application/json',
+                        'Accept': 'application/x-ndjson'
                     },
                     body: JSON.stringify({
                         question: question,
-                        location_id: locationId || null
+                        location_id: locationId || null,
+                        stream: true
                     })
                 });
                 
                 if (!response.ok) throw new Error('Failed to get answer');
                 
-                const result = await response.json();
+                // Show each product's answer as soon as the server sends it
+                const parts = [];
+                let result = null;
+                await readEventStream(response, event => {
+                    if (event.type === 'candidates' && loadingDiv) {
+                        setMessageText(loadingDiv, `🔎 Reading ${event.count} matching document${event.count === 1 ? '' : 's'}...`, 'ai');
+                    } else if (event.type === 'part') {
+                        parts.push(event.text);
+                        if (loadingDiv) {
+                            loadingDiv.remove();
+                            loadingDiv = null;
+                        }
+                        if (answerDiv) {
+                            setMessageText(answerDiv, parts.join('\\n\\n'), 'ai');
+                        } else {
+                            answerDiv = addMessageToChat(parts.join('\\n\\n'), 'ai');
+                        }
+                    } else if (event.type === 'done') {
+                        result = event;
+                    }
+                });
+                
+                if (!result) throw new Error('Answer stream ended early');
                 console.log('Answer received:', result);
                 
                 // Remove loading message
                 if (loadingDiv) loadingDiv.remove();
                 
+                let answer;
                 if (result.success) {
-                    let answer = result.answer;
+                    answer = result.answer;
                     if (result.sources && result.sources.length > 0) {
-                        answer += `\n\n📋 Sources: ${result.sources.map(s => s.product_name).join(', ')}`;
+                        answer += `\\n\\n📋 Sources: ${result.sources.map(s => s.product_name).join(', ')} (confidence ${Math.round(result.confidence * 100)}%)`;
                     }
-                    addMessageToChat(answer, 'ai');
                 } else {
-                    addMessageToChat(result.answer || 'Sorry, I couldn\'t find an answer to your question. Try uploading relevant SDS documents first.', 'ai');
+                    answer = result.answer || 'Sorry, I couldn\\'t find an answer to your question. Try uploading relevant SDS documents first.';
                 }
                 
-                // Refresh stats
-                loadDashboardStats();
+                if (answerDiv) {
+                    setMessageText(answerDiv, answer, 'ai');
+                } else {
+                    addMessageToChat(answer, 'ai');
+                }
+                
+                // Refresh stats unless the socket pushes the change
+                if (!isLive()) {
+                    loadDashboardStats();
+                }
                 
             } catch (error) {
                 console.error('Error asking question:', error);
                 if (loadingDiv) loadingDiv.remove();
-                addMessageToChat('Sorry, there was an error processing your question. Please try again.', 'ai');
-                showToast('Error processing question', 'error');
+                if (answerDiv) answerDiv.remove();
+                
+                // fetch rejects with a TypeError when the server can't be reached
+                const offlineAnswer = error instanceof TypeError
+                    ? await answerOffline(question, locationId).catch(() => null)
+                    : null;
+                if (offlineAnswer) {
+                    addMessageToChat(offlineAnswer, 'ai');
+                } else {
+                    addMessageToChat('Sorry, there was an error processing your question. Please try again.', 'ai');
+                    showToast('Error processing question', 'error');
+                }
             } finally {
                 isLoading = false;
             }
         }
         
+        // Offline SDS bundles: each synced location's hazards and key sections, kept in Cache Storage
+        const OFFLINE_CACHE = 'sds-offline-v1';
+        const OFFLINE_TERM = /[0-9]{2,7}-[0-9]{2}-[0-9]|[a-z0-9]{3,}/g;
+        const OFFLINE_SECTIONS = {
+            first_aid: ['first_aid', 'First aid'],
+            fire_fighting: ['fire_fighting', 'Fire fighting'],
+            handling: ['handling_storage', 'Handling and storage'],
+            exposure: ['exposure_controls', 'Exposure controls / PPE']
+        };
+        const syncingLocations = new Set();
+        
+        function registerServiceWorker() {
+            if (!('serviceWorker' in navigator)) return;
+            navigator.serviceWorker.register('/service-worker.js').catch(error => {
+                console.error('Service worker registration failed:', error);
+            });
+        }
+        
+        function offlineBundleKey(locationId) {
+            return `/offline/bundles/${locationId}`;
+        }
+        
+        // Bring every stored bundle, and the selected location's, up to date
+        async function syncOfflineBundles() {
+            if (!('caches' in window)) return;
+            const cache = await caches.open(OFFLINE_CACHE);
+            const locationIds = new Set((await cache.keys()).map(request => request.url.split('/').pop()));
+            const locationFilter = document.getElementById('locationFilter');
+            if (locationFilter && locationFilter.value) locationIds.add(locationFilter.value);
+            for (const locationId of locationIds) {
+                await syncOfflineBundle(locationId);
+            }
+        }
+        
+        // Fetch the location's documents added since the stored version, a batch at a time
+        async function syncOfflineBundle(locationId) {
+            if (!locationId || !('caches' in window) || !navigator.onLine || syncingLocations.has(locationId)) return;
+            syncingLocations.add(locationId);
+            try {
+                const cache = await caches.open(OFFLINE_CACHE);
+                const stored = await cache.match(offlineBundleKey(locationId));
+                const bundle = stored ? await stored.json() : { version: 0, documents: {}, index: {}, question_keywords: [] };
+                let complete = false;
+                while (!complete) {
+                    const response = await fetch(`/api/offline-bundle?location_id=${locationId}&since=${bundle.version}`);
+                    if (!response.ok) throw new Error('Failed to sync offline bundle');
+                    const update = await response.json();
+                    if (!update.success) throw new Error(update.message);
+                    update.documents.forEach(doc => { bundle.documents[doc.id] = doc; });
+                    Object.entries(update.index).forEach(([term, ids]) => {
+                        bundle.index[term] = (bundle.index[term] || []).concat(ids);
+                    });
+                    bundle.question_keywords = update.question_keywords;
+                    bundle.version = update.version;
+                    complete = update.complete;
+                    
+                    // Saved per batch, so an interrupted sync resumes where it stopped
+                    if (update.documents.length || !stored) {
+                        await cache.put(offlineBundleKey(locationId), new Response(JSON.stringify(bundle), {
+                            headers: { 'Content-Type': 'application/json' }
+                        }));
+                    }
+                }
+            } catch (error) {
+                console.error('Error syncing offline bundle:', error);
+            } finally {
+                syncingLocations.delete(locationId);
+            }
+        }
+        
+        // Answer from the saved bundles: the best matching products' section for the question type
+        async function answerOffline(question, locationId) {
+            if (!('caches' in window)) return null;
+            const cache = await caches.open(OFFLINE_CACHE);
+            const keys = locationId ? [offlineBundleKey(locationId)] : await cache.keys();
+            const bundles = [];
+            for (const key of keys) {
+                const stored = await cache.match(key);
+                if (stored) bundles.push(await stored.json());
+            }
+            if (!bundles.length) return null;
+            
+            const lowered = question.toLowerCase();
+            const scores = new Map();
+            const documentBundles = new Map();
+            new Set(lowered.match(OFFLINE_TERM) || []).forEach(term => {
+                bundles.forEach(bundle => (bundle.index[term] || []).forEach(id => {
+                    const doc = bundle.documents[id];
+                    scores.set(doc, (scores.get(doc) || 0) + 1);
+                    documentBundles.set(doc, bundle);
+                }));
+            });
+            const matches = [...scores.entries()].sort((a, b) => b[1] - a[1]).slice(0, 3).map(([doc]) => doc);
+            if (!matches.length) return null;
+            
+            // Question keywords of the bundle the best match came from
+            const questionKeywords = documentBundles.get(matches[0]).question_keywords || [];
+            const match = questionKeywords.find(([type, keywords]) => keywords.some(keyword => lowered.includes(keyword)));
+            const section = match ? OFFLINE_SECTIONS[match[0]] : null;
+            const parts = matches.map(doc => {
+                const text = section && doc.sections[section[0]]
+                    ? `${section[1]}: ${doc.sections[section[0]]}`
+                    : offlineHazardSummary(doc);
+                return `**${doc.product_name}**: ${text}\n${offlineNfpaSticker(doc.nfpa)}`;
+            });
+            return parts.join('\\n\\n') + '\\n\\n📴 Offline answer from saved SDS data';
+        }
+        
+        // The NFPA diamond of /api/generate-nfpa-sticker, drawn from a bundled document's ratings
+        function offlineNfpaSticker(nfpa) {
+            const special = String(nfpa.special || '').replace(/[^A-Za-z0-9 ]/g, '');
+            return [
+                '<svg width="96" height="96" viewBox="0 0 300 300" xmlns="http://www.w3.org/2000/svg" role="img" ',
+                `aria-label="NFPA health ${nfpa.health}, fire ${nfpa.fire}, reactivity ${nfpa.reactivity}">`,
+                '<g stroke="black" stroke-width="3">',
+                '<polygon points="25,150 150,25 150,150" fill="blue"/>',
+                '<polygon points="150,25 275,150 150,150" fill="red"/>',
+                '<polygon points="275,150 150,275 150,150" fill="yellow"/>',
+                '<polygon points="150,150 150,275 25,150" fill="white"/>',
+                '</g>',
+                '<g font-family="Arial, sans-serif" font-size="48" font-weight="bold" text-anchor="middle" dominant-baseline="middle">',
+                `<text x="87" y="105" fill="white">${Number(nfpa.health) || 0}</text>`,
+                `<text x="150" y="90" fill="white">${Number(nfpa.fire) || 0}</text>`,
+                `<text x="213" y="105" fill="black">${Number(nfpa.reactivity) || 0}</text>`,
+                `<text x="150" y="210" fill="black" font-size="32">${special}</text>`,
+                '</g></svg>'
+            ].join('');
+        }
+        
+        function offlineHazardSummary(doc) {
+            const lines = [`NFPA health ${doc.nfpa.health}, fire ${doc.nfpa.fire}, reactivity ${doc.nfpa.reactivity}`];
+            if (doc.nfpa.special) lines.push(`Special: ${doc.nfpa.special}`);
+            if (doc.ghs.signal_word) lines.push(`Signal word: ${doc.ghs.signal_word}`);
+            if (doc.ghs.pictograms) lines.push(`Pictograms: ${doc.ghs.pictograms}`);
+            if (doc.ghs.hazard_statements) lines.push(doc.ghs.hazard_statements);
+            return lines.join('. ');
+        }
+        
+        // Read a newline-delimited JSON response, calling onEvent per line as it arrives
+        async function readEventStream(response, onEvent) {
+            const handleLine = line => {
+                if (line.trim()) onEvent(JSON.parse(line));
+            };
+            
+            if (!response.body || typeof TextDecoder === 'undefined') {
+                (await response.text()).split('\\n').forEach(handleLine);
+                return;
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\\n');
+                buffered = lines.pop();
+                lines.forEach(handleLine);
+            }
+            handleLine(buffered + decoder.decode());
+        }
+        
         // Ask about specific document
         function askAboutDocument(productName) {
             const questionInput = document.getElementById('questionInput');
@@ -1586,8 +4458,7 @@ HTML_TEMPLATE = '''
             const messageDiv = document.createElement('div');
             messageDiv.className = `message ${sender}-message p-3 rounded-lg ${isLoading ? 'loading' : ''}`;
             
-            const senderLabel = sender === 'user' ? 'You' : 'AI Assistant';
-            messageDiv.innerHTML = `<p><strong>${senderLabel}:</strong> ${message.replace(/\n/g, '<br>')}</p>`;
+            setMessageText(messageDiv, message, sender);
             
             chatContainer.appendChild(messageDiv);
             chatContainer.scrollTop = chatContainer.scrollHeight;
@@ -1595,6 +4466,17 @@ HTML_TEMPLATE = '''
             return messageDiv;
         }
         
+        // Replace the text of a chat message
+        function setMessageText(messageDiv, message, sender) {
+            const senderLabel = sender === 'user' ? 'You' : 'AI Assistant';
+            messageDiv.innerHTML = `<p><strong>${senderLabel}:</strong> ${message.replace(/\\n/g, '<br>')}</p>`;
+            
+            const chatContainer = document.getElementById('chatContainer');
+            if (chatContainer) {
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            }
+        }
+        
         // Handle file upload
         async function handleFileUpload(e) {
             e.preventDefault();
@@ -1602,6 +4484,9 @@ HTML_TEMPLATE = '''
             
             const formData = new FormData(e.target);
             const uploadBtn = document.getElementById('submitUpload');
+            if (isLive()) {
+                formData.append('socket_id', socket.id);
+            }
             
             if (!uploadBtn) return;
             
@@ -1625,8 +4510,10 @@ HTML_TEMPLATE = '''
                     showToast(`File uploaded successfully: ${result.product_name}`, 'success');
                     hideModal('uploadModal');
                     e.target.reset();
-                    loadDashboardStats();
-                    loadRecentDocuments();
+                    if (!isLive()) {
+                        loadDashboardStats();
+                        loadRecentDocuments();
+                    }
                 } else {
                     showToast(result.message || 'Upload failed', 'error');
                 }
@@ -1790,22 +4677,290 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+def accepted_encoding(available=("br", "gzip")) -> Optional[str]:
+    """The first of the available content encodings the client accepts"""
+    for encoding in available:
+        if (encoding != "br" or brotli is not None) and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+def compress_body(body: bytes, encoding: str, best: bool = False) -> bytes:
+    """Gzip or brotli encode a body, at the per-response level or the maximum"""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+class CompiledAsset:
+    """A response body built once, kept with its gzip (and brotli, if installed) encodings"""
+    
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.body = body
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.encoded = {"identity": body, "gzip": compress_body(body, "gzip", best=True)}
+        if brotli is not None:
+            self.encoded["br"] = compress_body(body, "br", best=True)
+    
+    def response(self) -> Response:
+        """The best encoding the client accepts, or 304 if it already has this version"""
+        encoding = accepted_encoding() or "identity"
+        response = Response(self.encoded[encoding], content_type=self.content_type)
+        if encoding != "identity":
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = self.cache_control
+        # Weak: the encodings are different bytes of the same content
+        response.set_etag(self.digest, weak=True)
+        return response.make_conditional(request)
+
+def compile_shell(template: str):
+    """Render the page once and split its inline CSS and JS into content-addressed assets"""
+    with app.app_context():
+        html = render_template_string(template)
+    assets = {}
+    
+    def split_out(pattern, extension, content_type, reference):
+        nonlocal html
+        blocks = re.findall(pattern, html, re.DOTALL)
+        if not blocks:
+            return
+        asset = CompiledAsset("\n".join(block.strip() for block in blocks).encode(), content_type,
+                              'public, max-age=31536000, immutable')
+        name = f"app.{asset.digest}.{extension}"
+        assets[name] = asset
+        # The first block becomes the reference, so scripts still run at the same point of the page
+        html = re.sub(pattern, "\0", html, flags=re.DOTALL)
+        html = html.replace("\0", reference.format(name=name), 1).replace("\0", "")
+    
+    split_out(r"<style>(.*?)</style>", "css", "text/css; charset=utf-8", '<link href="/assets/{name}" rel="stylesheet">')
+    split_out(r"<script>(.*?)</script>", "js", "application/javascript; charset=utf-8", '<script src="/assets/{name}"></script>')
+    
+    # Start connecting to the CDNs the page needs before the parser reaches them
+    hints = "".join(f'\n    <link rel="preconnect" href="{origin}" crossorigin>'
+                    for origin in ("https://cdnjs.cloudflare.com", "https://cdn.socket.io"))
+    html = html.replace("<head>", "<head>" + hints, 1)
+    return CompiledAsset(html.encode(), "text/html; charset=utf-8", 'no-cache'), assets
+
+PAGE_SHELL, PAGE_ASSETS = compile_shell(HTML_TEMPLATE)
+
+APP_ICON_SVG = '''<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 512 512">
+    <rect width="512" height="512" rx="96" fill="#667eea"/>
+    <polygon points="256,72 440,256 256,440 72,256" fill="white"/>
+    <polygon points="256,112 400,256 256,400 112,256" fill="#ef4444"/>
+    <text x="256" y="300" font-family="Arial, sans-serif" font-size="120" font-weight="bold" fill="white" text-anchor="middle">SDS</text>
+</svg>'''
+
+SERVICE_WORKER_TEMPLATE = '''
+const SHELL_CACHE = 'sds-shell-__VERSION__';
+const RUNTIME_CACHE = 'sds-runtime';
+const PRECACHE = __PRECACHE__;
+const CACHED_API = ['/api/dashboard-stats', '/api/states', '/api/locations', '/api/recent-documents'];
+const CDN_ORIGINS = ['https://cdnjs.cloudflare.com', 'https://cdn.socket.io'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(SHELL_CACHE).then(cache => cache.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+// Drop the shells of earlier deployments
+self.addEventListener('activate', event => {
+    event.waitUntil(caches.keys().then(names => Promise.all(
+        names.filter(name => name.startsWith('sds-shell-') && name !== SHELL_CACHE).map(name => caches.delete(name))
+    )).then(() => self.clients.claim()));
+});
+
+// Content-addressed assets and versioned CDN files never change
+async function cacheFirst(request, cacheName) {
+    const cached = await caches.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') {
+        const cache = await caches.open(cacheName);
+        await cache.put(request, response.clone());
+    }
+    return response;
+}
+
+// The page and listings: fresh when online, the last copy when not
+async function networkFirst(request, cacheName, fallback) {
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            const cache = await caches.open(cacheName);
+            await cache.put(fallback || request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await caches.match(fallback || request);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (url.origin === self.location.origin) {
+        if (url.pathname.startsWith('/assets/')) {
+            event.respondWith(cacheFirst(request, SHELL_CACHE));
+        } else if (request.mode === 'navigate') {
+            event.respondWith(networkFirst(request, SHELL_CACHE, '/'));
+        } else if (CACHED_API.includes(url.pathname)) {
+            event.respondWith(networkFirst(request, RUNTIME_CACHE));
+        }
+    } else if (CDN_ORIGINS.includes(url.origin)) {
+        event.respondWith(cacheFirst(request, RUNTIME_CACHE));
+    }
+});
+'''
+
+def compile_pwa(shell: CompiledAsset, assets: Dict[str, CompiledAsset]):
+    """The web app manifest (with its icon) and a service worker that precaches this version of the page"""
+    icon = CompiledAsset(APP_ICON_SVG.encode(), "image/svg+xml", 'public, max-age=31536000, immutable')
+    assets[f"icon.{icon.digest}.svg"] = icon
+    manifest = {
+        "name": "SDS Assistant",
+        "short_name": "SDS",
+        "description": "Safety Data Sheets, hazards and first aid for your locations, online or off",
+        "start_url": "/",
+        "display": "standalone",
+        "background_color": "#f9fafb",
+        "theme_color": "#667eea",
+        "icons": [{"src": f"/assets/icon.{icon.digest}.svg", "sizes": "any", "type": "image/svg+xml", "purpose": "any"}]
+    }
+    # The worker script changes with the shell, which is how browsers learn of a new deployment
+    precache = ["/"] + [f"/assets/{name}" for name in assets]
+    worker = SERVICE_WORKER_TEMPLATE.replace("__VERSION__", shell.digest).replace("__PRECACHE__", json.dumps(precache))
+    return (CompiledAsset(json.dumps(manifest).encode(), "application/manifest+json", 'public, max-age=86400'),
+            CompiledAsset(worker.encode(), "application/javascript; charset=utf-8", 'no-cache'))
+
+WEB_MANIFEST, SERVICE_WORKER = compile_pwa(PAGE_SHELL, PAGE_ASSETS)
+
+# Request metrics and tracing
+@app.before_request
+def start_request_timer():
+    request.environ['sds.request_start'] = time.perf_counter()
+    current_trace.set(RequestTrace())
+
+@app.after_request
+def record_request_metrics(response):
+    start = request.environ.get('sds.request_start')
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if start is not None:
+        metrics.observe('sds_http_request_duration_seconds', time.perf_counter() - start,
+                        method=request.method, route=route, status=str(response.status_code))
+    metrics.maybe_persist()
+    
+    trace = current_trace.get()
+    if trace is not None:
+        # Streamed bodies are still running here, so their spans only reach the trace log
+        if SERVER_TIMING_ENABLED:
+            response.headers['Server-Timing'] = trace.server_timing()
+        if TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE:
+            method, status = request.method, response.status_code
+            response.call_on_close(lambda: log_trace(trace, method, route, status))
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON bodies of at least COMPRESS_MIN_BYTES with the best encoding the client accepts"""
+    # Registered after record_request_metrics, so it runs first and its span is in Server-Timing
+    if (not COMPRESS_MIN_BYTES or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+    with span("compress"):
+        compressed = compress_body(body, encoding)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    metrics.inc('sds_compression_bytes_total', len(body), encoding=encoding, stage="in")
+    metrics.inc('sds_compression_bytes_total', len(compressed), encoding=encoding, stage="out")
+    return response
+
+@app.teardown_request
+def clear_request_trace(error=None):
+    current_trace.set(None)
+
+def log_trace(trace: RequestTrace, method: str, route: str, status: int):
+    """Write one sampled request trace as a JSON line"""
+    record = {"event": "request_trace", "method": method, "route": route, "status": status}
+    record.update(trace.to_log())
+    print(json.dumps(record), flush=True)
+
 # Routes
 @app.route('/')
 def index():
     """Main dashboard page"""
-    return render_template_string(HTML_TEMPLATE)
+    return PAGE_SHELL.response()
+
+@app.route('/assets/<name>')
+def page_asset(name):
+    """CSS and JS split out of the page, cached for good under their content hash"""
+    asset = PAGE_ASSETS.get(name)
+    if asset is None:
+        return jsonify({"error": "Not Found"}), 404
+    return asset.response()
+
+@app.route('/manifest.webmanifest')
+def web_manifest():
+    """Web app manifest, so phones can install the dashboard"""
+    return WEB_MANIFEST.response()
+
+@app.route('/service-worker.js')
+def service_worker():
+    """Service worker, served from the root so its scope is the whole app"""
+    return SERVICE_WORKER.response()
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
+    try:
+        database = {"status": "connected", "latency_ms": round(sds_assistant.check_database() * 1000, 2)}
+    except Exception as e:
+        database = {"status": "error", "message": str(e)}
+    
+    healthy = database["status"] == "connected"
     return jsonify({
-        "status": "healthy", 
+        "status": "healthy" if healthy else "unhealthy",
         "timestamp": datetime.now().isoformat(),
-        "database": "connected",
+        "database": database,
         "cloud_storage": "configured" if sds_assistant.cloud_storage.s3_client else "local_fallback"
+    }), 200 if healthy else 503
+
+@app.route('/debug/sql', methods=['GET', 'DELETE'])
+def debug_sql():
+    """Top SQL statements by total time (requires SDS_SQL_TRACE=1)"""
+    if not sql_tracer.enabled:
+        return jsonify({"error": "Not Found", "message": "SQL tracing is disabled (set SDS_SQL_TRACE=1)"}), 404
+    if DEBUG_TOKEN and request.headers.get('X-Debug-Token') != DEBUG_TOKEN:
+        return jsonify({"error": "Forbidden"}), 403
+    
+    if request.method == 'DELETE':
+        sql_tracer.reset()
+        return jsonify({"success": True})
+    
+    limit = request.args.get('limit', 20, type=int)
+    explain = request.args.get('explain') == '1'
+    statements = work_pool.run('db', sql_tracer.top, limit, explain)
+    return jsonify({
+        "pid": os.getpid(),
+        "slow_query_ms": SLOW_QUERY_MS,
+        "statements": statements
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/dashboard-stats')
 def dashboard_stats():
     """Get dashboard statistics"""
@@ -1818,19 +4973,66 @@ def get_states():
     states = sds_assistant.get_states()
     return jsonify(states)
 
+def paged_response(result: Dict, key: str):
+    """A page of a listing as a JSON array, with the cursor for the next page in X-Next-Cursor"""
+    if not result["success"]:
+        return jsonify(result), 400 if result["message"] == "Invalid cursor" else 500
+    response = jsonify(result[key])
+    if result["next_cursor"]:
+        response.headers['X-Next-Cursor'] = result["next_cursor"]
+    return response
+
 @app.route('/api/locations')
 def get_locations():
-    """Get locations with optional filtering"""
+    """Get locations with optional filtering, paged by ?limit= and ?cursor= (from X-Next-Cursor)"""
     state_filter = request.args.get('state')
     search_term = request.args.get('search')
-    locations = sds_assistant.get_locations(state_filter, search_term)
-    return jsonify(locations)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    result = sds_assistant.get_locations(state_filter, search_term, limit, request.args.get('cursor'))
+    return paged_response(result, "locations")
+
+@app.route('/api/ghs-products')
+def get_ghs_products():
+    """Get products carrying all the given GHS codes, e.g. ?code=H225&city=Houston&department=Warehouse"""
+    codes = request.args.getlist('code')
+    if not codes:
+        return jsonify({"success": False, "message": "At least one code is required"})
+    
+    products = sds_assistant.find_ghs_products(
+        codes, request.args.get('location_id', type=int), request.args.get('state'),
+        request.args.get('city'), request.args.get('department'),
+        min(request.args.get('limit', 100, type=int), 1000))
+    return jsonify(products)
+
+@app.route('/api/hazards')
+def get_hazards():
+    """Get products by NFPA rating ranges (health_min, fire_max, ...), signal word and location, paged by cursor"""
+    filters = {f"{rating}_{bound}": request.args.get(f"{rating}_{bound}", type=int)
+               for rating in ("health", "fire", "reactivity") for bound in ("min", "max")}
+    filters.update({key: request.args.get(key) for key in ("signal_word", "state", "city", "department")})
+    filters["location_id"] = request.args.get('location_id', type=int)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    
+    result = sds_assistant.search_hazards(filters, limit, request.args.get('cursor'))
+    if not result["success"] and result.get("message") == "Invalid cursor":
+        return jsonify(result), 400
+    return jsonify(result)
 
 @app.route('/api/recent-documents')
 def get_recent_documents():
-    """Get recently uploaded documents"""
-    documents = sds_assistant.get_recent_documents()
-    return jsonify(documents)
+    """Get recently uploaded documents, paged by ?limit= and ?cursor= (from X-Next-Cursor)"""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    result = sds_assistant.get_recent_documents(limit, request.args.get('cursor'))
+    return paged_response(result, "documents")
+
+@app.route('/api/offline-bundle')
+def get_offline_bundle():
+    """Get a location's documents for offline use, added after ?since= (the version of the last sync)"""
+    location_id = request.args.get('location_id', type=int)
+    if location_id is None:
+        return jsonify({"success": False, "message": "location_id is required"}), 400
+    result = sds_assistant.get_offline_bundle(location_id, max(0, request.args.get('since', 0, type=int)))
+    return jsonify(result)
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -1847,7 +5049,14 @@ def upload_file():
     if file.filename == '':
         return jsonify({"success": False, "message": "No file selected"})
     
-    result = sds_assistant.upload_file(file, int(location_id))
+    # Stage updates go to the uploading browser's Socket.IO connection
+    socket_id = request.form.get('socket_id')
+    progress = None
+    if socket_id:
+        def progress(stage):
+            socketio.emit('upload_progress', {"stage": stage}, to=socket_id)
+    
+    result = sds_assistant.upload_file(file, int(location_id), progress=progress)
     return jsonify(result)
 
 @app.route('/api/ask-question', methods=['POST'])
@@ -1856,14 +5065,84 @@ def ask_question():
     data = request.json
     question = data.get('question')
     location_id = data.get('location_id')
-    user_session = session.get('user_id', 'anonymous')
+    # A random id per browser (in the signed session cookie) scopes follow-up context and history
+    user_session = session.setdefault('user_id', secrets.token_hex(16))
     
     if not question:
         return jsonify({"success": False, "answer": "Please provide a question"})
     
+    # Streaming mode: one JSON event per line as each product's answer is ready
+    if data.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+        events = sds_assistant.stream_answer(question, location_id, user_session)
+        return Response(
+            stream_with_context(json.dumps(event) + "\n" for event in events),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
     result = sds_assistant.answer_question(question, location_id, user_session)
     return jsonify(result)
 
+def json_list(data: Dict, key: str, item_type: type) -> Optional[list]:
+    """A request body field holding a list of item_type values ([] if absent), or None if it holds anything else"""
+    value = data.get(key)
+    if value is None:
+        return []
+    # bool is an int subclass, but true is not a location id
+    if not isinstance(value, list) or any(not isinstance(item, item_type) or isinstance(item, bool) for item in value):
+        return None
+    return value
+
+@app.route('/api/ask-batch', methods=['POST'])
+def ask_batch():
+    """Answer checklist questions for every product matching ?products and/or ?location_ids, one result per document"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "message": "Expected a JSON object"}), 400
+    if not data.get('location_ids') and data.get('location_id') is not None:
+        data = dict(data, location_ids=[data['location_id']])
+    questions = json_list(data, 'questions', str)
+    products = json_list(data, 'products', str)
+    location_ids = json_list(data, 'location_ids', int)
+    
+    for name, value, kind in (("questions", questions, "strings"), ("products", products, "strings"),
+                              ("location_ids", location_ids, "integers")):
+        if value is None:
+            return jsonify({"success": False, "message": f"{name} must be a list of {kind}"}), 400
+    questions = [question for question in questions if question.strip()]
+    products = [product for product in products if product.strip()]
+    
+    if not questions:
+        return jsonify({"success": False, "message": "Please provide at least one question"}), 400
+    if len(questions) > CHECKLIST_MAX_QUESTIONS:
+        return jsonify({"success": False, "message": f"At most {CHECKLIST_MAX_QUESTIONS} questions per batch"}), 400
+    if not products and not location_ids:
+        return jsonify({"success": False, "message": "Please provide products or locations"}), 400
+    
+    events = sds_assistant.stream_checklist(questions, products, location_ids)
+    if data.get('stream', True) or request.accept_mimetypes.best == 'application/x-ndjson':
+        return Response(
+            stream_with_context(json.dumps(event) + "\n" for event in events),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    # Non-streaming clients get the done event's summary with every result in it
+    results = []
+    summary = None
+    for event in events:
+        event_type = event.pop("type")
+        if event_type == "result":
+            results.append(event)
+        elif event_type == "done":
+            summary = event
+    if summary is None or not summary["success"]:
+        # Failed part way: the results so far are not the whole checklist
+        message = summary["message"] if summary else "Checklist ended without a result"
+        return jsonify({"success": False, "message": message}), 500
+    summary["results"] = results
+    return jsonify(summary)
+
 @app.route('/api/generate-nfpa', methods=['POST'])
 def generate_nfpa():
     """Generate NFPA sticker"""
@@ -1891,10 +5170,26 @@ def generate_ghs():
 @app.route('/api/download-sticker/<filename>')
 def download_sticker(filename):
     """Download generated sticker"""
-    try:
-        return send_file(f'static/stickers/{filename}', as_attachment=True)
-    except FileNotFoundError:
+    content = sds_assistant.get_sticker(filename)
+    if content is None:
         return jsonify({"error": "File not found"}), 404
+    
+    return send_file(
+        BytesIO(content.encode('utf-8')),
+        mimetype='image/svg+xml',
+        as_attachment=True,
+        download_name=filename
+    )
+
+# Socket.IO events
+@socketio.on('subscribe')
+def subscribe(data):
+    """Scope a client's new-document events to one location (or all)"""
+    location_id = (data or {}).get('location_id')
+    for room in rooms():
+        if room.startswith('location:'):
+            leave_room(room)
+    join_room(location_room(location_id))
 
 # Error handlers
 @app.errorhandler(404)
@@ -1920,24 +5215,4 @@ if __name__ == '__main__':
     print("🤖 AI-powered question answering enabled")
     print("📱 Mobile PWA ready")
     print()
-    app.run(debug=False, host='0.0.0.0', port=port)Upload = document.getElementById('cancelUpload');
-            
-            if (closeUploadModal) {
-                closeUploadModal.addEventListener('click', () => hideModal('uploadModal'));
-            }
-            
-            if (cancelUpload) {
-                cancelUpload.addEventListener('click', () => hideModal('uploadModal'));
-            }
-            
-            // Upload form
-            const uploadForm = document.getElementById('uploadForm');
-            if (uploadForm) {
-                uploadForm.addEventListener('submit', handleFileUpload);
-                console.log('Upload form listener added');
-            }
-            
-            // Sticker generation
-            const generateStickerBtn = document.getElementById('generateStickerBtn');
-            const closeStickerModal = document.getElementById('closeStickerModal');
-            const cancel
+    socketio.run(app, debug=False, host='0.0.0.0', port=port)
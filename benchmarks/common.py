@@ -0,0 +1,118 @@
+"""Shared helpers for the benchmark scripts."""
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+WORDS = ("solvent vapor container ventilation exposure mixture skin contact eyes "
+         "respiratory storage temperature ignition sources protective gloves goggles "
+         "spill absorbent disposal regulations toxic irritant flammable liquid").split()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, errors=0):
+    """Count, error count and latency percentiles (in ms) for a list of seconds"""
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies) if latencies else None),
+    }
+
+
+def synthetic_text(rng, product, size_kb):
+    """Filler SDS text with a product name the asks will match"""
+    sentences = []
+    size = 0
+    while size < size_kb * 1024:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(14)).capitalize() + "."
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return (f"Product Name: {product}\nManufacturer: Benchmark Chemicals\n"
+            f"NFPA Health: 2\nNFPA Fire: 3\nNFPA Reactivity: 0\n"
+            f"Section 4 First aid measures. Rinse with water.\n" + " ".join(sentences))
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workdir, workers=1, port=None, env=None, extra_args=()):
+    """Start the production entry point (gunicorn + eventlet) serving from workdir"""
+    port = port or free_port()
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--worker-class", "eventlet",
+        "-w", str(workers),
+        "--bind", f"127.0.0.1:{port}",
+        "--chdir", str(workdir),
+        "--pythonpath", str(REPO_ROOT),
+        "--log-level", "warning",
+        *extra_args,
+        "app:app",
+    ]
+    process_env = dict(os.environ, **(env or {}))
+    process = subprocess.Popen(command, env=process_env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_ready(base_url, process)
+    return process, base_url
+
+
+def wait_ready(base_url, process=None, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not become ready")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def upload_text(http, base_url, name, text, location_id=1):
+    return http.post(f"{base_url}/api/upload",
+                     data={"location_id": str(location_id)},
+                     files={"file": (name, text.encode(), "text/plain")})
+
+
+def seed_over_http(base_url, documents, size_kb, seed=27):
+    """Upload synthetic documents through the API"""
+    rng = random.Random(seed)
+    http = requests.Session()
+    for i in range(documents):
+        text = synthetic_text(rng, f"Benchmark Solvent {i}", size_kb)
+        upload_text(http, base_url, f"seed_{i}.txt", text, location_id=1 + i % 50)
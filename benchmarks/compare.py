@@ -0,0 +1,56 @@
+"""Compare two suite.py result files and flag regressions.
+
+Walks both reports, pairs up every latency percentile and throughput figure,
+and prints the change. Exits with status 1 if any latency grew (or any
+throughput fell) by more than --threshold percent:
+
+    python benchmarks/compare.py base.json head.json --threshold 15
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_KEYS = ("documents_per_second", "megabytes_per_second", "throughput_rps")
+
+
+def flatten(node, prefix=""):
+    """(path, key, value) for every numeric leaf we know how to compare"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            path = f"{prefix}.{key}" if prefix else key
+            if key in LATENCY_KEYS + THROUGHPUT_KEYS and isinstance(value, (int, float)):
+                yield prefix, key, value
+            else:
+                yield from flatten(value, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    print(f"base {base['meta'].get('commit')}  head {head['meta'].get('commit')}")
+
+    head_values = {(path, key): value for path, key, value in flatten(head["results"])}
+    regressions = 0
+    for path, key, before in flatten(base["results"]):
+        after = head_values.get((path, key))
+        if after is None or not before:
+            continue
+        change = (after - before) / before * 100
+        worse = change > args.threshold if key in LATENCY_KEYS else change < -args.threshold
+        regressions += worse
+        print(f"{'!!' if worse else '  '} {path:<40} {key:<22} {before:>10} -> {after:>10}  {change:+7.1f}%")
+    print(f"{regressions} regression(s) over {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
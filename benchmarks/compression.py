@@ -0,0 +1,107 @@
+"""Bytes saved and worker CPU spent by JSON response compression.
+
+Preloads the synthetic corpus, starts the production entry point (gunicorn,
+eventlet worker) and requests each JSON endpoint with Accept-Encoding set to
+identity, gzip and br. For every endpoint and encoding it reports the body
+size on the wire, the request latency, and the worker's own compression time
+taken from the "compress" entry of the Server-Timing header:
+
+    python benchmarks/compression.py --documents 2000 --output compression.json
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+from common import start_gunicorn, stop_server, summarize
+from corpus import CHEMICALS
+from suite import FREE_FORM_QUESTIONS, preload
+
+ENCODINGS = ("identity", "gzip", "br")
+
+
+def endpoints(rng):
+    """(name, method, path, json body or query params) of the payloads phones fetch"""
+    return (
+        ("ask-question (product)", "post", "/api/ask-question", lambda: {"question": rng.choice(CHEMICALS)[0]}),
+        ("ask-question (free form)", "post", "/api/ask-question", lambda: {"question": rng.choice(FREE_FORM_QUESTIONS)}),
+        ("locations (500)", "get", "/api/locations", lambda: {"limit": 500}),
+        ("locations (state)", "get", "/api/locations", lambda: {"state": "Texas"}),
+        ("recent-documents", "get", "/api/recent-documents", lambda: {"limit": 50}),
+        ("hazards (200)", "get", "/api/hazards", lambda: {"health_min": 3, "limit": 200}),
+        ("dashboard-stats", "get", "/api/dashboard-stats", lambda: None),
+    )
+
+
+def server_timing(header, name):
+    match = re.search(rf"(?:^|, ){name};dur=([\d.]+)", header or "")
+    return float(match.group(1)) / 1000 if match else None
+
+
+def measure(http, base_url, method, path, payload, encoding):
+    headers = {"Accept-Encoding": encoding}
+    args = {"json": payload} if method == "post" else {"params": payload}
+    start = time.perf_counter()
+    response = getattr(http, method)(f"{base_url}{path}", headers=headers, stream=True, **args)
+    wire = response.raw.read(decode_content=False)
+    elapsed = time.perf_counter() - start
+    return {
+        "ok": response.status_code == 200,
+        "wire_bytes": len(wire),
+        "encoding": response.headers.get("Content-Encoding", "identity"),
+        "seconds": elapsed,
+        "compress_seconds": server_timing(response.headers.get("Server-Timing"), "compress"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000, help="corpus documents preloaded")
+    parser.add_argument("--seed", type=int, default=33)
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint and encoding")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sds-compression-")
+    preload(workdir, args.documents, args.seed, 0)
+    process, base_url = start_gunicorn(workdir, env={"SDS_DASHBOARD_CACHE_SECONDS": "0", "SDS_RETRIEVAL": "fts"})
+    report = {"config": vars(args), "endpoints": {}}
+    try:
+        http = requests.Session()
+        for name, method, path, payload in endpoints(random.Random(args.seed)):
+            results = {}
+            for encoding in ENCODINGS:
+                samples = [measure(http, base_url, method, path, payload(), encoding) for _ in range(args.requests)]
+                used = {sample["encoding"] for sample in samples}
+                compress = [sample["compress_seconds"] for sample in samples if sample["compress_seconds"] is not None]
+                results[encoding] = {
+                    "served_as": sorted(used),
+                    "mean_wire_bytes": round(sum(sample["wire_bytes"] for sample in samples) / len(samples)),
+                    "latency": summarize([sample["seconds"] for sample in samples],
+                                         sum(not sample["ok"] for sample in samples)),
+                    "worker_compress": summarize(compress) if compress else None,
+                }
+            identity = results["identity"]["mean_wire_bytes"]
+            for encoding in ENCODINGS[1:]:
+                results[encoding]["bytes_saved_pct"] = \
+                    round(100 * (1 - results[encoding]["mean_wire_bytes"] / identity), 1) if identity else None
+            report["endpoints"][name] = results
+            print(f"{name}: {identity} B -> gzip {results['gzip']['mean_wire_bytes']} B, "
+                  f"br {results['br']['mean_wire_bytes']} B", file=sys.stderr)
+    finally:
+        stop_server(process)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Latency of cheap requests while slow asks and uploads are in flight.
+
+Runs the app on an in-process eventlet WSGI server (the same hub model as the
+gunicorn eventlet worker), keeps a number of slow asks and uploads going, and
+samples /api/states and /api/dashboard-stats alongside them. Each run is done
+twice, with the blocking work pool enabled and disabled, so the p99 numbers
+can be compared directly:
+
+    python benchmarks/concurrency.py --duration 10 --output concurrency.json
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import eventlet.wsgi
+import requests
+
+from common import REPO_ROOT, summarize, synthetic_text
+
+
+def seed(assistant, documents, size_kb):
+    rng = random.Random(26)
+    for i in range(documents):
+        text = synthetic_text(rng, f"Benchmark Solvent {i}", size_kb)
+        chem_info = assistant.extract_chemical_info(text)
+        assistant.store_document({
+            "filename": f"seed_{i}.txt",
+            "original_filename": f"seed_{i}.txt",
+            "file_hash": f"seed-{i}",
+            "file_url": None,
+            "full_text": text,
+            "location_id": 1 + i % 50,
+            "file_size": len(text),
+            "uploaded_by": "benchmark"
+        }, chem_info)
+
+
+def run_phase(base_url, duration, slow_clients, probe_interval, size_kb):
+    deadline = time.time() + duration
+    results = {"probe": [], "ask": [], "upload": []}
+    errors = {"probe": 0, "ask": 0, "upload": 0}
+    rng = random.Random(7)
+
+    def timed(kind, fn):
+        start = time.perf_counter()
+        try:
+            response = fn()
+            if response.status_code != 200:
+                errors[kind] += 1
+        except requests.RequestException:
+            errors[kind] += 1
+        results[kind].append(time.perf_counter() - start)
+
+    def asker():
+        http = requests.Session()
+        while time.time() < deadline:
+            timed("ask", lambda: http.post(f"{base_url}/api/ask-question",
+                                           json={"question": "container ventilation"}))
+
+    def uploader(worker_id):
+        http = requests.Session()
+        n = 0
+        while time.time() < deadline:
+            n += 1
+            body = synthetic_text(rng, f"Upload {worker_id}-{n}-{time.time()}", size_kb)
+            timed("upload", lambda: http.post(
+                f"{base_url}/api/upload",
+                data={"location_id": "1"},
+                files={"file": (f"upload_{worker_id}_{n}.txt", body.encode(), "text/plain")}))
+
+    def prober():
+        http = requests.Session()
+        paths = ["/api/states", "/api/dashboard-stats"]
+        i = 0
+        while time.time() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            timed("probe", lambda: http.get(f"{base_url}{path}"))
+            eventlet.sleep(probe_interval)
+
+    pool = eventlet.GreenPool()
+    for i in range(slow_clients):
+        pool.spawn(asker)
+        pool.spawn(uploader, i)
+    pool.spawn(prober)
+    pool.waitall()
+    return {kind: summarize(results[kind], errors[kind]) for kind in results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--documents", type=int, default=200, help="documents to seed")
+    parser.add_argument("--doc-kb", type=int, default=200, help="size of each seeded document")
+    parser.add_argument("--slow-clients", type=int, default=4, help="concurrent askers and uploaders")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sds-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    import app as sds_app
+
+    seed(sds_app.sds_assistant, args.documents, args.doc_kb)
+
+    sock = eventlet.listen(("127.0.0.1", 0))
+    base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    eventlet.spawn(eventlet.wsgi.server, sock, sds_app.app, log=open(os.devnull, "w"))
+
+    report = {"config": vars(args), "phases": {}}
+    for mode, enabled in (("offloaded", True), ("blocking", False)):
+        sds_app.work_pool.enabled = enabled
+        report["phases"][mode] = run_phase(base_url, args.duration, args.slow_clients,
+                                           args.probe_interval, args.doc_kb)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
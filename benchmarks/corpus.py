@@ -0,0 +1,420 @@
+"""Deterministic synthetic SDS corpus.
+
+Every document is a 16-section safety data sheet for one of a catalogue of
+common industrial chemicals (real CAS and UN numbers, NFPA ratings, GHS signal
+word, H/P statements and pictograms), branded and numbered so that product
+names are unique. Document N depends only on (seed, N), so a 1k corpus is a
+prefix of the 100k one and any document can be regenerated on its own.
+
+    # write files (txt, pdf or a mix) plus manifest.jsonl with the ground truth
+    python benchmarks/corpus.py write --documents 1000 --format mixed --out /tmp/sds-corpus
+
+    # load straight into the app database under a working directory (no HTTP)
+    python benchmarks/corpus.py load --documents 10000 --workdir /tmp/sds-bench
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# populate_us_cities creates this many locations, with ids 1..N
+LOCATION_COUNT = 1064
+
+# name, CAS, UN number, (health, fire, reactivity, special), signal word, H codes, physical state
+CHEMICALS = (
+    ("Acetone", "67-64-1", "UN1090", (1, 3, 0, ""), "Danger", ("H225", "H319", "H336"), "liquid"),
+    ("Methanol", "67-56-1", "UN1230", (1, 3, 0, ""), "Danger", ("H225", "H301", "H311", "H331", "H370"), "liquid"),
+    ("Toluene", "108-88-3", "UN1294", (2, 3, 0, ""), "Danger", ("H225", "H304", "H315", "H336", "H361d", "H373"), "liquid"),
+    ("Isopropyl Alcohol", "67-63-0", "UN1219", (1, 3, 0, ""), "Danger", ("H225", "H319", "H336"), "liquid"),
+    ("Ethanol", "64-17-5", "UN1170", (2, 3, 0, ""), "Danger", ("H225", "H319"), "liquid"),
+    ("Xylene", "1330-20-7", "UN1307", (2, 3, 0, ""), "Warning", ("H226", "H304", "H312", "H332", "H315", "H319", "H335", "H373"), "liquid"),
+    ("Mineral Spirits", "64742-88-7", "UN1268", (1, 2, 0, ""), "Danger", ("H226", "H304", "H336"), "liquid"),
+    ("Diesel Fuel", "68476-34-6", "UN1202", (1, 2, 0, ""), "Danger", ("H226", "H304", "H315", "H332", "H351", "H373", "H411"), "liquid"),
+    ("Sodium Hydroxide", "1310-73-2", "UN1823", (3, 0, 1, ""), "Danger", ("H290", "H314"), "solid"),
+    ("Hydrochloric Acid", "7647-01-0", "UN1789", (3, 0, 1, ""), "Danger", ("H290", "H314", "H335"), "liquid"),
+    ("Sulfuric Acid", "7664-93-9", "UN1830", (3, 0, 2, "W"), "Danger", ("H290", "H314"), "liquid"),
+    ("Nitric Acid", "7697-37-2", "UN2031", (4, 0, 0, "OX"), "Danger", ("H272", "H290", "H314", "H331"), "liquid"),
+    ("Ammonium Hydroxide", "1336-21-6", "UN2672", (3, 1, 0, ""), "Danger", ("H314", "H335", "H400"), "liquid"),
+    ("Hydrogen Peroxide", "7722-84-1", "UN2014", (3, 0, 1, "OX"), "Danger", ("H271", "H302", "H314", "H332", "H335"), "liquid"),
+    ("Sodium Hypochlorite", "7681-52-9", "UN1791", (3, 0, 1, ""), "Danger", ("H290", "H314", "H400"), "liquid"),
+    ("Propane", "74-98-6", "UN1978", (2, 4, 0, ""), "Danger", ("H220", "H280"), "gas"),
+    ("Ethylene Glycol", "107-21-1", "UN3082", (2, 1, 0, ""), "Warning", ("H302", "H373"), "liquid"),
+    ("Citric Acid", "77-92-9", "UN3077", (2, 1, 0, ""), "Warning", ("H319",), "solid"),
+    ("Calcium Chloride", "10043-52-4", "UN3077", (2, 0, 0, ""), "Warning", ("H319",), "solid"),
+    ("Glycerin", "56-81-5", "", (1, 1, 0, ""), "", (), "liquid"),
+)
+
+H_STATEMENTS = {
+    "H220": "Extremely flammable gas.",
+    "H225": "Highly flammable liquid and vapour.",
+    "H226": "Flammable liquid and vapour.",
+    "H271": "May cause fire or explosion; strong oxidiser.",
+    "H272": "May intensify fire; oxidiser.",
+    "H280": "Contains gas under pressure; may explode if heated.",
+    "H290": "May be corrosive to metals.",
+    "H301": "Toxic if swallowed.",
+    "H302": "Harmful if swallowed.",
+    "H304": "May be fatal if swallowed and enters airways.",
+    "H311": "Toxic in contact with skin.",
+    "H312": "Harmful in contact with skin.",
+    "H314": "Causes severe skin burns and eye damage.",
+    "H315": "Causes skin irritation.",
+    "H319": "Causes serious eye irritation.",
+    "H331": "Toxic if inhaled.",
+    "H332": "Harmful if inhaled.",
+    "H335": "May cause respiratory irritation.",
+    "H336": "May cause drowsiness or dizziness.",
+    "H351": "Suspected of causing cancer.",
+    "H361d": "Suspected of damaging the unborn child.",
+    "H370": "Causes damage to organs.",
+    "H373": "May cause damage to organs through prolonged or repeated exposure.",
+    "H400": "Very toxic to aquatic life.",
+    "H411": "Toxic to aquatic life with long lasting effects.",
+}
+
+# H-code prefixes -> precautionary statements, in the order they are listed
+P_CODES = (
+    (("H22",), ("P210", "P233", "P240", "P241", "P280", "P303+P361+P353", "P370+P378", "P403+P235")),
+    (("H27",), ("P210", "P220", "P280", "P370+P378")),
+    (("H280",), ("P410+P403",)),
+    (("H290",), ("P234", "P390")),
+    (("H301", "H311", "H331", "H370"), ("P260", "P264", "P270", "P301+P310", "P304+P340", "P311")),
+    (("H302", "H312", "H332"), ("P261", "P264", "P270", "P301+P312", "P304+P340")),
+    (("H304",), ("P301+P310", "P331")),
+    (("H314",), ("P260", "P264", "P280", "P301+P330+P331", "P303+P361+P353", "P305+P351+P338", "P310")),
+    (("H315", "H319"), ("P264", "P280", "P305+P351+P338", "P332+P313", "P337+P313")),
+    (("H335", "H336"), ("P261", "P271", "P304+P340", "P312")),
+    (("H351", "H361", "H373"), ("P201", "P202", "P260", "P308+P313")),
+    (("H400", "H411"), ("P273", "P391", "P501")),
+)
+
+# H-code prefixes -> GHS pictogram codes
+PICTOGRAMS = (
+    (("H220", "H225", "H226"), "GHS02"),
+    (("H271", "H272"), "GHS03"),
+    (("H280",), "GHS04"),
+    (("H290", "H314"), "GHS05"),
+    (("H301", "H311", "H331"), "GHS06"),
+    (("H302", "H312", "H315", "H319", "H332", "H335", "H336"), "GHS07"),
+    (("H304", "H351", "H361", "H370", "H373"), "GHS08"),
+    (("H400", "H411"), "GHS09"),
+)
+
+BRANDS = ("Apex", "Summit", "Keystone", "Ironclad", "Bluewater", "Prairie", "Northstar", "Redline",
+          "Granite", "Harbor", "Pioneer", "Sterling", "Cascade", "Lakeside", "Frontier", "Meridian")
+GRADES = ("Technical Grade", "Reagent Grade", "Industrial", "Lab Grade", "Solution", "Concentrate", "Blend")
+MANUFACTURERS = (
+    ("Benchmark Chemicals Inc.", "1200 Industrial Parkway, Houston, TX 77001"),
+    ("Lone Star Solvents LLC", "45 Refinery Road, Baytown, TX 77520"),
+    ("Great Lakes Chemical Supply", "800 Harbor Drive, Cleveland, OH 44114"),
+    ("Pacific Coast Reagents", "2150 Bay Street, Oakland, CA 94607"),
+    ("Mountain States Industrial", "77 Quarry Lane, Denver, CO 80216"),
+    ("Atlantic Process Chemicals", "300 Dock Street, Newark, NJ 07105"),
+    ("Heartland Chemical Co.", "19 Elevator Road, Omaha, NE 68102"),
+    ("Gulf South Distribution", "6400 Canal Boulevard, New Orleans, LA 70124"),
+)
+FILLER = ("the test substance was administered under controlled laboratory conditions and the animals were "
+          "observed daily for clinical signs body weight changes and behavioural effects no additional findings "
+          "were recorded beyond those described above and the study was conducted according to accepted "
+          "guidelines with appropriate controls").split()
+
+
+def p_codes_for(h_codes):
+    codes = []
+    for prefixes, p_list in P_CODES:
+        if any(h.startswith(prefixes) for h in h_codes):
+            codes.extend(p for p in p_list if p not in codes)
+    return codes
+
+
+def pictograms_for(h_codes):
+    found = [code for prefixes, code in PICTOGRAMS if any(h.startswith(prefixes) for h in h_codes)]
+    if "GHS06" in found and "GHS07" in found:
+        found.remove("GHS07")
+    return found
+
+
+def location_for(rng, locations=LOCATION_COUNT):
+    """Skewed placement: a few busy sites hold most of the documents"""
+    busy = max(1, locations // 20)
+    if rng.random() < 0.8:
+        return 1 + rng.randrange(busy)
+    return 1 + busy + rng.randrange(locations - busy)
+
+
+def filler_paragraph(rng, words=120):
+    return " ".join(rng.choice(FILLER) for _ in range(words)).capitalize() + "."
+
+
+def generate_document(index, seed=33, pad_kb=0, locations=LOCATION_COUNT):
+    """One synthetic SDS: its text plus the ground truth it was built from"""
+    rng = random.Random(f"{seed}:{index}")
+    name, cas, un_number, nfpa, signal_word, h_codes, state = CHEMICALS[rng.randrange(len(CHEMICALS))]
+    health, fire, reactivity, special = nfpa
+    manufacturer, address = MANUFACTURERS[rng.randrange(len(MANUFACTURERS))]
+    product_name = f"{rng.choice(BRANDS)} {name} {rng.choice(GRADES)} {index:06d}"
+    concentration = rng.choice((100, 99, 95, 90, 70, 50, 35, 10)) if state != "gas" else 100
+    p_codes = p_codes_for(h_codes)
+    pictograms = pictograms_for(h_codes)
+    flammable = fire >= 2
+    corrosive = "H314" in h_codes
+    toxic = any(h in h_codes for h in ("H301", "H311", "H331", "H370"))
+    revision = f"{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    flash_point = rng.randint(-40, 60) if flammable else None
+    exposure_limit = rng.choice((1, 2, 5, 10, 20, 50, 100, 200, 250, 500, 1000))
+
+    eye = ("Immediately flush eyes with plenty of water for at least 15 minutes, lifting upper and lower eyelids. "
+           "Remove contact lenses if present and easy to do. Get immediate medical attention."
+           if corrosive else
+           "Rinse cautiously with water for several minutes. Remove contact lenses if present and easy to do. "
+           "If eye irritation persists, get medical advice.")
+    skin = ("Immediately take off all contaminated clothing and rinse skin with water or shower for at least 15 minutes. "
+            "Chemical burns must be treated by a physician."
+            if corrosive else
+            "Wash skin with soap and plenty of water. Remove contaminated clothing and wash before reuse.")
+    inhalation = ("Remove person to fresh air and keep comfortable for breathing. "
+                  + ("Call a poison center or doctor immediately." if toxic or corrosive else
+                     "Call a poison center or doctor if you feel unwell."))
+    ingestion = ("Rinse mouth. Do NOT induce vomiting. "
+                 + ("Immediately call a poison center or doctor." if toxic or corrosive or "H304" in h_codes else
+                    "Call a poison center or doctor if you feel unwell."))
+    if flammable:
+        extinguish = "Use alcohol-resistant foam, dry chemical, carbon dioxide or water spray. Do not use a solid water stream, which may spread the fire."
+        fire_hazard = "Vapours are heavier than air and may travel to a source of ignition and flash back. Containers may explode when heated."
+    elif special == "OX":
+        extinguish = "Use flooding quantities of water. Do not use dry chemical or foam containing organic material."
+        fire_hazard = "Strong oxidiser: contact with combustible material may cause fire. Decomposition releases oxygen and toxic fumes."
+    else:
+        extinguish = "Use extinguishing media appropriate for the surrounding fire."
+        fire_hazard = "Not flammable. Thermal decomposition may release irritating or corrosive gases."
+    gloves = rng.choice(("nitrile", "neoprene", "butyl rubber", "Viton"))
+    respirator = ("Use a NIOSH-approved respirator with organic vapour cartridges if exposure limits are exceeded."
+                  if flammable else
+                  "Use a NIOSH-approved respirator with acid gas cartridges if mists or vapours are generated."
+                  if corrosive else
+                  "Respiratory protection is not required under normal use with adequate ventilation.")
+    storage = ("Keep container tightly closed in a cool, well-ventilated place away from heat, sparks and open flames. "
+               "Store in a flammables cabinet. Ground and bond containers when transferring material."
+               if flammable else
+               "Store in a corrosion-resistant container with a resistant inner liner. Keep away from incompatible materials such as acids, bases and metals."
+               if corrosive else
+               "Store in a dry, well-ventilated place. Keep container tightly closed.")
+
+    hazards = "\n".join(f"{code}: {H_STATEMENTS[code]}" for code in h_codes) or "Not a hazardous substance or mixture."
+    sections = [
+        ("Identification",
+         f"Product Name: {product_name}\nSynonyms: {name}\nRecommended use: Industrial and laboratory use.\n"
+         f"Manufacturer: {manufacturer}\nAddress: {address}\n"
+         f"Emergency telephone: 1-800-555-{rng.randint(1000, 9999)}"),
+        ("Hazard(s) identification",
+         f"GHS classification according to 29 CFR 1910.1200.\nSignal word: {signal_word or 'None'}\n"
+         f"Pictograms: {', '.join(pictograms) or 'None'}\nHazard statements:\n{hazards}\n"
+         f"Precautionary statements: {' '.join(p_codes) or 'None'}"),
+        ("Composition/information on ingredients",
+         f"Chemical name: {name}\nCAS #: {cas}\nConcentration: {concentration}%"),
+        ("First aid measures",
+         f"Eye contact: {eye}\nSkin contact: {skin}\nInhalation: {inhalation}\nIngestion: {ingestion}"),
+        ("Fire-fighting measures",
+         f"Suitable extinguishing media: {extinguish}\nSpecific hazards: {fire_hazard}\n"
+         "Firefighters should wear self-contained breathing apparatus and full protective gear."),
+        ("Accidental release measures",
+         "Evacuate unnecessary personnel and ventilate the area. Contain the spill with an inert absorbent such as sand "
+         "or vermiculite and place in a suitable container for disposal. Prevent entry into drains and waterways."),
+        ("Handling and storage",
+         f"Avoid contact with eyes, skin and clothing. Avoid breathing vapours or mists. {storage}"),
+        ("Exposure controls/personal protection",
+         f"Occupational exposure limit: {exposure_limit} ppm TWA.\nEngineering controls: Use local exhaust ventilation.\n"
+         f"Eye protection: Chemical splash goggles{' and a face shield' if corrosive else ''}.\n"
+         f"Hand protection: {gloves} gloves.\nRespiratory protection: {respirator}"),
+        ("Physical and chemical properties",
+         f"Physical state: {state}\nFlash point: {f'{flash_point} C' if flash_point is not None else 'Not applicable'}\n"
+         f"Boiling point: {rng.randint(40, 340)} C\nSpecific gravity: {rng.uniform(0.6, 1.9):.2f}"),
+        ("Stability and reactivity",
+         "Stable under recommended storage conditions. Avoid heat, flames and sparks. "
+         "Incompatible materials: strong oxidising agents, strong acids and strong bases."),
+        ("Toxicological information",
+         f"Routes of exposure: inhalation, skin, eyes, ingestion.\nAcute oral LD50 (rat): {rng.randint(50, 9000)} mg/kg."),
+        ("Ecological information",
+         "Very toxic to aquatic organisms." if any(h.startswith("H4") for h in h_codes)
+         else "No significant ecological effects are expected at normal use levels."),
+        ("Disposal considerations",
+         "Dispose of contents and container in accordance with local, regional and national regulations."),
+        ("Transport information",
+         f"UN number: {un_number or 'Not regulated'}\nProper shipping name: {name.upper()}"),
+        ("Regulatory information",
+         f"TSCA: Listed.\nNFPA Health: {health}\nNFPA Fire: {fire}\nNFPA Reactivity: {reactivity}"
+         + (f"\nNFPA Special: {special}" if special else "")),
+        ("Other information",
+         f"Revision date: {revision}. The information above is believed to be accurate but is not all-inclusive."),
+    ]
+    if pad_kb:
+        # Long toxicology study summaries, which is where real SDSs get long
+        padding = []
+        size = 0
+        while size < pad_kb * 1024:
+            paragraph = filler_paragraph(rng)
+            padding.append(paragraph)
+            size += len(paragraph) + 1
+        title, body = sections[10]
+        sections[10] = (title, body + "\n" + "\n".join(padding))
+
+    text = "SAFETY DATA SHEET\n" + "\n".join(
+        f"SECTION {number}: {title}\n{body}" for number, (title, body) in enumerate(sections, start=1))
+    return {
+        "index": index,
+        "product_name": product_name,
+        "chemical": name,
+        "manufacturer": manufacturer,
+        "cas_number": cas,
+        "un_number": un_number,
+        "nfpa": {"health": health, "fire": fire, "reactivity": reactivity, "special": special},
+        "signal_word": signal_word,
+        "h_codes": list(h_codes),
+        "p_codes": p_codes,
+        "pictograms": pictograms,
+        "location_id": location_for(rng, locations),
+        "sections": {number: body for number, (_, body) in enumerate(sections, start=1)},
+        "text": text,
+    }
+
+
+def iter_corpus(documents, seed=33, pad_kb=0, start=0):
+    for index in range(start, start + documents):
+        yield generate_document(index, seed=seed, pad_kb=pad_kb)
+
+
+def wrap(line, width):
+    while len(line) > width:
+        cut = line.rfind(" ", 0, width)
+        cut = cut if cut > 0 else width
+        yield line[:cut]
+        line = line[cut:].lstrip()
+    yield line
+
+
+def render_pdf(text, lines_per_page=64, width=100):
+    """A minimal text-only PDF (Helvetica, one text object per page) that PyPDF2 can read back"""
+    lines = [piece for line in text.split("\n") for piece in wrap(line, width)]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1", "replace")
+
+    objects = []  # object bodies, numbered from 1
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(None)  # pages tree, filled in once the page objects are numbered
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    page_ids = []
+    for page in pages:
+        stream = b"BT /F1 9 Tf 11 TL 40 800 Td\n" + b"".join(b"(" + escape(line) + b") Tj T*\n" for line in page) + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def file_format(index, fmt):
+    if fmt == "mixed":
+        return "pdf" if index % 4 == 0 else "txt"
+    return fmt
+
+
+def document_bytes(document, fmt):
+    """Filename and file content for a generated document"""
+    kind = file_format(document["index"], fmt)
+    name = f"sds_{document['index']:06d}.{kind}"
+    if kind == "pdf":
+        return name, render_pdf(document["text"])
+    return name, document["text"].encode("utf-8")
+
+
+def manifest_record(document, filename=None):
+    record = {key: value for key, value in document.items() if key not in ("text", "sections")}
+    if filename:
+        record["filename"] = filename
+    return record
+
+
+def write_corpus(out_dir, documents, fmt="txt", seed=33, pad_kb=0):
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    with open(out / "manifest.jsonl", "w") as manifest:
+        for document in iter_corpus(documents, seed, pad_kb):
+            name, content = document_bytes(document, fmt)
+            (out / name).write_bytes(content)
+            manifest.write(json.dumps(manifest_record(document, name)) + "\n")
+
+
+def load_corpus(workdir, documents, seed=33, pad_kb=0, start=0, progress_every=1000):
+    """Insert documents directly into the app database under workdir, as an upload would"""
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    import app as sds_app
+
+    assistant = sds_app.sds_assistant
+    started = time.perf_counter()
+    with open("corpus_manifest.jsonl", "a") as manifest:
+        for count, document in enumerate(iter_corpus(documents, seed, pad_kb, start), start=1):
+            text = document["text"]
+            name = f"sds_{document['index']:06d}.txt"
+            assistant.store_document({
+                "filename": name,
+                "original_filename": name,
+                "file_hash": f"corpus-{seed}-{document['index']}-{pad_kb}",
+                "file_url": None,
+                "full_text": text,
+                "location_id": document["location_id"],
+                "file_size": len(text),
+                "uploaded_by": "corpus"
+            }, assistant.extract_chemical_info(text))
+            manifest.write(json.dumps(manifest_record(document, name)) + "\n")
+            if progress_every and count % progress_every == 0:
+                print(f"loaded {count}/{documents} documents ({count / (time.perf_counter() - started):.0f}/s)",
+                      file=sys.stderr)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    write = commands.add_parser("write", help="write documents as files plus manifest.jsonl")
+    write.add_argument("--out", required=True)
+    write.add_argument("--format", choices=("txt", "pdf", "mixed"), default="txt")
+    load = commands.add_parser("load", help="insert documents into the app database in --workdir")
+    load.add_argument("--workdir", default=".")
+    load.add_argument("--start", type=int, default=0, help="index of the first document")
+    for command in (write, load):
+        command.add_argument("--documents", type=int, default=1000)
+        command.add_argument("--seed", type=int, default=33)
+        command.add_argument("--pad-kb", type=int, default=0, help="extra toxicology text per document")
+    args = parser.parse_args()
+
+    if args.command == "write":
+        write_corpus(args.out, args.documents, args.format, args.seed, args.pad_kb)
+    else:
+        seconds = load_corpus(args.workdir, args.documents, args.seed, args.pad_kb, args.start)
+        print(json.dumps({"documents": args.documents, "seconds": round(seconds, 2)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Concurrent phone-user load test against the gunicorn/eventlet entry point.
+
+Each simulated user behaves like the page script: it opens the page (the HTML
+shell plus dashboard stats, states, locations and recent documents), then loops
+over a weighted mix of actions with exponential think time between them:
+streamed asks, picking a state, refreshing the dashboard, uploading an SDS and
+generating/downloading a sticker. Concurrency is stepped through --users, and
+each step reports throughput and per-endpoint p50/p95/p99 latency and error
+rate. Everything runs on localhost:
+
+    python benchmarks/load_test.py --users 10 50 100 --duration 30 --output load.json
+
+Use --url to drive an already running server instead of starting one. The
+client threads share the machine with the server, so on small machines the
+absolute numbers understate what a dedicated worker can do.
+"""
+import argparse
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from common import percentile, start_gunicorn, stop_server, summarize, wait_ready
+from corpus import CHEMICALS, document_bytes, generate_document
+from suite import FREE_FORM_QUESTIONS, preload
+
+# action, weight
+ACTIONS = (
+    ("ask", 45),
+    ("choose_state", 20),
+    ("refresh_dashboard", 15),
+    ("sticker", 10),
+    ("upload", 5),
+    ("reload_page", 5),
+)
+
+# Upload documents come from far above any preloaded corpus, never repeating within a run
+UPLOAD_INDEX = itertools.count(10_000_000)
+
+STATES = ("Texas", "California", "Ohio", "New York", "Florida", "Illinois", "Louisiana")
+
+
+class Recorder:
+    """Latencies and errors per endpoint, shared by all user threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + (not ok)
+
+    def timed(self, endpoint, send):
+        start = time.perf_counter()
+        try:
+            response = send()
+            ok = response.status_code == 200
+        except requests.RequestException:
+            response, ok = None, False
+        self.record(endpoint, time.perf_counter() - start, ok)
+        return response if ok else None
+
+
+class User:
+    """One simulated phone user"""
+
+    def __init__(self, user_id, base_url, recorder, args):
+        self.rng = random.Random(user_id)
+        self.base_url = base_url
+        self.recorder = recorder
+        self.args = args
+        self.http = requests.Session()
+        self.actions = [name for name, weight in ACTIONS for _ in range(weight)]
+
+    def get(self, endpoint, path, **params):
+        return self.recorder.timed(endpoint, lambda: self.http.get(f"{self.base_url}{path}", params=params or None))
+
+    def reload_page(self):
+        self.get("page", "/")
+        for endpoint in ("dashboard-stats", "states", "locations", "recent-documents"):
+            self.get(endpoint, f"/api/{endpoint}")
+
+    def choose_state(self):
+        self.get("locations?state", "/api/locations", state=self.rng.choice(STATES))
+
+    def refresh_dashboard(self):
+        self.get("dashboard-stats", "/api/dashboard-stats")
+
+    def ask(self):
+        """Streamed ask as the page sends it; also records time to the first event"""
+        if self.rng.random() < 0.5:
+            question = self.rng.choice(FREE_FORM_QUESTIONS)
+        else:
+            question = self.rng.choice(CHEMICALS)[0]
+        start = time.perf_counter()
+        ok = False
+        try:
+            with self.http.post(f"{self.base_url}/api/ask-question", stream=True,
+                                headers={"Accept": "application/x-ndjson"},
+                                json={"question": question, "stream": True}) as response:
+                first = None
+                for line in response.iter_lines():
+                    if line and first is None:
+                        first = time.perf_counter() - start
+                        self.recorder.record("ask-question (first event)", first, True)
+                ok = response.status_code == 200
+        except requests.RequestException:
+            pass
+        self.recorder.record("ask-question", time.perf_counter() - start, ok)
+
+    def sticker(self):
+        kind = self.rng.choice(("nfpa", "ghs"))
+        product = self.rng.choice(CHEMICALS)[0]
+        response = self.recorder.timed(f"generate-{kind}", lambda: self.http.post(
+            f"{self.base_url}/api/generate-{kind}", json={"product_name": product}))
+        if response is not None and response.json().get("success"):
+            self.get("download-sticker", f"/api/download-sticker/{response.json()['filename']}")
+
+    def upload(self):
+        document = generate_document(next(UPLOAD_INDEX), seed=self.args.seed)
+        name, content = document_bytes(document, "mixed")
+        start = time.perf_counter()
+        try:
+            response = self.http.post(f"{self.base_url}/api/upload", data={"location_id": str(document["location_id"])},
+                                      files={"file": (f"{self.args.run_id}_{name}", content)})
+            ok = response.status_code == 200 and response.json().get("success")
+        except (requests.RequestException, ValueError):
+            ok = False
+        self.recorder.record("upload", time.perf_counter() - start, ok)
+
+    def run(self, deadline):
+        self.reload_page()
+        while time.time() < deadline:
+            time.sleep(self.rng.expovariate(1 / self.args.think_time) if self.args.think_time else 0)
+            if time.time() >= deadline:
+                break
+            getattr(self, self.rng.choice(self.actions))()
+
+
+def run_step(base_url, users, args):
+    recorder = Recorder()
+    deadline = time.time() + args.ramp_up + args.duration
+    threads = []
+
+    def start_user(user_id):
+        User(user_id, base_url, recorder, args).run(deadline)
+
+    started = time.time()
+    for user_id in range(users):
+        thread = threading.Thread(target=start_user, args=(user_id,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if args.ramp_up:
+            time.sleep(args.ramp_up / users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    # Time to first answer event is a sub-measurement of an ask, not a separate request
+    all_latencies = [value for endpoint, values in recorder.latencies.items()
+                     if not endpoint.endswith("(first event)") for value in values]
+    requests_total = len(all_latencies)
+    errors_total = sum(recorder.errors.values())
+    endpoints = {}
+    for endpoint in sorted(recorder.latencies):
+        stats = summarize(recorder.latencies[endpoint], recorder.errors[endpoint])
+        stats["error_rate"] = round(recorder.errors[endpoint] / len(recorder.latencies[endpoint]), 4)
+        endpoints[endpoint] = stats
+    return {
+        "users": users,
+        "requests": requests_total,
+        "throughput_rps": round(requests_total / elapsed, 1),
+        "error_rate": round(errors_total / requests_total, 4) if requests_total else None,
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 2) if all_latencies else None,
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per step after ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds to start all users of a step")
+    parser.add_argument("--think-time", type=float, default=2.0, help="mean seconds between user actions")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers when starting a server")
+    parser.add_argument("--documents", type=int, default=1000, help="corpus documents preloaded")
+    parser.add_argument("--seed", type=int, default=33)
+    parser.add_argument("--slo-p95-ms", type=float, default=500.0,
+                        help="p95 target used to report the largest step that met it")
+    parser.add_argument("--url", help="load an existing server instead of starting one")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+    args.run_id = int(time.time())
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        wait_ready(base_url)
+    else:
+        workdir = tempfile.mkdtemp(prefix="sds-load-")
+        preload(workdir, args.documents, args.seed, 0)
+        process, base_url = start_gunicorn(workdir, workers=args.workers)
+
+    report = {"config": {key: value for key, value in vars(args).items() if key != "run_id"}, "steps": []}
+    try:
+        for users in args.users:
+            step = run_step(base_url, users, args)
+            report["steps"].append(step)
+            print(f"users={users} throughput={step['throughput_rps']} rps p95={step['p95_ms']} ms "
+                  f"errors={step['error_rate']}")
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    passing = [step["users"] for step in report["steps"]
+               if step["p95_ms"] is not None and step["p95_ms"] <= args.slo_p95_ms and not step["error_rate"]]
+    report["max_users_within_slo"] = max(passing) if passing else None
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Retrieval quality versus latency for answer_question.
+
+Builds a gold set of question / expected section / source document triples
+from the synthetic corpus (product-name lookups, first aid, fire fighting,
+storage, PPE and hazard questions, asked with the full product name or a
+short "<chemical> <number>" form), then runs every gold question through each
+retrieval engine in app.RETRIEVAL_ENGINES and reports:
+
+- recall@1/5/10 and MRR of the source document in the engine's ranking
+- answer recall: the source document is among answer_question's sources
+- section hit rate: the answer quoted for the source document comes from the
+  expected SDS section
+- retrieval and end-to-end answer_question latency percentiles
+
+    python benchmarks/retrieval_eval.py --documents 5000 --engines like fts --output retrieval.json
+    python benchmarks/retrieval_eval.py --write-gold gold.jsonl --documents 5000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from common import REPO_ROOT, summarize
+from corpus import generate_document, load_corpus
+
+# question template, expected section number (None: only the document matters), name form
+TEMPLATES = (
+    ("{name}", None, "full"),
+    ("first aid for {name}", 4, "full"),
+    ("What should I do after eye contact with {name}?", 4, "full"),
+    ("How do I extinguish a fire involving {name}?", 5, "full"),
+    ("handling and storage of {name}", 7, "full"),
+    ("What PPE is needed for {name}?", 8, "full"),
+    ("What are the hazards of {name}?", 2, "full"),
+    ("{name} first aid", 4, "short"),
+    ("{name} fire extinguishing media", 5, "short"),
+    ("storage requirements {name}", 7, "short"),
+)
+
+SECTION_HIT_OVERLAP = 0.5
+
+
+def build_gold_set(documents, seed=33, questions=500, gold_seed=35):
+    """Gold questions over documents 0..documents-1 of the corpus"""
+    rng = random.Random(gold_seed)
+    gold = []
+    for i in range(questions):
+        document = generate_document(rng.randrange(documents), seed=seed)
+        template, section, form = TEMPLATES[i % len(TEMPLATES)]
+        name = document["product_name"] if form == "full" else f"{document['chemical']} {document['index']:06d}"
+        gold.append({
+            "question": template.format(name=name),
+            "product_name": document["product_name"],
+            "document_index": document["index"],
+            "section": section,
+            "answer": document["sections"][section] if section else None,
+            "kind": f"section_{section}_{form}" if section else f"name_{form}",
+        })
+    return gold
+
+
+def trigrams(text):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def answer_part(answer_text, product_name):
+    """The part of a combined answer quoting one product"""
+    marker = f"**{product_name}**:"
+    start = answer_text.find(marker)
+    if start < 0:
+        return None
+    end = answer_text.find("\n\n**", start + len(marker))
+    return answer_text[start + len(marker):end if end >= 0 else None]
+
+
+def section_hit(part, expected):
+    """Most of the quoted text's word trigrams occur in the expected section"""
+    quoted = trigrams(part)
+    if not quoted:
+        return False
+    return len(quoted & trigrams(expected)) / len(quoted) >= SECTION_HIT_OVERLAP
+
+
+def evaluate(sds_app, engine_name, gold, document_ids):
+    assistant = sds_app.sds_assistant
+    assistant.retrieval = sds_app.RETRIEVAL_ENGINES[engine_name]
+    search_latencies, answer_latencies = [], []
+    ranks = []
+    answer_found = 0
+    section_questions = section_hits = 0
+    by_kind = {}
+
+    for item in gold:
+        source_id = document_ids[item["product_name"]]
+        start = time.perf_counter()
+        rows = assistant.search_documents(item["question"])
+        search_latencies.append(time.perf_counter() - start)
+        ranked = [row[0] for row in rows]
+        rank = ranked.index(source_id) + 1 if source_id in ranked else None
+        ranks.append(rank)
+
+        start = time.perf_counter()
+        answer = assistant.answer_question(item["question"])
+        answer_latencies.append(time.perf_counter() - start)
+        found = any(source["document_id"] == source_id for source in answer.get("sources", []))
+        answer_found += found
+
+        hit = None
+        if item["section"]:
+            section_questions += 1
+            part = answer_part(answer.get("answer", ""), item["product_name"]) if found else None
+            hit = bool(part) and section_hit(part, item["answer"])
+            section_hits += hit
+
+        kind = by_kind.setdefault(item["kind"], {"questions": 0, "recall_at_10": 0, "section_hits": 0})
+        kind["questions"] += 1
+        kind["recall_at_10"] += rank is not None
+        kind["section_hits"] += bool(hit)
+
+    def recall(k):
+        return round(sum(1 for rank in ranks if rank is not None and rank <= k) / len(ranks), 4)
+
+    for name, kind in by_kind.items():
+        kind["recall_at_10"] = round(kind["recall_at_10"] / kind["questions"], 4)
+        hits = kind.pop("section_hits")
+        kind["section_hit_rate"] = round(hits / kind["questions"], 4) if name.startswith("section_") else None
+    return {
+        "questions": len(gold),
+        "recall_at_1": recall(1),
+        "recall_at_5": recall(5),
+        "recall_at_10": recall(10),
+        "mrr": round(sum(1 / rank for rank in ranks if rank) / len(ranks), 4),
+        "answer_recall": round(answer_found / len(gold), 4),
+        "section_hit_rate": round(section_hits / section_questions, 4) if section_questions else None,
+        "search_latency": summarize(search_latencies),
+        "answer_latency": summarize(answer_latencies),
+        "by_kind": dict(sorted(by_kind.items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000, help="corpus size")
+    parser.add_argument("--seed", type=int, default=33)
+    parser.add_argument("--questions", type=int, default=500, help="gold questions")
+    parser.add_argument("--engines", nargs="+", help="engines to compare (default: all)")
+    parser.add_argument("--workdir", help="reuse a database built by an earlier run with the same corpus")
+    parser.add_argument("--write-gold", help="write the gold set as JSON lines and exit")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    gold = build_gold_set(args.documents, args.seed, args.questions)
+    if args.write_gold:
+        with open(args.write_gold, "w") as f:
+            f.writelines(json.dumps(item) + "\n" for item in gold)
+        return
+
+    workdir = Path(args.workdir or f"/tmp/sds-eval-{args.seed}-{args.documents}").resolve()
+    fresh = not (workdir / "corpus_manifest.jsonl").exists()
+    if fresh:
+        load_corpus(workdir, args.documents, args.seed)
+    else:
+        os.chdir(workdir)
+        sys.path.insert(0, str(REPO_ROOT))
+    import app as sds_app
+
+    conn = sds_app.sds_assistant.connect()
+    document_ids = dict(conn.execute("SELECT product_name, id FROM sds_documents").fetchall())
+    conn.close()
+
+    engines = args.engines or list(sds_app.RETRIEVAL_ENGINES)
+    if "vector" in engines:
+        # Corpus documents are stored directly, without the upload path that embeds them
+        sds_app.sds_assistant.backfill_vectors()
+
+    report = {"config": vars(args), "workdir": str(workdir), "engines": {}}
+    for engine_name in engines:
+        result = evaluate(sds_app, engine_name, gold, document_ids)
+        report["engines"][engine_name] = result
+        print(f"{engine_name}: recall@10={result['recall_at_10']} mrr={result['mrr']} "
+              f"section_hit={result['section_hit_rate']} search_p95={result['search_latency']['p95_ms']} ms",
+              file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Sentence scoring in extract_relevant_text: the original loop versus SentenceIndex.
+
+Generates long synthetic SDS documents (--pad-kb of toxicology text each; about
+3 KB per printed page, so the default is roughly a 100-page document) and times
+picking the best sentence window for free-form questions with:
+
+- legacy: the original per-sentence, per-word `in` loop (copied below)
+- cold: SentenceIndex built for every question (a document seen for the first time)
+- warm: the cached SentenceIndex of the document (repeated questions about it)
+
+    python benchmarks/sentence_scoring.py --documents 20 --pad-kb 300 --output sentences.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import REPO_ROOT, summarize
+from corpus import iter_corpus
+from suite import FREE_FORM_QUESTIONS
+
+
+def legacy_best_sentence(question, full_text):
+    """The scoring loop extract_relevant_text used before SentenceIndex"""
+    question_words = [word.lower() for word in question.split() if len(word) > 3]
+    sentences = full_text.split('.')
+    best_sentence = ""
+    best_score = 0
+    for sentence in sentences:
+        sentence_lower = sentence.lower()
+        score = sum(1 for word in question_words if word in sentence_lower)
+        if score > best_score and len(sentence.strip()) > 20:
+            best_score = score
+            best_sentence = sentence.strip()
+    return best_sentence
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pad-kb", type=int, default=300, help="extra text per document")
+    parser.add_argument("--seed", type=int, default=33)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="sds-sentences-"))
+    sys.path.insert(0, str(REPO_ROOT))
+    import app as sds_app
+
+    texts = [document["text"] for document in iter_corpus(args.documents, args.seed, args.pad_kb)]
+    latencies = {"legacy": [], "cold": [], "warm": []}
+    for text in texts:
+        for question in FREE_FORM_QUESTIONS:
+            start = time.perf_counter()
+            legacy_best_sentence(question, text)
+            latencies["legacy"].append(time.perf_counter() - start)
+
+            sds_app.sentence_index.cache_clear()
+            start = time.perf_counter()
+            sds_app.sentence_index(text).windows(sds_app.SentenceIndex.terms(question), 3)
+            latencies["cold"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            sds_app.sentence_index(text).windows(sds_app.SentenceIndex.terms(question), 3)
+            latencies["warm"].append(time.perf_counter() - start)
+
+    report = {
+        "config": vars(args),
+        "document_kb": round(sum(map(len, texts)) / len(texts) / 1024, 1),
+        "sentences_per_document": round(sum(text.count(".") + 1 for text in texts) / len(texts)),
+        "scoring": {name: summarize(values) for name, values in latencies.items()},
+    }
+    for name in latencies:
+        print(f"{name}: p50={report['scoring'][name]['p50_ms']} ms", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""End-to-end benchmark suite over the synthetic SDS corpus.
+
+Builds a fresh database preloaded with --documents corpus documents, starts
+the production entry point (gunicorn, eventlet worker) on it and measures:
+
+- upload throughput and latency over HTTP (text and PDF)
+- ask latency, for questions naming a product and for free-form questions
+- location listing (all, by state, by search term)
+- dashboard stats (with the response cache disabled, so the queries are timed)
+- NFPA/GHS sticker generation and download
+
+Results are written as JSON, tagged with the git commit, so runs can be
+compared across commits with compare.py:
+
+    python benchmarks/suite.py --documents 10000 --output before.json
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+from common import REPO_ROOT, start_gunicorn, stop_server, summarize
+from corpus import document_bytes, iter_corpus
+
+FREE_FORM_QUESTIONS = (
+    "What should I do if it gets in my eyes?",
+    "first aid for skin contact",
+    "How do I put out a fire?",
+    "What gloves should I wear?",
+    "How should this be stored?",
+    "Is it flammable?",
+)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def preload(workdir, documents, seed, pad_kb):
+    """Load the corpus in a child process, so the app is never imported here"""
+    if not documents:
+        return 0.0
+    started = time.perf_counter()
+    subprocess.run([sys.executable, str(Path(__file__).with_name("corpus.py")), "load",
+                    "--workdir", str(workdir), "--documents", str(documents),
+                    "--seed", str(seed), "--pad-kb", str(pad_kb)],
+                   check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def timed_requests(count, send):
+    """Run send(i) count times in a row; non-200 responses count as errors"""
+    latencies = []
+    errors = 0
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            response = send(i)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        errors += not ok
+    return summarize(latencies, errors)
+
+
+def bench_uploads(base_url, args):
+    documents = list(iter_corpus(args.uploads, args.seed, args.pad_kb, start=args.documents))
+    latencies = {"txt": [], "pdf": []}
+    errors = {"txt": 0, "pdf": 0}
+    uploaded_bytes = [0]
+    lock = threading.Lock()
+    queue = list(documents)
+
+    def client():
+        http = requests.Session()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                document = queue.pop()
+            name, content = document_bytes(document, args.upload_format)
+            kind = name.rsplit(".", 1)[1]
+            start = time.perf_counter()
+            try:
+                response = http.post(f"{base_url}/api/upload", data={"location_id": str(document["location_id"])},
+                                     files={"file": (name, content)})
+                ok = response.status_code == 200 and response.json().get("success")
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+                errors[kind] += not ok
+                uploaded_bytes[0] += len(content)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "documents": len(documents),
+        "clients": args.clients,
+        "documents_per_second": round(len(documents) / elapsed, 2),
+        "megabytes_per_second": round(uploaded_bytes[0] / elapsed / 1e6, 3),
+        "latency": {kind: summarize(latencies[kind], errors[kind]) for kind in latencies if latencies[kind]},
+    }
+
+
+def bench_asks(base_url, workdir, args):
+    manifest = [json.loads(line) for line in open(Path(workdir) / "corpus_manifest.jsonl")] \
+        if args.documents else []
+    rng = random.Random(args.seed)
+    http = requests.Session()
+
+    def ask(question):
+        return http.post(f"{base_url}/api/ask-question", json={"question": question})
+
+    results = {"free_form": timed_requests(args.asks, lambda i: ask(FREE_FORM_QUESTIONS[i % len(FREE_FORM_QUESTIONS)]))}
+    if manifest:
+        results["product"] = timed_requests(args.asks, lambda i: ask(rng.choice(manifest)["product_name"]))
+        results["chemical"] = timed_requests(args.asks, lambda i: ask(rng.choice(manifest)["chemical"]))
+    return results
+
+
+def bench_reads(base_url, args):
+    http = requests.Session()
+    states = ["Texas", "California", "Ohio", "New York", "Florida"]
+    return {
+        "locations_all": timed_requests(args.reads, lambda i: http.get(f"{base_url}/api/locations")),
+        "locations_state": timed_requests(args.reads, lambda i: http.get(
+            f"{base_url}/api/locations", params={"state": states[i % len(states)]})),
+        "locations_search": timed_requests(args.reads, lambda i: http.get(
+            f"{base_url}/api/locations", params={"search": "Ware"})),
+        "states": timed_requests(args.reads, lambda i: http.get(f"{base_url}/api/states")),
+        "recent_documents": timed_requests(args.reads, lambda i: http.get(f"{base_url}/api/recent-documents")),
+        "dashboard_stats": timed_requests(args.reads, lambda i: http.get(f"{base_url}/api/dashboard-stats")),
+    }
+
+
+def bench_stickers(base_url, args):
+    http = requests.Session()
+    filenames = []
+
+    def generate(kind, i):
+        response = http.post(f"{base_url}/api/generate-{kind}", json={"product_name": f"{i % max(args.documents, 1):06d}"})
+        if response.ok and response.json().get("success"):
+            filenames.append(response.json()["filename"])
+        return response
+
+    results = {
+        "nfpa": timed_requests(args.stickers, lambda i: generate("nfpa", i)),
+        "ghs": timed_requests(args.stickers, lambda i: generate("ghs", i)),
+    }
+    results["download"] = timed_requests(len(filenames), lambda i: http.get(
+        f"{base_url}/api/download-sticker/{filenames[i]}"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=1000, help="corpus documents preloaded into the database")
+    parser.add_argument("--pad-kb", type=int, default=0, help="extra text per document")
+    parser.add_argument("--seed", type=int, default=33)
+    parser.add_argument("--uploads", type=int, default=100, help="documents uploaded over HTTP")
+    parser.add_argument("--upload-format", choices=("txt", "pdf", "mixed"), default="mixed")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent upload clients")
+    parser.add_argument("--asks", type=int, default=100, help="asks per question kind")
+    parser.add_argument("--reads", type=int, default=100, help="requests per read endpoint")
+    parser.add_argument("--stickers", type=int, default=50, help="stickers per kind")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn worker processes")
+    parser.add_argument("--workdir", help="keep the database here instead of a temporary directory")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="sds-suite-"))
+    report = {
+        "meta": dict(git_revision(), python=platform.python_version(), platform=platform.platform(),
+                     started_at=datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        "config": vars(args),
+        "results": {},
+    }
+    results = report["results"]
+    results["preload_seconds"] = round(preload(workdir, args.documents, args.seed, args.pad_kb), 2)
+
+    process, base_url = start_gunicorn(workdir, workers=args.workers, env={"SDS_DASHBOARD_CACHE_SECONDS": "0"})
+    try:
+        results["reads"] = bench_reads(base_url, args)
+        results["ask"] = bench_asks(base_url, workdir, args)
+        results["stickers"] = bench_stickers(base_url, args)
+        results["upload"] = bench_uploads(base_url, args)
+    finally:
+        stop_server(process)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Top-k cosine search latency of the vector index at up to millions of passages.
+
+Fits the embedding model on synthetic corpus passages, embeds them, then tiles
+the embeddings (with a little noise) up to each requested passage count and
+times VectorIndex.search on the memory-mapped files, with and without a
+document filter (as a location-scoped ask would use):
+
+    python benchmarks/vector_search.py --passages 100000 1000000 --output vectors.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from common import REPO_ROOT, summarize
+from corpus import iter_corpus
+from suite import FREE_FORM_QUESTIONS
+
+
+def build_files(index, embeddings, passages, rng):
+    """Write passages rows: the real embeddings repeated with noise, document ids cycling"""
+    chunk = 100_000
+    with open(index.vectors_path, "wb") as vectors, open(index.meta_path, "wb") as meta:
+        for start in range(0, passages, chunk):
+            rows = min(chunk, passages - start)
+            block = embeddings[rng.integers(0, len(embeddings), rows)]
+            block = block + rng.normal(0, 0.02, block.shape).astype(np.float32)
+            block /= np.linalg.norm(block, axis=1, keepdims=True)
+            vectors.write(block.astype(np.float32).tobytes())
+            records = np.zeros(rows, dtype=index.META_DTYPE)
+            records["document_id"] = (np.arange(start, start + rows) // 10) + 1
+            meta.write(records.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--passages", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--documents", type=int, default=500, help="corpus documents to embed for real")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, help="embedding dimensions (default: the app's SDS_VECTOR_DIM)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sds-vectors-")
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    import app as sds_app
+
+    index = sds_app.VectorIndex(Path(workdir) / "vectors", args.dim or sds_app.VECTOR_DIM)
+    texts = [document["text"] for document in iter_corpus(args.documents)]
+    passages = [text[start:end] for text in texts for start, end in index.passages(text)]
+    started = time.perf_counter()
+    index.fit(passages[:index.FIT_PASSAGES])
+    fit_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    embeddings = index.embed(passages)
+    embed_rate = len(passages) / (time.perf_counter() - started)
+
+    rng = np.random.default_rng(36)
+    report = {
+        "config": dict(vars(args), dim=index.dim),
+        "fit_seconds": round(fit_seconds, 2),
+        "embed_passages_per_second": round(embed_rate, 1),
+        "runs": [],
+    }
+    for count in args.passages:
+        build_files(index, embeddings, count, rng)
+        index.refresh()
+        # Every 100th document: a location's worth of documents in a large deployment
+        document_filter = np.arange(1, count // 10 + 1, 100, dtype=np.int32)
+        for warm in range(3):
+            index.search(FREE_FORM_QUESTIONS[warm], 10)
+
+        latencies = {"all": [], "filtered": []}
+        for i in range(args.queries):
+            question = FREE_FORM_QUESTIONS[i % len(FREE_FORM_QUESTIONS)]
+            start = time.perf_counter()
+            index.search(question, 10)
+            latencies["all"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            index.search(question, 10, document_filter)
+            latencies["filtered"].append(time.perf_counter() - start)
+        run = {
+            "passages": count,
+            "matrix_mb": round(count * index.row_bytes / 1e6, 1),
+            "search": summarize(latencies["all"]),
+            "search_with_document_filter": summarize(latencies["filtered"]),
+        }
+        report["runs"].append(run)
+        print(f"passages={count} p50={run['search']['p50_ms']} ms p99={run['search']['p99_ms']} ms",
+              file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Throughput versus gunicorn worker count.
+
+Starts the production entry point (gunicorn, eventlet worker class) against one
+shared data directory with 1, 2, 4, ... worker processes, drives it with a
+closed-loop client mix (reads, asks, uploads, stickers), and checks that every
+worker sees the same data: all successful uploads are counted and every
+generated sticker downloads regardless of which worker serves it.
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 --duration 15
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from common import (percentile, seed_over_http, start_gunicorn, stop_server,
+                    summarize, synthetic_text, upload_text)
+
+MIX = (
+    ("dashboard", 30),
+    ("locations", 25),
+    ("ask", 25),
+    ("upload", 10),
+    ("sticker", 10),
+)
+
+
+def run_load(base_url, duration, clients, size_kb, run_id):
+    deadline = time.time() + duration
+    lock = threading.Lock()
+    latencies = {name: [] for name, _ in MIX}
+    errors = {name: 0 for name, _ in MIX}
+    uploads_ok = [0]
+    stickers = {"generated": 0, "downloaded": 0}
+
+    def one_request(http, rng, kind, client_id, n):
+        if kind == "dashboard":
+            return http.get(f"{base_url}/api/dashboard-stats")
+        if kind == "locations":
+            return http.get(f"{base_url}/api/locations", params={"state": rng.choice(["Texas", "Ohio", "Utah"])})
+        if kind == "ask":
+            return http.post(f"{base_url}/api/ask-question", json={"question": f"Benchmark Solvent {rng.randrange(50)}"})
+        if kind == "upload":
+            text = synthetic_text(rng, f"Scaling {run_id}-{client_id}-{n}", size_kb)
+            response = upload_text(http, base_url, f"scale_{run_id}_{client_id}_{n}.txt", text)
+            if response.ok and response.json().get("success"):
+                with lock:
+                    uploads_ok[0] += 1
+            return response
+        response = http.post(f"{base_url}/api/generate-nfpa", json={"product_name": "Benchmark Solvent 1"})
+        if response.ok and response.json().get("success"):
+            # A fresh connection is likely to land on a different worker
+            download = requests.get(f"{base_url}/api/download-sticker/{response.json()['filename']}")
+            with lock:
+                stickers["generated"] += 1
+                stickers["downloaded"] += download.status_code == 200
+        return response
+
+    def client(client_id):
+        rng = random.Random(client_id)
+        http = requests.Session()
+        kinds = [name for name, weight in MIX for _ in range(weight)]
+        n = 0
+        while time.time() < deadline:
+            n += 1
+            kind = rng.choice(kinds)
+            start = time.perf_counter()
+            try:
+                ok = one_request(http, rng, kind, client_id, n).status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+                errors[kind] += not ok
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "requests": len(all_latencies),
+        "throughput_rps": round(len(all_latencies) / elapsed, 1),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 2) if all_latencies else None,
+        "endpoints": {kind: summarize(latencies[kind], errors[kind]) for kind in latencies},
+        "uploads_ok": uploads_ok[0],
+        "stickers": stickers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--doc-kb", type=int, default=50)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "runs": []}
+    for workers in args.workers:
+        workdir = tempfile.mkdtemp(prefix=f"sds-scale-{workers}-")
+        process, base_url = start_gunicorn(workdir, workers=workers)
+        try:
+            seed_over_http(base_url, args.documents, args.doc_kb)
+            result = run_load(base_url, args.duration, args.clients, args.doc_kb, workers)
+            total = requests.get(f"{base_url}/api/dashboard-stats").json()["total_documents"]
+            result["consistency"] = {
+                "documents_expected": args.documents + result["uploads_ok"],
+                "documents_seen": total,
+                "stickers_missing": result["stickers"]["generated"] - result["stickers"]["downloaded"],
+            }
+        finally:
+            stop_server(process)
+        result["workers"] = workers
+        report["runs"].append(result)
+        print(f"workers={workers} throughput={result['throughput_rps']} rps p99={result['p99_ms']} ms")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
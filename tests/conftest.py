@@ -0,0 +1,63 @@
+"""Shared fixtures: the app imported once into a scratch working directory, plus a small synthetic corpus."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(REPO_ROOT), str(REPO_ROOT / "benchmarks")]
+
+from corpus import generate_document  # noqa: E402
+
+CORPUS_SIZE = 40
+
+
+def store(assistant, document, file_hash=None):
+    """Insert a generated corpus document the way an upload would, returning its id"""
+    text = document["text"]
+    name = f"sds_{document['index']:06d}.txt"
+    return assistant.store_document({
+        "filename": name,
+        "original_filename": name,
+        "file_hash": file_hash or f"test-{document['index']}",
+        "file_url": None,
+        "full_text": text,
+        "location_id": document["location_id"],
+        "file_size": len(text),
+        "uploaded_by": "tests"
+    }, assistant.extract_chemical_info(text))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """The app, imported once in a scratch working directory"""
+    # app.py creates its database, upload and export directories under the working directory on import.
+    # Q&A history is written inline so tests can read it back, and dashboard stats are never cached
+    os.chdir(tempfile.mkdtemp(prefix="sds-tests-"))
+    os.environ.update({
+        "SDS_QA_LOG_QUEUE": "0",
+        "SDS_QA_ROLLUP_SECONDS": "0",
+        "SDS_DASHBOARD_CACHE_SECONDS": "0",
+        "SDS_RETRIEVAL": "like",
+    })
+    import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def assistant(app_module):
+    return app_module.sds_assistant
+
+
+@pytest.fixture(scope="session")
+def corpus(assistant):
+    """{document id: generated document} for the documents stored in the shared database"""
+    documents = [generate_document(index) for index in range(CORPUS_SIZE)]
+    return {store(assistant, document): document for document in documents}
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
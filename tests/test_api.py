@@ -0,0 +1,98 @@
+"""HTTP endpoints: keyset paging of listings, listings without their indexes or their database, and upload progress."""
+import io
+
+import pytest
+from conftest import store
+from corpus import generate_document
+
+
+@pytest.mark.parametrize("path", [
+    "/api/recent-documents?cursor=garbage",
+    "/api/locations?cursor=garbage",
+    "/api/locations?cursor=WzFd",
+])
+def test_invalid_cursor_is_a_400(client, path):
+    response = client.get(path)
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False, "message": "Invalid cursor"}
+
+
+def test_locations_pages_follow_the_cursor(client):
+    seen = []
+    cursor = None
+    for _ in range(3):
+        response = client.get("/api/locations", query_string={"state": "Texas", "limit": 5, "cursor": cursor})
+        assert response.status_code == 200
+        page = response.get_json()
+        seen.extend(location["id"] for location in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    everything = client.get("/api/locations", query_string={"state": "Texas", "limit": 500}).get_json()
+    assert seen == [location["id"] for location in everything][:len(seen)]
+    assert len(seen) == len(set(seen)) == min(15, len(everything))
+
+
+def test_recent_documents_pages_cover_every_document(client, corpus):
+    ids = []
+    cursor = None
+    while True:
+        response = client.get("/api/recent-documents", query_string={"limit": 7, "cursor": cursor})
+        assert response.status_code == 200
+        ids.extend(document["id"] for document in response.get_json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert sorted(ids) == sorted(set(ids))
+    assert set(corpus) <= set(ids)
+
+
+@pytest.fixture
+def unindexed(app_module, tmp_path, monkeypatch):
+    """A database holding one document but none of the listing and hazard filter indexes, serving the API"""
+    scratch = app_module.SDSAssistant(str(tmp_path / "sds.db"))
+    document = generate_document(0)
+    document_id = store(scratch, document)
+    conn = scratch.connect()
+    for index in ("idx_documents_recent", "idx_locations_state_city", "idx_location",
+                  "idx_hazards_health", "idx_hazards_fire", "idx_hazards_reactivity"):
+        conn.execute(f"DROP INDEX {index}")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(app_module, "sds_assistant", scratch)
+    return document_id, document["location_id"]
+
+
+def test_listings_work_without_their_indexes(client, unindexed):
+    document_id, location_id = unindexed
+    assert [document["id"] for document in client.get("/api/recent-documents").get_json()] == [document_id]
+    locations = client.get("/api/locations", query_string={"limit": 500}).get_json()
+    assert {location["id"]: location["document_count"] for location in locations}[location_id] == 1
+    hazards = client.get("/api/hazards?fire_min=0&fire_max=4&health_min=0").get_json()
+    assert hazards["success"] and [hazard["document_id"] for hazard in hazards["hazards"]] == [document_id]
+    bundle = client.get("/api/offline-bundle", query_string={"location_id": location_id}).get_json()
+    assert bundle["success"] and [document["id"] for document in bundle["documents"]] == [document_id]
+
+
+@pytest.mark.parametrize("path", ["/api/recent-documents", "/api/locations"])
+def test_listing_failure_is_a_500(client, app_module, monkeypatch, path):
+    def fail():
+        raise app_module.sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(app_module.sds_assistant, "connect", fail)
+    response = client.get(path)
+    assert response.status_code == 500
+    assert response.get_json() == {"success": False, "message": "disk I/O error"}
+
+
+def test_upload_progress_keeps_its_stage_names(app_module, tmp_path):
+    # Clients key their progress labels on these names; metrics label the same stages hash, store, ...
+    from werkzeug.datastructures import FileStorage
+    scratch = app_module.SDSAssistant(str(tmp_path / "sds.db"))
+    document = generate_document(0)
+    file = FileStorage(io.BytesIO(document["text"].encode()), filename="upload.txt", content_type="text/plain")
+    stages = []
+    result = scratch.upload_file(file, document["location_id"], progress=stages.append)
+    assert result["success"], result
+    assert stages == ["hashing", "storing", "extracting", "parsing", "saving", "done"]
+    stage_metrics = app_module.metrics.render()
+    assert 'sds_upload_stage_duration_seconds_count{stage="insert"}' in stage_metrics
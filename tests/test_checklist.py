@@ -0,0 +1,88 @@
+"""POST /api/ask-batch: input validation, product matching and failures."""
+import json
+
+import pytest
+
+from conftest import store
+from corpus import generate_document
+
+
+@pytest.fixture(scope="module")
+def underscore_product(assistant, corpus):
+    """A document whose product name holds a literal underscore"""
+    document = generate_document(500)
+    document["text"] = document["text"].replace(document["product_name"], "Lab Solvent 0_0 Special", 1)
+    return store(assistant, document, file_hash="test-underscore")
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"questions": ["first aid"], "location_ids": "12"}, "location_ids must be a list of integers"),
+    ({"questions": ["first aid"], "location_ids": [1, "2"]}, "location_ids must be a list of integers"),
+    ({"questions": ["first aid"], "location_ids": [True]}, "location_ids must be a list of integers"),
+    ({"questions": ["first aid"], "location_id": "12"}, "location_ids must be a list of integers"),
+    ({"questions": ["first aid"], "products": "acetone"}, "products must be a list of strings"),
+    ({"questions": ["first aid"], "products": [["acetone"]]}, "products must be a list of strings"),
+    ({"questions": [["first aid"]], "products": ["acetone"]}, "questions must be a list of strings"),
+    ({"questions": [{"q": "first aid"}], "products": ["acetone"]}, "questions must be a list of strings"),
+    ({"questions": "first aid", "products": ["acetone"]}, "questions must be a list of strings"),
+    ({"questions": ["  "], "products": ["acetone"]}, "Please provide at least one question"),
+    ({"questions": ["first aid"]}, "Please provide products or locations"),
+    ({"questions": ["first aid"] * 21, "products": ["acetone"]}, "At most 20 questions per batch"),
+])
+def test_invalid_requests_are_rejected(client, body, message):
+    response = client.post("/api/ask-batch", json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False, "message": message}
+
+
+def test_non_object_body_is_rejected(client):
+    response = client.post("/api/ask-batch", data="[1, 2]", content_type="application/json")
+    assert response.status_code == 400
+
+
+def test_checklist_by_location(client, corpus):
+    location_id = next(iter(corpus.values()))["location_id"]
+    expected = sorted(document_id for document_id, document in corpus.items() if document["location_id"] == location_id)
+
+    response = client.post("/api/ask-batch", json={"questions": ["first aid", "storage"], "location_id": location_id,
+                                                    "stream": False})
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary["success"] is True
+    assert [result["document_id"] for result in summary["results"]] == expected
+    assert all(len(result["answers"]) == 2 and result["answers"][0]["answer"] for result in summary["results"])
+
+
+def test_streamed_checklist_event_order(client, corpus):
+    response = client.post("/api/ask-batch", json={"questions": ["first aid"], "products": ["Acetone"]})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[0] == {"type": "candidates", "count": len(events) - 2}
+    assert {event["type"] for event in events[1:-1]} == {"result"}
+    assert events[-1]["type"] == "done" and events[-1]["success"] is True
+
+
+def test_product_names_match_literally(client, corpus, underscore_product):
+    def matched(product):
+        response = client.post("/api/ask-batch", json={"questions": ["first aid"], "products": [product], "stream": False})
+        return [result["document_id"] for result in response.get_json()["results"]]
+
+    # As a wildcard, _ would match "000" in every corpus product number
+    assert matched("0_0") == [underscore_product]
+    assert matched("%") == []
+    assert matched("Solvent 0_0") == [underscore_product]
+
+
+def test_failure_part_way_is_a_500(client, corpus, assistant, monkeypatch):
+    answer = type(assistant).answer_checklist
+    calls = []
+
+    def fail_on_second_document(self, typed_questions, doc):
+        calls.append(doc[0])
+        if len(calls) == 2:
+            raise RuntimeError("disk I/O error")
+        return answer(self, typed_questions, doc)
+
+    monkeypatch.setattr(type(assistant), "answer_checklist", fail_on_second_document)
+    response = client.post("/api/ask-batch", json={"questions": ["first aid"], "products": ["Acetone"], "stream": False})
+    assert response.status_code == 500
+    assert response.get_json() == {"success": False, "message": "Error processing checklist: disk I/O error"}
@@ -0,0 +1,21 @@
+"""GHS classification: hazard and precautionary codes, pictograms and signal words."""
+
+
+def test_extract_ghs_combined_precautionary_codes(assistant):
+    ghs = assistant.extract_ghs(
+        "Signal word: Danger\n"
+        "H225: Highly flammable liquid and vapour.\n"
+        "H319 Causes serious eye irritation.\n"
+        "Precautionary statements: P210 P303+P361+P353 P305 + P351 + P338 p370+p378 P210\n"
+        "Pictograms: flame, exclamation mark GHS07")
+    assert ghs["signal_word"] == "Danger"
+    assert ghs["hazard_codes"] == ["H225", "H319"]
+    assert ghs["hazard_statements"]["H225"] == "H225: Highly flammable liquid and vapour."
+    assert ghs["precautionary_codes"] == ["P210", "P303+P361+P353", "P305+P351+P338", "P370+P378"]
+    assert ghs["pictograms"] == ["GHS02", "GHS07"]
+
+
+def test_extract_ghs_flame_over_circle_is_not_also_flame(assistant):
+    ghs = assistant.extract_ghs("Pictograms: Flame over circle, Corrosion")
+    assert ghs["pictograms"] == ["GHS03", "GHS05"]
+    assert ghs["signal_word"] == ""
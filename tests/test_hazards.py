@@ -0,0 +1,26 @@
+"""Hazard threshold queries: keyset cursors."""
+import pytest
+
+
+@pytest.mark.parametrize("key", [
+    ("2024-05-01 12:00:00", 17),
+    ("Texas", "Houston", "Warehouse", 912),
+    (3,),
+    ("unicode ✓ and = padding", None),
+])
+def test_cursor_round_trip(app_module, key):
+    cursor = app_module.encode_cursor(key)
+    assert "=" not in cursor
+    assert app_module.decode_cursor(cursor, len(key)) == list(key)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "!!!", "e30", "WzFd"])
+def test_decode_cursor_rejects_foreign_values(app_module, cursor):
+    # "e30" is {} and "WzFd" is [1]: valid JSON, but not a key of the expected length
+    assert app_module.decode_cursor(cursor, 2) is None
+
+
+def test_invalid_hazards_cursor_is_a_400(client):
+    response = client.get("/api/hazards?cursor=garbage")
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False, "message": "Invalid cursor"}
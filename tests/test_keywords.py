@@ -0,0 +1,58 @@
+"""Question classification with the keyword automaton."""
+import random
+
+import pytest
+
+# classify_question before the keyword automaton: first type in this order with any keyword as a substring
+LEGACY_QUESTION_TYPES = {
+    "first_aid": ["first aid", "emergency", "exposure", "eye contact", "skin contact", "inhalation", "ingestion"],
+    "fire_fighting": ["fire", "firefighting", "extinguish", "combustible", "flammable"],
+    "handling": ["handling", "storage", "precautions", "handling precautions"],
+    "exposure": ["exposure", "protection", "ppe", "personal protective", "ventilation"],
+    "hazards": ["hazard", "danger", "toxic", "corrosive", "irritant"],
+    "physical": ["physical", "appearance", "odor", "melting point", "boiling point"]
+}
+
+
+def legacy_classify(question):
+    question_lower = question.lower()
+    for question_type, keywords in LEGACY_QUESTION_TYPES.items():
+        if any(keyword in question_lower for keyword in keywords):
+            return question_type
+    return "general"
+
+
+def random_questions(count, seed=7):
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in LEGACY_QUESTION_TYPES.values() for keyword in keywords]
+    filler = "what is the for acetone how do i store this product safely with a fireplace ppes".split()
+    for _ in range(count):
+        words = rng.sample(filler, rng.randint(0, 5)) + rng.sample(keywords, rng.randint(0, 3))
+        rng.shuffle(words)
+        yield " ".join(word.upper() if rng.random() < 0.2 else word for word in words)
+
+
+def test_keyword_automaton_classifies_like_the_keyword_loop(assistant):
+    for question in random_questions(5000):
+        assert assistant.classify_question(question) == legacy_classify(question), question
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the first aid for eye contact?", "first_aid"),
+    # "exposure" is a first_aid keyword too, and first_aid comes first
+    ("exposure limits?", "first_aid"),
+    ("Is it flammable?", "fire_fighting"),
+    ("storage requirements", "handling"),
+    ("what ppe do I need", "exposure"),
+    ("boiling point", "physical"),
+    ("who makes it", "general"),
+])
+def test_classify_question(assistant, question, expected):
+    assert assistant.classify_question(question) == expected
+
+
+def test_keyword_automaton_reports_overlapping_matches(app_module):
+    automaton = app_module.KeywordAutomaton({"a": ["flame"], "b": ["flame over circle"]})
+    matches = sorted((start, keyword) for start, keyword, _ in automaton.scan("Flame over circle"))
+    assert matches == [(0, "flame"), (0, "flame over circle")]
+    assert automaton.first_label("no match") is None
@@ -0,0 +1,205 @@
+"""Schema versioning: databases from before PRAGMA user_version upgrade in place, with resumable backfills."""
+import sqlite3
+
+import pytest
+
+from conftest import store
+from corpus import generate_document
+
+DOCUMENTS = 30
+
+# setup_database as it was before schema versioning
+UNVERSIONED_SCHEMA = '''
+    CREATE TABLE locations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        department TEXT NOT NULL,
+        city TEXT NOT NULL,
+        state TEXT NOT NULL,
+        country TEXT NOT NULL DEFAULT 'United States',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(department, city, state, country)
+    );
+    CREATE TABLE sds_documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        original_filename TEXT,
+        file_hash TEXT UNIQUE,
+        file_url TEXT,
+        product_name TEXT,
+        manufacturer TEXT,
+        cas_number TEXT,
+        full_text TEXT NOT NULL,
+        location_id INTEGER,
+        source_type TEXT DEFAULT 'upload',
+        file_size INTEGER,
+        uploaded_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (location_id) REFERENCES locations (id)
+    );
+    CREATE TABLE chemical_hazards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        document_id INTEGER,
+        product_name TEXT,
+        cas_number TEXT,
+        nfpa_health INTEGER DEFAULT 0,
+        nfpa_fire INTEGER DEFAULT 0,
+        nfpa_reactivity INTEGER DEFAULT 0,
+        nfpa_special TEXT,
+        ghs_pictograms TEXT,
+        ghs_signal_word TEXT,
+        ghs_hazard_statements TEXT,
+        first_aid TEXT,
+        fire_fighting TEXT,
+        handling_storage TEXT,
+        exposure_controls TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (document_id) REFERENCES sds_documents (id)
+    );
+    CREATE TABLE qa_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        document_id INTEGER,
+        location_id INTEGER,
+        user_session TEXT,
+        confidence_score REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (document_id) REFERENCES sds_documents (id),
+        FOREIGN KEY (location_id) REFERENCES locations (id)
+    );
+    CREATE INDEX idx_product_name ON sds_documents(product_name);
+    CREATE INDEX idx_location ON sds_documents(location_id);
+    CREATE INDEX idx_cas_number ON sds_documents(cas_number);
+    CREATE INDEX idx_file_hash ON sds_documents(file_hash);
+    -- Built without id before keyset paging
+    CREATE INDEX idx_locations_state_city ON locations(state, city);
+'''
+
+
+def build_unversioned(path, assistant):
+    """A database in the pre-versioning schema holding the first DOCUMENTS corpus documents"""
+    conn = sqlite3.connect(path)
+    conn.executescript(UNVERSIONED_SCHEMA)
+    for index in range(DOCUMENTS):
+        document = generate_document(index)
+        info = assistant.extract_chemical_info(document["text"])
+        name = f"sds_{index:06d}.txt"
+        document_id = conn.execute('''
+            INSERT INTO sds_documents (filename, original_filename, file_hash, product_name, manufacturer,
+                                       cas_number, full_text, location_id, file_size, uploaded_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (name, name, f"test-{index}", info["product_name"], info["manufacturer"], info["cas_number"],
+              document["text"], document["location_id"], len(document["text"]), "tests")).lastrowid
+        hazards = info["hazards"]
+        conn.execute('''
+            INSERT INTO chemical_hazards (document_id, product_name, cas_number, nfpa_health, nfpa_fire,
+                                          nfpa_reactivity, first_aid, fire_fighting, handling_storage, exposure_controls)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (document_id, info["product_name"], info["cas_number"], hazards["health"], hazards["fire"],
+              hazards["reactivity"], hazards["first_aid"], hazards["fire_fighting"], hazards["handling_storage"],
+              hazards["exposure_controls"]))
+    conn.commit()
+    conn.close()
+
+
+def snapshot(path):
+    """What the backfilled indexes hold, in a form two databases can be compared by"""
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            "user_version": conn.execute('PRAGMA user_version').fetchone()[0],
+            # sds_fts is an external-content table: its docsize table counts the rows actually indexed
+            "fts_rows": conn.execute('SELECT COUNT(*) FROM sds_fts_docsize').fetchone()[0],
+            "fts_matches": [row[0] for row in conn.execute(
+                "SELECT rowid FROM sds_fts WHERE sds_fts MATCH 'acetone OR corrosive' ORDER BY rowid")],
+            "ghs_links": conn.execute('SELECT COUNT(*) FROM document_ghs_codes').fetchone()[0],
+            "ghs_codes": sorted(conn.execute('''
+                SELECT g.code, d.document_id, d.location_id
+                FROM document_ghs_codes d JOIN ghs_codes g ON g.id = d.code_id
+            ''').fetchall()),
+            "signal_words": conn.execute(
+                'SELECT document_id, ghs_signal_word, ghs_pictograms FROM chemical_hazards ORDER BY document_id').fetchall(),
+            "pending_backfills": conn.execute('SELECT COUNT(*) FROM schema_backfills').fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="module")
+def fresh_build(tmp_path_factory, app_module):
+    """The same documents uploaded into a database created at the latest version"""
+    path = str(tmp_path_factory.mktemp("fresh") / "sds.db")
+    assistant = app_module.SDSAssistant(path)
+    for index in range(DOCUMENTS):
+        store(assistant, generate_document(index))
+    return snapshot(path)
+
+
+@pytest.fixture
+def fast_backfills(monkeypatch, app_module):
+    monkeypatch.setattr(app_module, "MIGRATION_BATCH_SIZE", 7)
+    monkeypatch.setattr(app_module, "MIGRATION_BATCH_PAUSE", 0)
+
+
+def test_unversioned_database_upgrades_in_place(tmp_path, app_module, assistant, fresh_build, fast_backfills):
+    path = str(tmp_path / "sds.db")
+    build_unversioned(path, assistant)
+
+    app_module.SDSAssistant(path)
+
+    upgraded = snapshot(path)
+    assert upgraded["user_version"] == len(assistant.migrations())
+    assert upgraded["fts_rows"] == DOCUMENTS
+    assert upgraded["ghs_links"] > 0
+    assert upgraded == fresh_build
+
+
+def test_outdated_index_is_rebuilt(tmp_path, app_module, assistant, fast_backfills):
+    path = str(tmp_path / "sds.db")
+    build_unversioned(path, assistant)
+    app_module.SDSAssistant(path)
+
+    conn = sqlite3.connect(path)
+    columns = [row[0] for row in conn.execute("SELECT name FROM pragma_index_info('idx_locations_state_city') ORDER BY seqno")]
+    conn.close()
+    assert columns == ["state", "city", "department", "id", "country"]
+
+
+def test_interrupted_backfill_resumes(tmp_path, monkeypatch, app_module, assistant, fresh_build, fast_backfills):
+    path = str(tmp_path / "sds.db")
+    build_unversioned(path, assistant)
+
+    write_batch = app_module.SDSAssistant.backfill_ghs_index
+    written = []
+
+    def fail_on_third_batch(self, cursor, classified):
+        if len(written) == 2:
+            raise RuntimeError("worker killed")
+        write_batch(self, cursor, classified)
+        written.append([document_id for document_id, _, _ in classified])
+
+    monkeypatch.setattr(app_module.SDSAssistant, "backfill_ghs_index", fail_on_third_batch)
+    with pytest.raises(RuntimeError):
+        app_module.SDSAssistant(path)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(assistant.migrations())
+    assert conn.execute('SELECT name, last_id, end_id FROM schema_backfills').fetchall() == [("ghs_codes", 14, DOCUMENTS)]
+    # The two committed batches are in the index, the failed one was rolled back
+    indexed = {row[0] for row in conn.execute('SELECT DISTINCT document_id FROM document_ghs_codes')}
+    assert indexed == {document_id for _, document_id, _ in fresh_build["ghs_codes"] if document_id <= 14}
+    conn.close()
+
+    monkeypatch.setattr(app_module.SDSAssistant, "backfill_ghs_index", write_batch)
+    read_batch = app_module.SDSAssistant.classify_ghs_batch
+    resumed_from = []
+
+    def record_reads(self, conn, after_id, end_id):
+        resumed_from.append(after_id)
+        return read_batch(self, conn, after_id, end_id)
+
+    monkeypatch.setattr(app_module.SDSAssistant, "classify_ghs_batch", record_reads)
+    app_module.SDSAssistant(path)
+
+    assert resumed_from[0] == 14
+    assert snapshot(path) == fresh_build
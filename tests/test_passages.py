@@ -0,0 +1,45 @@
+"""Lean candidate rows: the section a question reads, other passages fetched afterwards."""
+import sqlite3
+
+
+def stored_sections(assistant, document_ids):
+    conn = sqlite3.connect(assistant.db_path)
+    try:
+        rows = conn.execute(f'''
+            SELECT document_id, first_aid, fire_fighting, handling_storage, exposure_controls
+            FROM chemical_hazards WHERE document_id IN ({", ".join("?" for _ in document_ids)})
+        ''', document_ids).fetchall()
+        return {row[0]: row[1:] for row in rows}
+    finally:
+        conn.close()
+
+
+def test_search_rows_carry_only_the_section_the_question_reads(assistant, corpus):
+    rows = assistant.search_documents("First aid measures")
+    assert rows
+    sections = stored_sections(assistant, [row[0] for row in rows])
+    for row in rows:
+        assert row[2] is None
+        assert row[4] == sections[row[0]][0]
+        assert row[5] is row[6] is row[7] is None
+
+
+def test_passages_for_another_question_type(assistant, corpus):
+    # A follow-up reuses rows found for a first aid question to answer one about storage
+    rows = assistant.search_documents("First aid measures")
+    completed = assistant.with_passages(rows, ["handling"])
+    sections = stored_sections(assistant, [row[0] for row in rows])
+    for row, doc in zip(rows, completed):
+        assert doc[:2] == row[:2] and doc[4] == row[4]
+        assert doc[6] == sections[doc[0]][2]
+        # Full text only where there is no stored section to answer from
+        assert (doc[2] is None) == bool(doc[6])
+
+
+def test_general_question_answered_without_streaming(client, corpus):
+    document = next(iter(corpus.values()))
+    response = client.post("/api/ask-question", json={"question": document["product_name"]})
+    assert response.status_code == 200
+    answer = response.get_json()
+    assert answer["success"] is True
+    assert document["product_name"] in [source["product_name"] for source in answer["sources"]]
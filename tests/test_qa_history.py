@@ -0,0 +1,118 @@
+"""Q&A history rollup into daily stats, and pruning with an archive."""
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def history(tmp_path, app_module):
+    """An assistant on its own database, with 30 expired and 5 recent Q&A history rows"""
+    assistant = app_module.SDSAssistant(str(tmp_path / "sds.db"))
+    conn = sqlite3.connect(assistant.db_path)
+    products = ("acetone", "methanol", "toluene")
+    rows = [(f"First aid for {products[i % 3]}?", "Rinse.", None, 7, "session", 0.6, f"-{200 - i} days") for i in range(30)]
+    rows += [("Storage of acids", "Cool place.", None, None, "session", 0.3, "-1 days")] * 5
+    conn.executemany('''
+        INSERT INTO qa_history (question, answer, document_id, location_id, user_session, confidence_score, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))
+    ''', rows)
+    conn.commit()
+    conn.close()
+    return assistant
+
+
+def read_archive(directory):
+    rows = []
+    for path in sorted(directory.glob("qa_history-*.jsonl.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            rows.extend(json.loads(line) for line in archive)
+    return rows
+
+
+def remaining_ids(assistant):
+    conn = sqlite3.connect(assistant.db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT id FROM qa_history ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_rollup_counts_questions_per_day_key_and_location(history):
+    assert history.rollup_questions(batch_size=8) == 35
+    assert history.rollup_questions() == 0
+
+    conn = sqlite3.connect(history.db_path)
+    totals = dict(conn.execute('SELECT question_key, SUM(question_count) FROM qa_daily_stats GROUP BY question_key'))
+    conn.close()
+    assert totals == {"acetone aid first": 10, "aid first methanol": 10, "aid first toluene": 10, "acid storage": 5}
+
+
+def test_only_rolled_up_rows_are_pruned(history, tmp_path):
+    assert history.prune_questions(90) == 0
+    history.rollup_questions()
+    assert history.prune_questions(90, batch_size=4) == 30
+    assert remaining_ids(history) == list(range(31, 36))
+
+
+def test_pruned_rows_are_archived_once(history, tmp_path, monkeypatch, app_module):
+    archive_dir = tmp_path / "archive"
+    history.rollup_questions()
+
+    # Another process holds the write lock: the first batch is archived but its delete fails
+    monkeypatch.setattr(app_module, "DB_BUSY_TIMEOUT_MS", 50)
+    blocker = sqlite3.connect(history.db_path)
+    blocker.execute('BEGIN IMMEDIATE')
+    with pytest.raises(sqlite3.OperationalError):
+        history.prune_questions(90, str(archive_dir), batch_size=20)
+    blocker.rollback()
+    blocker.close()
+    assert [row["id"] for row in read_archive(archive_dir)] == list(range(1, 21))
+    assert len(remaining_ids(history)) == 35
+
+    assert history.prune_questions(90, str(archive_dir), batch_size=20) == 30
+    archived = read_archive(archive_dir)
+    assert [row["id"] for row in archived] == list(range(1, 31))
+    assert archived[0]["question"] == "First aid for acetone?"
+    assert remaining_ids(history) == list(range(31, 36))
+
+
+
+@pytest.mark.parametrize("first, second", [
+    ("What is the first aid for acetone?", "first aid acetone"),
+    ("Storage of solvents", "STORAGE SOLVENT?"),
+    ("How do I handle acids", "handle acid"),
+])
+def test_question_key_groups_variants(app_module, first, second):
+    assert app_module.question_key(first) == app_module.question_key(second)
+
+
+def test_question_key_keeps_distinct_questions_apart(app_module):
+    assert app_module.question_key("glass storage") == "glass storage"
+    assert app_module.question_key("first aid acetone") != app_module.question_key("first aid methanol")
+    # Nothing but stopwords: the question itself, normalized
+    assert app_module.question_key("  What is it?  ") == "what is it?"
+
+
+@pytest.mark.parametrize("rolled_up", [False, True])
+def test_dashboard_counts_the_last_seven_calendar_days(app_module, tmp_path, rolled_up):
+    assistant = app_module.SDSAssistant(str(tmp_path / "sds.db"))
+    conn = sqlite3.connect(assistant.db_path)
+    conn.executemany('''
+        INSERT INTO qa_history (question, answer, user_session, confidence_score, created_at)
+        VALUES (?, '', 'session', 0.5, ?)
+    ''', [
+        # The eighth day back, however late, is outside the window
+        ("First aid for acetone", conn.execute("SELECT date('now', '-7 days') || ' 23:59:59'").fetchone()[0]),
+        ("Storage of acids", conn.execute("SELECT date('now', '-6 days') || ' 00:00:00'").fetchone()[0]),
+        ("Storage of acids", conn.execute("SELECT datetime('now')").fetchone()[0]),
+    ])
+    conn.commit()
+    conn.close()
+    if rolled_up:
+        assert assistant.rollup_questions() == 3
+
+    stats = assistant.query_dashboard_stats()
+    assert stats["recent_questions"] == 2
+    assert stats["popular_questions"] == [{"question": "Storage of acids", "count": 2}]
@@ -0,0 +1,46 @@
+"""Answer sentence scoring: extract_relevant_text over a SentenceIndex."""
+
+
+def test_extract_relevant_text_picks_the_best_window(assistant):
+    text = ("This product is supplied as a clear liquid in drums. "
+            "Eye contact: rinse cautiously with water for several minutes. "
+            "Store the drums in a cool and well ventilated place. "
+            "Keep away from heat, sparks and open flames at all times")
+    answer = assistant.extract_relevant_text("How do I rinse eye contact?", text)
+    assert "rinse cautiously" in answer
+    assert answer.startswith("This product")
+
+
+def test_extract_relevant_text_with_whitespace_around_the_best_sentence(assistant):
+    # The original loop raised ValueError here: it looked up the stripped sentence in the unstripped list
+    text = ("Section four describes the first aid measures.\n\n   Ingestion: rinse mouth and do not induce vomiting   .\n"
+            "  Call a poison center or doctor if you feel unwell after swallowing  .")
+    answer = assistant.extract_relevant_text("ingestion vomiting", text)
+    assert "do not induce vomiting" in answer
+
+
+def test_extract_relevant_text_without_a_match(assistant):
+    assert assistant.extract_relevant_text("ingestion", "Nothing relevant is written in this sentence at all.") == ""
+    assert assistant.extract_relevant_text("ingestion", "") == ""
+    assert assistant.extract_relevant_text("what is it", "Only stopwords and short words are asked about here.") == ""
+
+
+def test_extract_relevant_text_truncates(assistant):
+    text = "Ventilation " + "is required in every enclosed space " * 40 + "."
+    answer = assistant.extract_relevant_text("ventilation", text, max_length=100)
+    assert len(answer) == 103 and answer.endswith("...")
+
+
+def test_sentence_index_short_sentences_never_win(app_module):
+    index = app_module.SentenceIndex("Acetone. Acetone is a flammable solvent used for cleaning parts.")
+    (score, window), = index.windows(["acetone"], 1)
+    assert score > 0
+    assert "flammable solvent" in window
+
+
+def test_sentence_index_windows_do_not_overlap(app_module):
+    sentences = [f"Sentence number {i} talks about storage of the drums" if i in (2, 3, 9) else
+                 f"Sentence number {i} is filler without the keyword in it" for i in range(12)]
+    windows = app_module.SentenceIndex(". ".join(sentences)).windows(["storage"], 3)
+    assert len(windows) == 2
+    assert "number 2 talks" in windows[0][1] and "number 9 talks" in windows[1][1]
@@ -0,0 +1,96 @@
+"""Follow-up questions answered from the documents the session last retrieved."""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def searches(monkeypatch, assistant, corpus):
+    """Questions that went to a fresh search, in order"""
+    search = type(assistant).search_documents
+    asked = []
+
+    def recording_search(self, question, location_id=None):
+        asked.append(question)
+        return search(self, question, location_id)
+
+    monkeypatch.setattr(type(assistant), "search_documents", recording_search)
+    return asked
+
+
+def ask_in_session(assistant, user_session, questions):
+    return [assistant.find_documents(question, None, user_session) for question in questions]
+
+
+@pytest.mark.parametrize("follow_up", [
+    "first aid?",
+    "Storage?",
+    "PPE?",
+    "what about storage",
+    "And the fire fighting measures?",
+    "is it flammable?",
+    "how should those be handled",
+    "what is it?",
+])
+def test_follow_ups_reuse_the_context(assistant, searches, follow_up):
+    first, again = ask_in_session(assistant, f"follow-up {follow_up}", ["Ethanol", follow_up])
+    assert searches == ["Ethanol"]
+    assert again == first
+
+
+@pytest.mark.parametrize("question", [
+    "which chemicals are flammable?",
+    "fire hazards?",
+    "first aid for acetone",
+    "Acetone",
+    "Corrosive materials storage",
+])
+def test_standalone_questions_search_again(assistant, searches, question):
+    ask_in_session(assistant, f"standalone {question}", ["Ethanol", question])
+    assert searches == ["Ethanol", question]
+
+
+def test_follow_up_naming_a_listed_product_narrows_to_it(assistant, searches):
+    context = assistant.find_documents("Danger", None, "narrowing")
+    names = [doc[1] for doc in context]
+    # A chemical named in the context, but not by every document in it
+    chemical = next(word for name in names for word in name.split()[1:-1]
+                    if len(word) > 3 and not all(word in other.split() for other in names))
+
+    narrowed = assistant.find_documents(f"what about the {chemical}?", None, "narrowing")
+    assert searches == ["Danger"]
+    assert narrowed == [doc for doc in context if chemical in doc[1].split()]
+
+
+def test_follow_up_naming_another_product_searches(assistant, searches):
+    ask_in_session(assistant, "another product", ["Ethanol", "and what about Glycerin?"])
+    assert searches == ["Ethanol", "and what about Glycerin?"]
+
+
+def test_context_is_per_location_filter(assistant, searches):
+    assistant.find_documents("Ethanol", None, "locations")
+    assistant.find_documents("first aid?", 5, "locations")
+    assert searches == ["Ethanol", "first aid?"]
+
+
+def test_context_expires_by_age_even_when_used(app_module):
+    context = app_module.SessionContext(max_sessions=10, idle_seconds=60, max_age_seconds=0.2)
+    context.put("session", None, ["document"])
+    for _ in range(3):
+        assert context.get("session", None) == ["document"]
+        time.sleep(0.05)
+    time.sleep(0.1)
+    assert context.get("session", None) is None
+
+
+def test_context_evicts_idle_and_least_recently_used_sessions(app_module):
+    context = app_module.SessionContext(max_sessions=2, idle_seconds=0.1, max_age_seconds=60)
+    context.put("a", None, [1])
+    context.put("b", None, [2])
+    assert context.get("a", None) == [1]
+    context.put("c", None, [3])
+    assert context.get("b", None) is None
+    assert len(context) == 2
+    time.sleep(0.15)
+    assert context.get("a", None) is None
+    assert len(context) == 0
@@ -0,0 +1,70 @@
+"""Generated stickers: stored once per distinct sticker."""
+import pytest
+
+from conftest import store
+from corpus import generate_document
+
+
+@pytest.fixture
+def scratch(app_module, tmp_path):
+    """A database holding one document, and its product name"""
+    assistant = app_module.SDSAssistant(str(tmp_path / "sds.db"))
+    store(assistant, generate_document(0))
+    conn = assistant.connect()
+    product_name = conn.execute('SELECT product_name FROM sds_documents').fetchone()[0]
+    conn.close()
+    return assistant, product_name
+
+
+def sticker_rows(assistant):
+    conn = assistant.connect()
+    try:
+        return conn.execute('SELECT filename, sticker_type FROM stickers ORDER BY filename').fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("generate", ["generate_nfpa_sticker", "generate_ghs_sticker"])
+def test_generating_a_sticker_again_reuses_the_stored_one(scratch, generate):
+    assistant, product_name = scratch
+    first = getattr(assistant, generate)(product_name)
+    second = getattr(assistant, generate)(product_name)
+    assert first["success"] and second["success"]
+    assert first["filename"] == second["filename"]
+    assert sticker_rows(assistant) == [(first["filename"], first["sticker_type"])]
+    assert assistant.get_sticker(first["filename"]).startswith("<?xml")
+
+
+def test_changed_ratings_make_a_new_sticker(scratch):
+    assistant, product_name = scratch
+    before = assistant.generate_nfpa_sticker(product_name)
+    conn = assistant.connect()
+    conn.execute('UPDATE chemical_hazards SET nfpa_health = (nfpa_health + 1) % 5')
+    conn.commit()
+    conn.close()
+    after = assistant.generate_nfpa_sticker(product_name)
+    assert before["filename"] != after["filename"]
+    assert len(sticker_rows(assistant)) == 2
+
+
+def test_upgrade_removes_duplicate_stickers(app_module, tmp_path):
+    path = str(tmp_path / "sds.db")
+    assistant = app_module.SDSAssistant(path)
+    conn = assistant.connect()
+    # Before stickers were named by content, each generation stored another copy
+    conn.executemany('INSERT INTO stickers (filename, sticker_type, content) VALUES (?, ?, ?)', [
+        ("nfpa_Acetone_20240101_120000.svg", "NFPA", "<svg>acetone</svg>"),
+        ("nfpa_Acetone_20240102_120000.svg", "NFPA", "<svg>acetone</svg>"),
+        ("ghs_Acetone_20240102_120000.svg", "GHS", "<svg>acetone</svg>"),
+        ("nfpa_Toluene_20240103_120000.svg", "NFPA", "<svg>toluene</svg>"),
+    ])
+    conn.execute('PRAGMA user_version = 6')
+    conn.commit()
+    conn.close()
+
+    upgraded = app_module.SDSAssistant(path)
+    assert sticker_rows(upgraded) == [
+        ("ghs_Acetone_20240102_120000.svg", "GHS"),
+        ("nfpa_Acetone_20240102_120000.svg", "NFPA"),
+        ("nfpa_Toluene_20240103_120000.svg", "NFPA"),
+    ]
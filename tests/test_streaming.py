@@ -0,0 +1,38 @@
+"""Streamed answers: NDJSON events from /api/ask-question."""
+import json
+
+
+def read_events(response):
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_streamed_answer_event_order(client, corpus, app_module):
+    response = client.post("/api/ask-question", json={"question": "First aid measures", "stream": True})
+    events = read_events(response)
+    types = [event["type"] for event in events]
+
+    assert types[0] == "candidates"
+    assert types[-1] == "done"
+    assert set(types[1:-1]) == {"part"}
+    assert 1 <= types.count("part") <= app_module.ANSWER_PARTS_SHOWN
+    assert events[0]["count"] == app_module.SEARCH_RESULT_LIMIT
+
+    done = events[-1]
+    assert done["success"] is True
+    assert [event["source"] for event in events[1:-1]] == done["sources"]
+    assert all(event["text"] in done["answer"] for event in events[1:-1])
+
+
+def test_streamed_answer_matches_the_json_answer(client, corpus):
+    question = {"question": "First aid measures"}
+    streamed = read_events(client.post("/api/ask-question", json=dict(question, stream=True)))[-1]
+    answered = client.post("/api/ask-question", json=question).get_json()
+    assert {key: streamed[key] for key in answered} == answered
+
+
+def test_streamed_answer_without_documents(client, corpus):
+    events = read_events(client.post("/api/ask-question", json={"question": "zzzz-no-such-product", "stream": True},
+                                     headers={"Accept": "application/x-ndjson"}))
+    assert [event["type"] for event in events] == ["done"]
+    assert events[0]["success"] is False
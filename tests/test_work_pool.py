@@ -0,0 +1,161 @@
+"""BlockingWorkPool: per-category concurrency limits."""
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for the work pool")
+        time.sleep(0.005)
+
+
+class Probe:
+    """Blocking work that records how many calls run at once"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running = 0
+        self.peak = 0
+
+    def __call__(self):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            self.release.wait(5)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def start_calls(pool, category, fn, count):
+    threads = [threading.Thread(target=pool.run, args=(category, fn)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_calls_beyond_the_limit_wait_for_a_slot(app_module):
+    pool = app_module.BlockingWorkPool({"db": 2, "cpu": 1})
+    probe = Probe()
+    threads = start_calls(pool, "db", probe, 6)
+
+    wait_until(lambda: pool.waiting["db"] == 4 and pool.in_flight["db"] == 2)
+    assert probe.running == 2
+
+    probe.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert probe.peak == 2
+    assert pool.waiting["db"] == pool.in_flight["db"] == 0
+
+
+def test_categories_are_bounded_independently(app_module):
+    pool = app_module.BlockingWorkPool({"db": 1, "cpu": 1})
+    probe = Probe()
+    threads = start_calls(pool, "db", probe, 2)
+    wait_until(lambda: pool.in_flight["db"] == 1 and pool.waiting["db"] == 1)
+
+    # A full db category does not hold up cpu work
+    assert pool.run("cpu", lambda: "done") == "done"
+
+    probe.release.set()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_slot_is_released_when_the_call_raises(app_module):
+    pool = app_module.BlockingWorkPool({"db": 1})
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        pool.run("db", fail)
+    assert pool.in_flight["db"] == 0
+    assert pool.run("db", lambda: 42) == 42
+
+
+def test_nested_call_in_the_same_category_does_not_deadlock(app_module):
+    pool = app_module.BlockingWorkPool({"db": 1})
+    assert pool.run("db", lambda: pool.run("db", lambda: "inner")) == "inner"
+
+
+def test_nested_call_in_another_category_is_refused(app_module):
+    pool = app_module.BlockingWorkPool({"db": 1, "cpu": 1})
+    with pytest.raises(RuntimeError, match="db work called from cpu work"):
+        pool.run("cpu", lambda: pool.run("db", lambda: "read"))
+    assert pool.in_flight == {"db": 0, "cpu": 0}
+    assert pool.run("db", lambda: "read") == "read"
+
+
+# Run in a child process: monkey-patching pytest's own process would change every other test
+MONKEY_PATCHED = textwrap.dedent("""
+    import eventlet
+    eventlet.monkey_patch()
+    import sys
+    sys.path[:0] = sys.argv[1:4]
+
+    from eventlet import patcher
+    import app
+    from conftest import store
+    from corpus import generate_document
+
+    native_sleep = patcher.original('time').sleep
+
+    # A green thread waiting for a slot is woken when the native call holding it returns
+    pool = app.BlockingWorkPool({"db": 1, "cpu": 1})
+    assert pool.offloading()
+    holder = eventlet.spawn(pool.run, "db", native_sleep, 0.2)
+    eventlet.sleep(0.05)
+    waiter = eventlet.spawn(pool.run, "db", lambda: "second")
+    eventlet.sleep(0.05)
+    assert pool.waiting["db"] == 1
+
+    # Work in one category must not wait for another category's slot from its native thread
+    try:
+        pool.run("cpu", lambda: pool.run("db", lambda: "nested"))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("nested call in another category ran")
+
+    with eventlet.Timeout(5):
+        holder.wait()
+        assert waiter.wait() == "second"
+    assert pool.waiting == pool.in_flight == {"db": 0, "cpu": 0}, (pool.waiting, pool.in_flight)
+
+    # Answers read full text (db) and score passages (cpu) as separate steps, with one slot each
+    assistant = app.SDSAssistant("sds.db")
+    documents = [generate_document(index) for index in range(6)]
+    for document in documents:
+        store(assistant, document)
+    questions = [document["product_name"] for document in documents]
+    with eventlet.Timeout(20):
+        answers = [eventlet.spawn(assistant.answer_question, question) for question in questions * 3]
+        answers = [answer.wait() for answer in answers]
+    assert all(answer["success"] and answer["sources"] for answer in answers), answers
+    assert app.work_pool.waiting == app.work_pool.in_flight == {"db": 0, "cpu": 0}
+    print("ok")
+""")
+
+
+def test_slots_under_eventlet_monkey_patching(tmp_path):
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, SDS_DB_CONCURRENCY="1", SDS_CPU_CONCURRENCY="1", SDS_QA_LOG_QUEUE="0",
+               SDS_RETRIEVAL="like", SDS_OFFLOAD="1")
+    result = subprocess.run(
+        [sys.executable, "-c", MONKEY_PATCHED, os.path.dirname(tests_dir), tests_dir,
+         os.path.join(os.path.dirname(tests_dir), "benchmarks")],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr[-3000:]
+    assert result.stdout.splitlines()[-1] == "ok"